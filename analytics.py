@@ -0,0 +1,210 @@
+import os
+
+import numpy as np
+
+POSITION_COUNT = 4
+LEVELS = (1, 2, 3)
+
+########################################
+# Columnar round data
+########################################
+class RoundForces:
+    """One round's hits as columnar arrays, oldest hit first.
+
+    elapsed   float64 seconds since the first hit
+    positions int32 array of shape (hits, 4), the force at each body position
+    max_force int32 strongest position force per hit
+    level     int8 force level per hit (0 when unknown)
+    reed      bool per hit, True while the reed sensor was triggered"""
+    def __init__(self, elapsed, positions, max_force, level, reed):
+        self.elapsed = elapsed
+        self.positions = positions
+        self.max_force = max_force
+        self.level = level
+        self.reed = reed
+
+    def __len__(self):
+        return len(self.max_force)
+
+def parse_max_force(max_force_str):
+    """Split a stored "250 [ ระดับ 2 ]" display string into (250, 2)."""
+    value, _, rest = (max_force_str or "").partition(" ")
+    digits = "".join(ch for ch in rest if ch.isdigit())
+    try:
+        return int(value), int(digits) if digits else 0
+    except ValueError:
+        return 0, 0
+
+def load_round_forces(rows, channels):
+    """Build RoundForces from (timestamp, reed value, channel values, max force, level) rows in any order.
+
+    `channels` gives the channel index feeding each body position (None when
+    the position is unmapped); the position columns are gathered in one step."""
+    rows = list(rows)
+    if not rows:
+        return RoundForces(np.zeros(0), np.zeros((0, POSITION_COUNT), dtype=np.int32),
+                           np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=bool))
+
+    timestamps, reed, values, max_force, level = zip(*rows)
+    times = np.array(timestamps, dtype='datetime64[s]')
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    # Missing channel readings (NULL) count as no force
+    values = np.array([[v or 0 for v in row] for row in values], dtype=np.int32)[order]
+
+    positions = np.zeros((len(rows), POSITION_COUNT), dtype=np.int32)
+    for index, channel in enumerate(list(channels)[:POSITION_COUNT]):
+        if channel is not None:
+            positions[:, index] = values[:, channel]
+
+    return RoundForces(
+        (times - times[0]).astype(np.float64),
+        positions,
+        np.array(max_force, dtype=np.int32)[order],
+        np.array([lv or 0 for lv in level], dtype=np.int8)[order],
+        np.array([bool(r) for r in reed], dtype=bool)[order]
+    )
+
+########################################
+# Summaries
+########################################
+def _fatigue_trend(elapsed, max_force):
+    """Least-squares slope of max force over time, plus last-third vs first-third mean."""
+    if len(max_force) < 3 or elapsed[-1] <= 0:
+        return {'slope_per_minute': None, 'late_vs_early_ratio': None}
+    slope = np.polyfit(elapsed / 60.0, max_force.astype(np.float64), 1)[0]
+    third = len(max_force) // 3
+    early = max_force[:third].mean()
+    late = max_force[-third:].mean()
+    return {
+        'slope_per_minute': round(float(slope), 2),
+        'late_vs_early_ratio': round(float(late / early), 3) if early else None
+    }
+
+def _per_minute(elapsed, max_force):
+    """Hit count and mean max force for every elapsed minute of the round."""
+    minute = (elapsed // 60).astype(np.int64)
+    counts = np.bincount(minute)
+    sums = np.bincount(minute, weights=max_force)
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    return [{'minute': i, 'hits': int(c), 'mean_force': round(float(m), 1)}
+            for i, (c, m) in enumerate(zip(counts, means))]
+
+def summarize_round(data, labels, duration_seconds=None, percentiles=(50, 90)):
+    """Aggregate a RoundForces into a JSON-serializable dict.
+
+    `duration_seconds` is the round's own length (start to stop); when it is
+    unknown the span between the first and last hit is used for the rate."""
+    count = len(data)
+    summary = {'hit_count': count, 'positions': [], 'levels': {str(level): 0 for level in LEVELS}}
+    if count == 0:
+        summary.update({'duration_seconds': duration_seconds or 0, 'punches_per_minute': 0.0,
+                        'mean_force': None, 'peak_force': None, 'fatigue': _fatigue_trend(data.elapsed, data.max_force),
+                        'per_minute': []})
+        return summary
+
+    span = float(data.elapsed[-1])
+    duration = duration_seconds if duration_seconds else span
+    summary['duration_seconds'] = round(duration, 1)
+    summary['punches_per_minute'] = round(count / (duration / 60.0), 2) if duration > 0 else float(count)
+    summary['mean_force'] = round(float(data.max_force.mean()), 1)
+    summary['peak_force'] = int(data.max_force.max())
+
+    level_counts = np.bincount(data.level, minlength=max(LEVELS) + 1)
+    summary['levels'] = {str(level): int(level_counts[level]) for level in LEVELS}
+
+    # A hit belongs to the position that carried its max force; as in classify_hit the
+    # first position cannot carry it while the reed sensor is triggered
+    candidates = data.positions.copy()
+    candidates[data.reed, 0] = -1
+    struck = np.argmax(candidates, axis=1)
+    for index in range(POSITION_COUNT):
+        forces = data.positions[struck == index, index]
+        entry = {'label': labels[index] if index < len(labels) else str(index + 1), 'hits': int(len(forces))}
+        if len(forces):
+            entry['mean'] = round(float(forces.mean()), 1)
+            entry['peak'] = int(forces.max())
+            for p, value in zip(percentiles, np.percentile(forces, percentiles)):
+                entry[f'p{p}'] = round(float(value), 1)
+        summary['positions'].append(entry)
+
+    summary['fatigue'] = _fatigue_trend(data.elapsed, data.max_force)
+    summary['per_minute'] = _per_minute(data.elapsed, data.max_force)
+    return summary
+
+########################################
+# Raw waveforms
+########################################
+def samples_from_bytes(buffer, channels):
+    """View little-endian int16 sample rows (one column per channel) without copying."""
+    return np.frombuffer(buffer, dtype='<i2').reshape(-1, channels)
+
+def load_waveform(path, channels):
+    """Memory-map an append-only capture file as an int16 array of shape (samples, channels)."""
+    size = os.path.getsize(path) // (2 * channels) * channels
+    if size == 0:
+        return np.zeros((0, channels), dtype='<i2')
+    return np.memmap(path, dtype='<i2', mode='r', shape=(size // channels, channels))
+
+def minmax_downsample(samples, bucket):
+    """Per-bucket (min, max) of each channel, so spikes survive a `bucket`-fold reduction.
+
+    A trailing partial bucket is kept. Returns two int arrays of shape (buckets, channels)."""
+    count = len(samples)
+    if count == 0:
+        empty = np.zeros((0, samples.shape[1]), dtype=np.int16)
+        return empty, empty
+    bucket = max(1, int(bucket))
+    full = count - count % bucket
+    mins, maxs = [], []
+    if full:
+        blocks = np.asarray(samples[:full]).reshape(-1, bucket, samples.shape[1])
+        mins.append(blocks.min(axis=1))
+        maxs.append(blocks.max(axis=1))
+    if full < count:
+        tail = np.asarray(samples[full:])
+        mins.append(tail.min(axis=0, keepdims=True))
+        maxs.append(tail.max(axis=0, keepdims=True))
+    return np.concatenate(mins), np.concatenate(maxs)
+
+class PeakDetector:
+    """Streaming hit detection over raw samples.
+
+    The envelope is the largest mapped position force of each sample (the first
+    position is ignored while the reed switch is set, as for summarized hits).
+    A hit starts when it reaches `threshold` and ends when it falls below
+    `threshold * release_ratio`; the sample with the highest envelope in
+    between is reported. State carries across batches."""
+    def __init__(self, channels, threshold, release_ratio=0.5):
+        self.channels = [(index, channel) for index, channel in enumerate(channels) if channel is not None]
+        self.threshold = threshold
+        self.release = threshold * release_ratio
+        self.position = 0        # samples seen so far
+        self.in_hit = False
+        self.peak = None         # (envelope, sample index, channel values) of the current hit
+
+    def feed(self, samples, reed=0):
+        """Consume a (count, channels) batch; returns [(sample index, channel values)] of finished hits."""
+        count = len(samples)
+        start = self.position
+        self.position += count
+        columns = [channel for index, channel in self.channels if not (index == 0 and reed)]
+        if count == 0 or not columns:
+            return []
+        envelope = samples[:, columns].max(axis=1)
+        if not self.in_hit and envelope.max() < self.threshold:
+            return []
+
+        hits = []
+        for offset, level in enumerate(envelope.tolist()):
+            if not self.in_hit:
+                if level >= self.threshold:
+                    self.in_hit = True
+                    self.peak = (level, start + offset, tuple(samples[offset].tolist()))
+            elif level < self.release:
+                self.in_hit = False
+                hits.append(self.peak[1:])
+                self.peak = None
+            elif level > self.peak[0]:
+                self.peak = (level, start + offset, tuple(samples[offset].tolist()))
+        return hits
@@ -1,16 +1,36 @@
+import io
 import os
+import csv
+import gzip
+import shutil
 import time
+import base64
 import json
+import argparse
+import heapq
+import queue
+import bisect
+import struct
+import logging
+import itertools
+import importlib.util
+import pathlib
 import threading
+from collections import namedtuple, defaultdict, OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import click
 from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
-import paho.mqtt.client as mqtt
+# paho-mqtt and analytics (numpy) are imported where they are used, so web
+# workers and CLI commands that never touch them start faster
+
+MODULE_STARTED = time.perf_counter()  # start of the "module" boot phase, see Boot
 
 # Determine database type by checking if DATABASE_URL is set.
 USE_SQLITE = not bool(os.getenv("DATABASE_URL"))
 if USE_SQLITE:
     import sqlite3
-    DATABASE = 'sensor_data.db'
+    DATABASE = os.getenv("SQLITE_PATH", 'sensor_data.db')
 else:
     import psycopg2
     import psycopg2.extras
@@ -19,22 +39,327 @@ else:
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Change to a secure secret in production
 
-current_training_round_id = None  # Global flag: None means no round is active
-online_sensors = {}  # Global dictionary to track last message timestamp for each sensor.
+# Per-message and per-poll logs are DEBUG; production runs at the default WARNING level
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+                    format="%(asctime)s %(levelname)s [%(threadName)s] %(message)s")
+logger = logging.getLogger("espboxing")
+
+########################################
+# Metrics
+########################################
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SENSOR_RATE_WINDOW = 10.0  # seconds
+
+class StageTimer:
+    """Count, total, worst case and a latency histogram for one timed stage."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+class Metrics:
+    """Process-wide counters and stage timers.
+
+    Recording is a few integer updates under one lock so it can run on every
+    message from any thread; render() turns everything into Prometheus text
+    for /metrics."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)  # (name, (label pairs)) -> value
+        self.timers = {}                  # stage -> StageTimer
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += amount
+
+    def timer(self, stage):
+        timer = self.timers.get(stage)
+        if timer is None:
+            with self._lock:
+                timer = self.timers.setdefault(stage, StageTimer())
+        return timer
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timer(stage).add(time.perf_counter() - started)
+
+    def render(self, gauges=(), sensor_rates=None):
+        """Prometheus text exposition; `gauges` is a list of (metric prefix, stats dict) and
+        `sensor_rates` maps each online sensor to its (message count, messages per second)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            lines.append(f"# TYPE espboxing_{name} counter")
+            for (counter, labels), value in counters:
+                if counter == name:
+                    lines.append(f"espboxing_{name}{format_labels(labels)} {value}")
+
+        lines.append("# TYPE espboxing_stage_seconds histogram")
+        for stage, timer in timers:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, timer.buckets):
+                cumulative += count
+                lines.append(f'espboxing_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'espboxing_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {timer.count}')
+            lines.append(f'espboxing_stage_seconds_sum{{stage="{stage}"}} {timer.total:.6f}')
+            lines.append(f'espboxing_stage_seconds_count{{stage="{stage}"}} {timer.count}')
+
+        rates = sensor_rates or {}
+        lines.append("# TYPE espboxing_sensor_messages_total counter")
+        lines.extend(f"espboxing_sensor_messages_total{format_labels([('sensor_id', sensor_id)])} {total}"
+                     for sensor_id, (total, _) in sorted(rates.items()))
+        lines.append("# TYPE espboxing_sensor_message_rate gauge")
+        lines.extend(f"espboxing_sensor_message_rate{format_labels([('sensor_id', sensor_id)])} {rate:.3f}"
+                     for sensor_id, (_, rate) in sorted(rates.items()))
+
+        # Component stats mix counters and gauges, so they are exported untyped
+        for prefix, stats in gauges:
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float, list)):
+                    continue  # nested stage stats are exported as histograms, strings are not metrics
+                if isinstance(value, list):
+                    lines.extend(f'espboxing_{prefix}_{key}{{index="{i}"}} {v}' for i, v in enumerate(value))
+                else:
+                    lines.append(f"espboxing_{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+metrics = Metrics()
+
+########################################
+# Sensor Presence
+########################################
+PRESENCE_TIMEOUT = float(os.getenv("PRESENCE_TIMEOUT", "60"))  # seconds without a message before a sensor is offline
+PRESENCE_MAX_SENSORS = int(os.getenv("PRESENCE_MAX_SENSORS", "1000"))
+
+class SensorPresence:
+    """A sensor heard from recently: last message time, message rate and last decoded payload."""
+    def __init__(self, sensor_id, now):
+        self.sensor_id = sensor_id
+        self.first_seen = now
+        self.last_seen = now
+        self.messages = 0
+        self.window_start = now
+        self.window_count = 0
+        self.last_rate = None
+        self.last_payload = None  # SensorReading, or a dict when mirrored from the ingest process
+        self._text_second = None
+        self._text = None
+
+    def touch(self, now):
+        self.last_seen = max(self.last_seen, now)
+        self.messages += 1
+        if now - self.window_start >= SENSOR_RATE_WINDOW:
+            self.last_rate = self.window_count / (now - self.window_start)
+            self.window_start, self.window_count = now, 0
+        self.window_count += 1
+
+    def rate(self, now):
+        elapsed = now - self.window_start
+        # A finished window (or a sensor that went quiet) is measured up to now;
+        # until its first window closes a new sensor is measured over at least one second
+        if elapsed >= SENSOR_RATE_WINDOW or self.last_rate is None:
+            return self.window_count / max(elapsed, 1.0)
+        return self.last_rate
+
+    @property
+    def last_seen_text(self):
+        # Formatted at most once per second however often it is read
+        second = int(self.last_seen)
+        if second != self._text_second:
+            self._text = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+            self._text_second = second
+        return self._text
+
+    def payload_dict(self):
+        payload = self.last_payload
+        if payload is None or isinstance(payload, dict):
+            return payload
+        return {'reed': payload.reed, 'forces': dict(zip(FORCE_CHANNELS, payload.values)), 'critical': payload.critical}
+
+    def to_dict(self, now):
+        return {
+            'sensor_id': self.sensor_id,
+            'last_seen': self.last_seen_text,
+            'messages': self.messages,
+            'rate': round(self.rate(now), 3),
+            'last_payload': self.payload_dict()
+        }
+
+class PresenceTracker:
+    """Sensors heard from within `timeout` seconds, kept in last-seen order.
+
+    seen() moves a sensor to the end of an OrderedDict, so expiry only pops from
+    the front until it meets a sensor that is still online, and once
+    `max_sensors` are tracked the least recently seen one is evicted. A
+    background thread expires quiet sensors. `on_change(entry, online)` is
+    called outside the lock when a sensor comes online or goes offline."""
+    def __init__(self, timeout=60, max_sensors=1000):
+        self.timeout = timeout
+        self.max_sensors = max_sensors
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # sensor_id -> SensorPresence, least recently seen first
+        self._thread = None
+        self.on_change = None
+        self.expired = 0
+        self.evicted = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="presence", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(min(5.0, self.timeout / 4))
+            try:
+                self.expire(time.time())
+            except Exception as e:
+                logger.exception("Error expiring sensor presence: %s", e)
+
+    def seen(self, sensor_id, now):
+        """Record a message from a sensor; returns its entry so the caller can attach the payload."""
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            entry = self._entries.get(sensor_id)
+            came_online = entry is None
+            if came_online:
+                entry = self._entries[sensor_id] = SensorPresence(sensor_id, now)
+            else:
+                self._entries.move_to_end(sensor_id)
+            entry.touch(now)
+            gone = self._expire_locked(now)
+            while len(self._entries) > self.max_sensors:
+                gone.append(self._entries.popitem(last=False)[1])
+                self.evicted += 1
+        if came_online:
+            self._notify(entry, True)
+        for old in gone:
+            self._notify(old, False)
+        return entry
+
+    def restore(self, sensor_id, last_seen, messages, rate, last_payload):
+        """Mirror a sensor tracked by another process (split deployment) without reporting a transition."""
+        with self._lock:
+            entry = self._entries.get(sensor_id)
+            if entry is None:
+                entry = self._entries[sensor_id] = SensorPresence(sensor_id, last_seen)
+            self._entries.move_to_end(sensor_id)
+            entry.last_seen = last_seen
+            entry.messages = messages
+            entry.last_rate = rate
+            entry.window_start, entry.window_count = time.time(), 0
+            entry.last_payload = last_payload
+
+    def _expire_locked(self, now):
+        gone = []
+        cutoff = now - self.timeout
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.last_seen >= cutoff:
+                break
+            gone.append(self._entries.popitem(last=False)[1])
+            self.expired += 1
+        return gone
+
+    def expire(self, now):
+        with self._lock:
+            gone = self._expire_locked(now)
+        for entry in gone:
+            self._notify(entry, False)
+
+    def _notify(self, entry, online):
+        if self.on_change is not None:
+            try:
+                self.on_change(entry, online)
+            except Exception as e:
+                logger.warning("Error reporting presence of %s: %s", entry.sensor_id, e)
+
+    def online(self, now=None):
+        """Online sensors as dicts, most recently seen first."""
+        now = now or time.time()
+        self.expire(now)
+        with self._lock:
+            entries = list(self._entries.values())
+        return [entry.to_dict(now) for entry in reversed(entries)]
+
+    def changed_since(self, since):
+        """Entries with a message at or after `since`; walks back from the newest only."""
+        with self._lock:
+            changed = []
+            for entry in reversed(self._entries.values()):
+                if entry.last_seen < since:
+                    break
+                changed.append(entry)
+        return changed
+
+    def rates(self, now):
+        with self._lock:
+            entries = list(self._entries.values())
+        return {entry.sensor_id: (entry.messages, entry.rate(now)) for entry in entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'online': len(self._entries), 'max_sensors': self.max_sensors,
+                'expired': self.expired, 'evicted': self.evicted}
+
+presence = PresenceTracker(timeout=PRESENCE_TIMEOUT, max_sensors=PRESENCE_MAX_SENSORS)
 
 ########################################
 #  Database Connection Wrapper
 ########################################
+WRITE_STATEMENTS = {"INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "ALTER", "DROP"}
+
 class DBConnection:
-    def __init__(self, conn, use_sqlite):
+    def __init__(self, conn, use_sqlite, release=None, write_lock=None):
         self.conn = conn
         self.use_sqlite = use_sqlite
+        self.release = release
+        self.write_lock = write_lock  # SQLiteWriteLock; taken by the first write of a transaction
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        # Pooled connections go back to their pool instead of being closed
+        if self.release is not None:
+            self.release(self.conn)
+        else:
+            self.conn.close()
 
     def execute(self, query, params=None):
         if params is None:
@@ -44,38 +369,427 @@ class DBConnection:
             query = query.replace("?", "%s")
             cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         else:
+            if self.write_lock is not None and query.split(None, 1)[0].upper() in WRITE_STATEMENTS:
+                self.write_lock.acquire(self.conn)
             cur = self.conn.cursor()
         cur.execute(query, params)
         return cur
 
+    def stream(self, query, params=None, chunk_size=1000):
+        """Yield the result in lists of up to `chunk_size` rows without materializing all of it.
+
+        PostgreSQL uses a named (server-side) cursor so rows stay on the server
+        until fetched; SQLite steps its cursor with fetchmany."""
+        if params is None:
+            params = []
+        if self.use_sqlite:
+            cur = self.conn.cursor()
+            cur.execute(query, params)
+        else:
+            cur = self.conn.cursor(name=f"stream_{next(_stream_cursor_ids)}",
+                                   cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.itersize = chunk_size
+            cur.execute(query.replace("?", "%s"), params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+    def executemany(self, query, seq_of_params):
+        if not self.use_sqlite:
+            query = query.replace("?", "%s")
+        elif self.write_lock is not None:
+            self.write_lock.acquire(self.conn)
+        cur = self.conn.cursor()
+        cur.executemany(query, seq_of_params)
+        return cur
+
+    def insert_many(self, table, columns, rows):
+        """Insert rows in one round trip and return their new ids in insertion order."""
+        column_list = ", ".join(columns)
+        if self.use_sqlite:
+            if self.write_lock is not None:
+                self.write_lock.acquire(self.conn)
+            placeholders = ", ".join("?" * len(columns))
+            cur = self.conn.cursor()
+            cur.executemany(f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})", rows)
+            # Rows written in one transaction by a single writer get consecutive ids
+            last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+            return list(range(last_id - len(rows) + 1, last_id + 1))
+        cur = self.conn.cursor()
+        result = psycopg2.extras.execute_values(
+            cur, f"INSERT INTO {table} ({column_list}) VALUES %s RETURNING id", rows, page_size=len(rows), fetch=True)
+        return [row[0] for row in result]
+
     def commit(self):
         self.conn.commit()
+        if self.write_lock is not None:
+            self.write_lock.release(self.conn)
 
-def get_db_connection():
-    if USE_SQLITE:
-        conn = sqlite3.connect(DATABASE, check_same_thread=False)
+_stream_cursor_ids = itertools.count(1)
+
+########################################
+#  Connection Pools
+########################################
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))
+
+class PostgresPool:
+    """Thread-safe psycopg2 pool with blocking checkout and health checks.
+
+    Checkout waits up to `timeout` seconds for a free slot. A connection that
+    is closed, or that fails a `SELECT 1` after sitting idle longer than
+    `healthcheck_idle` seconds, is discarded and replaced."""
+    def __init__(self, dsn, minconn, maxconn, timeout, healthcheck_idle):
+        import psycopg2.pool
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}  # id(connection) -> when it was last released, while the pool holds it
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        # Drop the entry first: once the connection is gone its id can be reused by a new one
+        self._last_used.pop(id(conn), None)
+        self.discarded += 1
+        self._pool.putconn(conn, close=True)
+
+    def checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            self.timeouts += 1
+            raise RuntimeError("Timed out waiting for a database connection")
+        try:
+            conn = self._pool.getconn()
+            for _ in range(self.maxconn):
+                if self._healthy(conn):
+                    break
+                self._discard(conn)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+        return DBConnection(conn, use_sqlite=False, release=self._release)
+
+    def _release(self, conn):
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            # End any transaction left open by reads so the next user starts clean
+            conn.rollback()
+            self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+            if conn.closed:
+                # psycopg2's pool closes connections it will not keep
+                self._last_used.pop(id(conn), None)
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {
+            'backend': 'postgres',
+            'min': self.minconn,
+            'max': self.maxconn,
+            'in_use': self.in_use,
+            'idle': len(self._pool._pool),
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'discarded': self.discarded
+        }
+
+# WAL lets readers run alongside the writer; NORMAL sync is safe with WAL (a power
+# loss can only drop the last commits, never corrupt the file)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "wal").lower()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "normal").lower()
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "16"))  # per connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+class SQLiteWriteLock:
+    """Makes one thread at a time the SQLite writer.
+
+    A connection takes the lock with its first write statement and gives it
+    back on commit, or when the pool rolls back or drops it with an
+    unfinished transaction, so writes from the history writer, request
+    threads and background jobs queue here instead of failing with "database
+    is locked". The lock belongs to the connection that took it; only that
+    connection's commit or release gives it back. Another connection of the
+    owning thread does not wait here (it would wait on itself) and is left to
+    SQLite's busy timeout."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owner = None         # sqlite3 connection holding the lock
+        self._owner_thread = None
+        self.acquired = 0
+        self.wait = metrics.timer('sqlite_write_wait')
+
+    def acquire(self, conn):
+        if self._owner_thread == threading.get_ident():
+            return
+        started = time.perf_counter()
+        self._lock.acquire()
+        self._owner, self._owner_thread = conn, threading.get_ident()
+        self.acquired += 1
+        self.wait.add(time.perf_counter() - started)
+
+    def release(self, conn):
+        if self._owner is conn:
+            self._owner = self._owner_thread = None
+            self._lock.release()
+
+class SQLitePool:
+    """Keeps one persistent SQLite connection per thread.
+
+    At most `maxconn` persistent connections are kept; connections owned by
+    threads that have exited are closed and reused for new threads, and any
+    thread beyond the cap gets a one-off connection that is closed on release.
+    Every connection gets the SQLITE_* pragmas. A `readonly` pool opens the
+    file with mode=ro for the read-heavy routes; the read-write pool shares
+    one SQLiteWriteLock and starts its write transactions with BEGIN IMMEDIATE."""
+    def __init__(self, database, maxconn, readonly=False):
+        self.database = database
+        self.maxconn = maxconn
+        self.readonly = readonly
+        self.write_lock = None if readonly else SQLiteWriteLock()
+        self._lock = threading.Lock()
+        self._conns = {}  # thread ident -> [connection, checkout depth]
+        self.in_use = 0
+        self.checkouts = 0
+        self.overflow = 0
+        self.discarded = 0
+
+    def _connect(self):
+        timeout = SQLITE_BUSY_TIMEOUT_MS / 1000.0
+        if self.readonly:
+            uri = pathlib.Path(self.database).absolute().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False)
+        else:
+            # IMMEDIATE: take the file's write lock when the transaction starts, not halfway through it
+            conn = sqlite3.connect(self.database, timeout=timeout, check_same_thread=False, isolation_level="IMMEDIATE")
+            conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+            conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_MB * 1024 * 1024}")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_MB * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
         conn.row_factory = sqlite3.Row
-        return DBConnection(conn, use_sqlite=True)
-    else:
-        conn = psycopg2.connect(DATABASE)
-        return DBConnection(conn, use_sqlite=False)
+        return conn
+
+    def _drop(self, conn):
+        # A dropped connection's unfinished transaction goes with it, and so does its write lock
+        conn.close()
+        if self.write_lock is not None:
+            self.write_lock.release(conn)
+
+    def _prune(self):
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [ident for ident in self._conns if ident not in alive]:
+            self._drop(self._conns.pop(ident)[0])
+
+    def checkout(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            entry = self._conns.get(ident)
+            if entry is not None:
+                try:
+                    entry[0].execute("SELECT 1")
+                except sqlite3.Error:
+                    self.discarded += 1
+                    self._drop(self._conns.pop(ident)[0])
+                    entry = None
+            if entry is None:
+                if len(self._conns) >= self.maxconn:
+                    self._prune()
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    # e.g. a read-only open before the database file exists
+                    self.in_use -= 1
+                    raise
+                if len(self._conns) >= self.maxconn:
+                    self.overflow += 1
+                    return DBConnection(conn, use_sqlite=True, release=self._release_overflow,
+                                        write_lock=self.write_lock)
+                entry = self._conns[ident] = [conn, 0]
+            entry[1] += 1
+        return DBConnection(entry[0], use_sqlite=True, release=self._release, write_lock=self.write_lock)
+
+    def _release(self, conn):
+        with self._lock:
+            self.in_use -= 1
+            entry = self._conns.get(threading.get_ident())
+            if entry is None:
+                return
+            entry[1] -= 1
+            # Only the outermost `with` on this thread may discard uncommitted work
+            if entry[1] == 0:
+                if conn.in_transaction:
+                    conn.rollback()
+                if self.write_lock is not None:
+                    self.write_lock.release(conn)
+
+    def _release_overflow(self, conn):
+        with self._lock:
+            self.in_use -= 1
+        self._drop(conn)
+
+    def stats(self):
+        return {
+            'backend': 'sqlite',
+            'readonly': self.readonly,
+            'min': 0,
+            'max': self.maxconn,
+            'in_use': self.in_use,
+            'idle': len(self._conns) - sum(1 for entry in self._conns.values() if entry[1] > 0),
+            'checkouts': self.checkouts,
+            'overflow': self.overflow,
+            'discarded': self.discarded,
+            'write_transactions': self.write_lock.acquired if self.write_lock is not None else 0
+        }
+
+_db_pool = None
+_db_read_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool(readonly=False):
+    """The shared connection pool; SQLite has a separate read-only pool for `readonly`."""
+    global _db_pool, _db_read_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                if USE_SQLITE:
+                    _db_pool = SQLitePool(DATABASE, DB_POOL_MAX)
+                else:
+                    _db_pool = PostgresPool(DATABASE, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_IDLE)
+    if not readonly or not USE_SQLITE:
+        return _db_pool
+    if _db_read_pool is None:
+        with _db_pool_lock:
+            if _db_read_pool is None:
+                _db_read_pool = SQLitePool(DATABASE, DB_POOL_MAX, readonly=True)
+    return _db_read_pool
+
+def get_db_connection(readonly=False):
+    """Check out a connection; `readonly` ones (SQLite mode=ro) never wait for the writer."""
+    return get_db_pool(readonly).checkout()
+
+def sqlite_pragma_report():
+    """Effective pragmas of a read-write SQLite connection, logged at startup."""
+    with get_db_connection() as conn:
+        report = {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                  for pragma in ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout",
+                                 "page_size", "temp_store")}
+    logger.info("SQLite %s: %s", DATABASE, ", ".join(f"{key}={value}" for key, value in report.items()))
+    if report["journal_mode"] != SQLITE_JOURNAL_MODE:
+        # e.g. WAL is refused on some network file systems
+        logger.warning("SQLite journal_mode is %s, not %s as configured", report["journal_mode"], SQLITE_JOURNAL_MODE)
+    return report
 
 ########################################
 # Helper function for config upsert
 ########################################
-def insert_config(conn, key, value):
+CONFIG_DEFAULTS = {
+    'mqtt_broker': 'broker.mqtt.cool',
+    'mqtt_port': '1883',
+    'sensor_label1': 'หัว',
+    'sensor_label2': 'ลำตัว',
+    'sensor_label3': 'ท้อง',
+    'sensor_label4': 'ขา',
+    'default_position_sensor1': '0',
+    'default_position_sensor2': '1',
+    'default_position_sensor3': '3',
+    'default_position_sensor4': '4',
+    'sensor_value_range_min1': '100',
+    'sensor_value_range_min2': '200',
+    'sensor_value_range_min3': '300',
+    'sensor_value_range_max1': '199',
+    'sensor_value_range_max2': '299',
+    'sensor_value_range_max3': '399',
+    'timer_duration': '5',
+    # Default custom fields (empty array)
+    'custom_fields': '[]',
+    # Bumped by every /settings save, see ConfigWatcher
+    'config_version': '0'
+}
+
+def insert_config_defaults(conn, defaults):
+    """Add the config keys that are missing, in one multi-row statement; existing values are kept."""
+    values = ", ".join(["(?, ?)"] * len(defaults))
+    params = [item for pair in defaults.items() for item in pair]
     if USE_SQLITE:
-        conn.execute("INSERT OR IGNORE INTO config (key, value) VALUES (?, ?)", (key, value))
+        conn.execute(f"INSERT OR IGNORE INTO config (key, value) VALUES {values}", params)
     else:
-        conn.execute("INSERT INTO config (key, value) VALUES (?, ?) ON CONFLICT (key) DO NOTHING", (key, value))
+        conn.execute(f"INSERT INTO config (key, value) VALUES {values} ON CONFLICT (key) DO NOTHING", params)
+
+def add_column_if_missing(conn, table, column, column_type):
+    if USE_SQLITE:
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    else:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}")
 
 ########################################
 # Initialize Database
 ########################################
+# Bump whenever init_db creates or alters something; a database already at this
+# version skips the DDL and the config seeding on startup
+SCHEMA_VERSION = 2
+
+def stored_schema_version():
+    """The schema_version config row, or 0 for a new or pre-versioning database."""
+    try:
+        with get_db_connection(readonly=True) as conn:
+            row = conn.execute("SELECT value FROM config WHERE key = 'schema_version'").fetchone()
+    except Exception:
+        # No database file or no config table yet
+        return 0
+    return int(row['value']) if row else 0
+
 def init_db():
+    drop_tables = os.getenv("DROP_TABLES_ON_STARTUP", "False").lower() == "true"
+    if not drop_tables and stored_schema_version() == SCHEMA_VERSION:
+        init_name_search(create=False)
+        if USE_SQLITE:
+            sqlite_pragma_report()
+        return
     with get_db_connection() as conn:
         # Optionally drop old tables on startup
-        if os.getenv("DROP_TABLES_ON_STARTUP", "False").lower() == "true":
+        if drop_tables:
             conn.execute("DROP TABLE IF EXISTS training_round")
         
         # Create config table
@@ -85,26 +799,7 @@ def init_db():
                 value TEXT
             )
         ''')
-        # Insert default config values
-        insert_config(conn, 'mqtt_broker', 'broker.mqtt.cool')
-        insert_config(conn, 'mqtt_port', '1883')
-        insert_config(conn, 'sensor_label1', 'หัว')
-        insert_config(conn, 'sensor_label2', 'ลำตัว')
-        insert_config(conn, 'sensor_label3', 'ท้อง')
-        insert_config(conn, 'sensor_label4', 'ขา')
-        insert_config(conn, 'default_position_sensor1', '0')
-        insert_config(conn, 'default_position_sensor2', '1')
-        insert_config(conn, 'default_position_sensor3', '3')
-        insert_config(conn, 'default_position_sensor4', '4')
-        insert_config(conn, 'sensor_value_range_min1', 100)
-        insert_config(conn, 'sensor_value_range_min2', 200)
-        insert_config(conn, 'sensor_value_range_min3', 300)
-        insert_config(conn, 'sensor_value_range_max1', 199)
-        insert_config(conn, 'sensor_value_range_max2', 299)
-        insert_config(conn, 'sensor_value_range_max3', 399)
-        insert_config(conn, 'timer_duration', '5')
-        # Default custom fields (empty array)
-        insert_config(conn, 'custom_fields', '[]')
+        insert_config_defaults(conn, CONFIG_DEFAULTS)
         
         # Create training_round table with a custom_fields column.
         if USE_SQLITE:
@@ -128,6 +823,12 @@ def init_db():
                     event TEXT,
                     forces TEXT,
                     max_force TEXT,
+                    force_a0 INTEGER,
+                    force_a1 INTEGER,
+                    force_a3 INTEGER,
+                    force_a4 INTEGER,
+                    max_force_value INTEGER,
+                    force_level INTEGER,
                     training_round_id INTEGER,
                     FOREIGN KEY(training_round_id) REFERENCES training_round(id)
                 )
@@ -153,13 +854,1409 @@ def init_db():
                     event TEXT,
                     forces TEXT,
                     max_force TEXT,
+                    force_a0 INTEGER,
+                    force_a1 INTEGER,
+                    force_a3 INTEGER,
+                    force_a4 INTEGER,
+                    max_force_value INTEGER,
+                    force_level INTEGER,
                     training_round_id INTEGER,
                     FOREIGN KEY(training_round_id) REFERENCES training_round(id)
                 )
             '''
         conn.execute(training_round_sql)
         conn.execute(sensor_history_sql)
+        # Older databases only have the forces/max_force text columns; add the numeric ones.
+        # Existing rows are converted with `flask --app app backfill-forces`.
+        for column in FORCE_COLUMNS + ('max_force_value', 'force_level'):
+            add_column_if_missing(conn, 'sensor_history', column, 'INTEGER')
+        # Set while a round records; split deployments share the active rounds through it
+        add_column_if_missing(conn, 'training_round', 'active', 'INTEGER NOT NULL DEFAULT 0')
+        # File under ARCHIVE_DIR holding the round's rows once they left sensor_history
+        add_column_if_missing(conn, 'training_round', 'archive_path', 'TEXT')
+        # JSON {sensor_id: map_force_position} of a round fusing several sensors
+        add_column_if_missing(conn, 'training_round', 'sensor_maps', 'TEXT')
+
+        # State the ingest process shares with web workers, see RoleSync
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sensor_presence (
+                sensor_id TEXT PRIMARY KEY,
+                last_seen DOUBLE PRECISION NOT NULL,
+                messages INTEGER NOT NULL DEFAULT 0,
+                rate DOUBLE PRECISION,
+                last_payload TEXT
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS stream_event (
+                id {"INTEGER PRIMARY KEY AUTOINCREMENT" if USE_SQLITE else "SERIAL PRIMARY KEY"},
+                round_id INTEGER,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at DOUBLE PRECISION NOT NULL
+            )
+        ''')
+
+        # Per-round aggregates kept up to date by the history writer, see apply_summary_deltas
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS round_summary (
+                round_id INTEGER PRIMARY KEY,
+                {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in SUMMARY_COUNTER_COLUMNS + SUMMARY_MAX_COLUMNS)},
+                first_hit TEXT,
+                last_hit TEXT,
+                duration_seconds INTEGER,
+                finalized INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        # Indexes for /stream catch-up, round_details and /history sorting
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sensor_history_round_id ON sensor_history (training_round_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sensor_history_timestamp ON sensor_history (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_training_round_start_time ON training_round (start_time, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_training_round_sensor_id ON training_round (sensor_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_training_round_active ON training_round (active, sensor_id)")
+        for column in SUMMARY_SORT_COLUMNS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_round_summary_{column} ON round_summary ({column}, round_id)")
         conn.commit()
+    init_name_search()
+    with get_db_connection() as conn:
+        if USE_SQLITE:
+            conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        else:
+            conn.execute("INSERT INTO config (key, value) VALUES ('schema_version', ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value", (str(SCHEMA_VERSION),))
+        conn.commit()
+    logger.info("Database schema initialized at version %s", SCHEMA_VERSION)
+    if USE_SQLITE:
+        sqlite_pragma_report()
+
+NAME_SEARCH = None  # 'fts5' (SQLite), 'trigram' (Postgres) or None when substring search is a full scan
+
+def init_name_search(create=True):
+    """Set up indexed substring search on training_name/sensor_id where the backend supports it.
+
+    With `create` False (schema already current) it only checks whether the index exists."""
+    global NAME_SEARCH
+    if not create:
+        if USE_SQLITE:
+            query, mode = "SELECT 1 FROM sqlite_master WHERE name = 'training_round_fts'", 'fts5'
+        else:
+            query, mode = "SELECT 1 FROM pg_indexes WHERE indexname = 'idx_training_round_name_trgm'", 'trigram'
+        with get_db_connection(readonly=True) as conn:
+            NAME_SEARCH = mode if conn.execute(query).fetchone() else None
+        return
+    try:
+        with get_db_connection() as conn:
+            if USE_SQLITE:
+                # Trigram FTS5 index kept in sync with training_round by triggers; serves LIKE '%..%'
+                exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'training_round_fts'").fetchone()
+                conn.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS training_round_fts USING fts5(
+                        training_name, sensor_id, content='training_round', content_rowid='id', tokenize='trigram')
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS training_round_fts_insert AFTER INSERT ON training_round BEGIN
+                        INSERT INTO training_round_fts (rowid, training_name, sensor_id)
+                        VALUES (new.id, new.training_name, new.sensor_id);
+                    END
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS training_round_fts_delete AFTER DELETE ON training_round BEGIN
+                        INSERT INTO training_round_fts (training_round_fts, rowid, training_name, sensor_id)
+                        VALUES ('delete', old.id, old.training_name, old.sensor_id);
+                    END
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS training_round_fts_update AFTER UPDATE OF training_name, sensor_id ON training_round BEGIN
+                        INSERT INTO training_round_fts (training_round_fts, rowid, training_name, sensor_id)
+                        VALUES ('delete', old.id, old.training_name, old.sensor_id);
+                        INSERT INTO training_round_fts (rowid, training_name, sensor_id)
+                        VALUES (new.id, new.training_name, new.sensor_id);
+                    END
+                ''')
+                if not exists:
+                    conn.execute("INSERT INTO training_round_fts (training_round_fts) VALUES ('rebuild')")
+                conn.commit()
+                NAME_SEARCH = 'fts5'
+            else:
+                # Postgres uses these GIN indexes for LIKE '%..%' directly
+                conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_training_round_name_trgm ON training_round USING gin (training_name gin_trgm_ops)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_training_round_sensor_trgm ON training_round USING gin (sensor_id gin_trgm_ops)")
+                conn.commit()
+                NAME_SEARCH = 'trigram'
+    except Exception as e:
+        # e.g. SQLite built without FTS5, or no permission to create the pg_trgm extension
+        logger.warning("Indexed name search unavailable, falling back to LIKE scans: %s", e)
+        NAME_SEARCH = None
+
+########################################
+# Config Snapshot Cache
+########################################
+class ConfigSnapshot:
+    """Immutable view of the config table with the values on_message needs pre-parsed."""
+    def __init__(self, values, version):
+        self.values = values
+        self.version = version
+        self.labels = [
+            values.get('sensor_label1', 'หัว'),
+            values.get('sensor_label2', 'ลำตัว'),
+            values.get('sensor_label3', 'ท้อง'),
+            values.get('sensor_label4', 'ขา')
+        ]
+        self.ranges = [
+            (int(values['sensor_value_range_min1']), int(values['sensor_value_range_max1'])),
+            (int(values['sensor_value_range_min2']), int(values['sensor_value_range_max2'])),
+            (int(values['sensor_value_range_min3']), int(values['sensor_value_range_max3']))
+        ]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+class ConfigCache:
+    """Process-wide cache of the config table.
+
+    The config is loaded once and served from memory until invalidate() is
+    called (after /settings writes), which bumps the version so the next
+    reader reloads it."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def snapshot(self):
+        # The counters are read-modify-write, so hits are counted under the lock too
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.version == self.version:
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            with metrics.time('db_read'), get_db_connection(readonly=True) as conn:
+                cur = conn.execute("SELECT key, value FROM config")
+                values = {row['key']: row['value'] for row in cur.fetchall()}
+            if self._snapshot is not None:
+                self.reloads += 1
+            self._snapshot = ConfigSnapshot(values, self.version)
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def stats(self):
+        return {'version': self.version, 'hits': self.hits, 'misses': self.misses, 'reloads': self.reloads}
+
+config_cache = ConfigCache()
+
+MQTT_CONFIG_KEYS = {'mqtt_broker', 'mqtt_port'}
+MAPPING_CONFIG_KEYS = {f'sensor_label{i}' for i in range(1, 5)} | \
+    {f'sensor_value_range_{bound}{i}' for bound in ('min', 'max') for i in range(1, 4)}
+
+def config_changes(old, new):
+    """Keys whose value differs between two ConfigSnapshots."""
+    return {key for key in set(old.values) | set(new.values)
+            if key != 'config_version' and old.values.get(key) != new.values.get(key)}
+
+class ConfigWatcher:
+    """Applies saved settings to the running process without a restart.
+
+    /settings bumps the config_version row in the same transaction as the new
+    values. check() compares it with the version this process applied last and,
+    when it moved, reloads the config cache and hands the old and new snapshots
+    to apply_config_changes, which only touches what changed. The single
+    process calls check() right after a save; the processes of a split
+    deployment call it from RoleSync."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.applied = 0
+
+    def check(self):
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT value FROM config WHERE key = 'config_version'").fetchone()
+        version = row['value'] if row else None
+        with self._lock:
+            if version == self.version:
+                return False
+            old = config_cache.snapshot()
+            config_cache.invalidate()
+            new = config_cache.snapshot()
+            self.version = version
+            changed = config_changes(old, new)
+            if changed:
+                logger.info("Config version %s changed %s", version, ", ".join(sorted(changed)))
+                apply_config_changes(changed, new)
+                self.applied += 1
+        return True
+
+    def stats(self):
+        return {'applied': self.applied}
+
+config_watcher = ConfigWatcher()
+
+########################################
+# Force Mapping Kernel
+########################################
+FORCE_CHANNELS = ("A0", "A1", "A3", "A4")  # A2 is the reed sensor
+FORCE_COLUMNS = tuple("force_" + channel.lower() for channel in FORCE_CHANNELS)  # sensor_history columns
+NO_POSITION_EVENT = "ไม่พบตำแหน่ง"
+
+class ForceMapping(namedtuple('ForceMapping', 'channels lows highs levels labels')):
+    """A round's position mapping and the force levels, compiled once per round.
+
+    `channels` holds, for each of the four body positions, the index into a
+    FORCE_CHANNELS-ordered value tuple (None for an unmapped position).
+    `lows`/`highs`/`levels` are the level ranges, made disjoint by
+    level_pieces() and sorted by their lower bound, so classify_hit() can
+    find a level with a single bisect."""
+    __slots__ = ()
+
+def level_pieces(ranges):
+    """Disjoint (low, high, level) pieces of the level ranges, sorted by low.
+
+    Where ranges overlap the lower level keeps the overlap, as the original
+    level-1-then-2-then-3 checks did. Forces are integers, so a cut piece
+    starts right after (or ends right before) the range that took it."""
+    pieces, taken = [], []
+    for level, (low, high) in enumerate(ranges, start=1):
+        remaining = [(low, high)] if low <= high else []
+        for taken_low, taken_high in taken:
+            remaining = [part for part_low, part_high in remaining
+                         for part in ((part_low, min(part_high, taken_low - 1)), (max(part_low, taken_high + 1), part_high))
+                         if part[0] <= part[1]]
+        pieces.extend((piece_low, piece_high, level) for piece_low, piece_high in remaining)
+        taken.append((low, high))
+    return sorted(pieces)
+
+def compile_force_mapping(map_force_position, config):
+    """Build a ForceMapping from a round's map_force_position list and a ConfigSnapshot.
+
+    Raises ValueError if a position refers to a channel the sensor does not have."""
+    channels = []
+    for pos in map_force_position:
+        if pos == '':
+            channels.append(None)
+        elif "A" + pos in FORCE_CHANNELS:
+            channels.append(FORCE_CHANNELS.index("A" + pos))
+        else:
+            raise ValueError(f"Unknown force channel A{pos}")
+    ranges = level_pieces(config.ranges)
+    return ForceMapping(
+        tuple(channels),
+        tuple(low for low, _, _ in ranges),
+        tuple(high for _, high, _ in ranges),
+        tuple(level for _, _, level in ranges),
+        tuple(config.labels)
+    )
+
+def forces_to_values(forces):
+    """Turn a {"A0": .., "A1": ..} payload dict into a FORCE_CHANNELS-ordered tuple."""
+    return tuple(forces.get(channel) for channel in FORCE_CHANNELS)
+
+def classify_hit(mapping, values, reed_value=None):
+    """Map channel values to positions and classify the strongest one.
+
+    Returns (position index, event label, max force, level), or None when a
+    mapped channel is missing or the max force is outside every level range.
+    The first position is ignored while the reed sensor is triggered."""
+    positions = []
+    for index, channel in enumerate(mapping.channels):
+        if channel is None or (index == 0 and reed_value):
+            positions.append(0)
+            continue
+        value = values[channel]
+        if value is None:
+            return None
+        positions.append(value)
+    max_force = max(positions)
+    i = bisect.bisect_right(mapping.lows, max_force) - 1
+    if i < 0 or max_force > mapping.highs[i]:
+        return None
+    position = positions.index(max_force)
+    event = mapping.labels[position] if position < len(mapping.labels) else NO_POSITION_EVENT
+    return position, event, max_force, mapping.levels[i]
+
+def format_max_force(max_force, level):
+    return f"{max_force} [ ระดับ {level} ]"
+
+def position_channels(map_force_position):
+    """Channel index per body position for a stored map_force_position (None if unmapped)."""
+    channels = []
+    for pos in map_force_position or []:
+        channel = "A" + pos if pos else None
+        channels.append(FORCE_CHANNELS.index(channel) if channel in FORCE_CHANNELS else None)
+    return channels
+
+def parse_sensor_ids(text):
+    """Split a comma separated sensor id field, dropping blanks and repeats."""
+    sensor_ids = []
+    for sensor_id in text.split(','):
+        sensor_id = sensor_id.strip()
+        if sensor_id and sensor_id not in sensor_ids:
+            sensor_ids.append(sensor_id)
+    return sensor_ids
+
+def fused_round_map(map_force_position):
+    """map_force_position of a fused round: position i reads the i-th stored force column."""
+    return [channel[1:] if pos else '' for channel, pos in zip(FORCE_CHANNELS, map_force_position)]
+
+def force_layout(sensor_maps):
+    """'position' for the rows of a fused round, 'channel' (FORCE_CHANNELS order) otherwise."""
+    return 'position' if sensor_maps else 'channel'
+
+def position_values(mapping, values):
+    """Lay one sensor's FORCE_CHANNELS-ordered values out in body-position order (fused round rows)."""
+    return tuple(values[channel] if channel is not None else None for channel in mapping.channels)
+
+def compile_round_mappings(map_force_position, sensor_maps, config):
+    """The round's ForceMapping plus, for a fused round, one per sensor (None otherwise).
+
+    Raises ValueError like compile_force_mapping."""
+    mapping = compile_force_mapping(map_force_position, config)
+    if not sensor_maps:
+        return mapping, None
+    return mapping, {sensor_id: compile_force_mapping(positions, config) for sensor_id, positions in sensor_maps.items()}
+
+########################################
+# sensor_history Rows
+########################################
+HISTORY_SELECT_COLUMNS = ("id, timestamp, reed_value, event, " + ", ".join(FORCE_COLUMNS) +
+                          ", max_force_value, force_level, forces, max_force")
+
+def history_row_forces(row):
+    """Return (channel values, max force, level) for a sensor_history row.
+
+    Rows written before the numeric columns existed (and not yet backfilled)
+    fall back to parsing the legacy forces/max_force text."""
+    if row['max_force_value'] is not None:
+        return tuple(row[column] for column in FORCE_COLUMNS), row['max_force_value'], row['force_level']
+    import analytics
+    forces = json.loads(row['forces']) if row['forces'] else {}
+    max_force, level = analytics.parse_max_force(row['max_force'])
+    return forces_to_values(forces), max_force, level
+
+########################################
+# Active Training Sessions
+########################################
+class ActiveRound:
+    """In-memory state of a training_round that is currently recording.
+
+    A fused round records several sensors: `sensor_maps` holds each sensor's
+    own map_force_position and `sensor_mappings` their compiled ForceMappings.
+    Its rows store forces in body-position order, so its map_force_position
+    is the identity map (see fused_round_map)."""
+    def __init__(self, round_id, sensor_id, map_force_position, training_name=None, stop_time=None, mapping=None,
+                 sensor_maps=None, sensor_mappings=None):
+        self.round_id = round_id
+        self.sensor_id = sensor_id  # comma separated for a fused round
+        self.map_force_position = map_force_position
+        self.mapping = mapping  # ForceMapping, or None if the mapping could not be compiled
+        self.sensor_maps = sensor_maps  # {sensor_id: map_force_position} of a fused round, else None
+        self.sensor_mappings = sensor_mappings  # {sensor_id: ForceMapping} of a fused round, else None
+        self.training_name = training_name
+        self.stop_time = stop_time  # datetime or None for an untimed round
+        self.stopping = False  # set by SessionRegistry.begin_stop; the round still takes hits while it drains
+
+    @property
+    def sensor_ids(self):
+        return tuple(self.sensor_maps) if self.sensor_maps else (self.sensor_id,)
+
+    def remaining_seconds(self, now=None):
+        if self.stop_time is None:
+            return None
+        return max(0, (self.stop_time - (now or datetime.now())).total_seconds())
+
+class SessionRegistry:
+    """Active rounds indexed by sensor id and by round id.
+
+    Several rounds can record at once as long as they use different sensors;
+    every sensor of a fused round points at that round. Lookups are plain
+    dict reads so on_message can resolve a sensor to its round without
+    locking; start/stop replace entries under a lock."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_sensor = {}
+        self._by_id = {}
+        self._reserved = set()  # sensors of rounds /record is inserting, see reserve()
+
+    def start(self, active_round):
+        """Register a round; returns False if one of its sensors is already recording."""
+        with self._lock:
+            if any(sensor_id in self._by_sensor for sensor_id in active_round.sensor_ids):
+                return False
+            for sensor_id in active_round.sensor_ids:
+                self._by_sensor[sensor_id] = active_round
+            self._by_id[active_round.round_id] = active_round
+            return True
+
+    def reserve(self, sensor_ids):
+        """Claim sensors for a round about to be inserted; returns the first busy or claimed one, or None."""
+        with self._lock:
+            for sensor_id in sensor_ids:
+                if sensor_id in self._by_sensor or sensor_id in self._reserved:
+                    return sensor_id
+            self._reserved.update(sensor_ids)
+            return None
+
+    def unreserve(self, sensor_ids):
+        with self._lock:
+            self._reserved.difference_update(sensor_ids)
+
+    def begin_stop(self, round_id):
+        """Mark a round as stopping and return it, or None if it is not active or already stopping."""
+        with self._lock:
+            active_round = self._by_id.get(round_id)
+            if active_round is None or active_round.stopping:
+                return None
+            active_round.stopping = True
+            return active_round
+
+    def stop(self, round_id):
+        with self._lock:
+            active_round = self._by_id.pop(round_id, None)
+            if active_round is not None:
+                for sensor_id in active_round.sensor_ids:
+                    self._by_sensor.pop(sensor_id, None)
+            return active_round
+
+    def for_sensor(self, sensor_id):
+        return self._by_sensor.get(sensor_id)
+
+    def get(self, round_id):
+        return self._by_id.get(round_id)
+
+    def rounds(self):
+        return sorted(self._by_id.values(), key=lambda r: r.round_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+sessions = SessionRegistry()
+
+class RoundTimerScheduler:
+    """Owns the deadlines of timed rounds and expires each one exactly once.
+
+    Deadlines sit in a heap of (stop_time, round_id) driven by a single thread
+    that sleeps until the earliest one, or until an earlier deadline is
+    scheduled. Cancelled or rescheduled entries are skipped when popped.
+    `on_expire(round_id)` is called outside the lock."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._deadlines = {}  # round_id -> stop_time it is currently scheduled for
+        self._thread = None
+        self.on_expire = None
+        self.fired = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="round-timers", daemon=True)
+                self._thread.start()
+
+    def schedule(self, round_id, stop_time):
+        self.start()
+        with self._cond:
+            self._deadlines[round_id] = stop_time
+            heapq.heappush(self._heap, (stop_time, round_id))
+            self._cond.notify()
+
+    def cancel(self, round_id):
+        with self._cond:
+            self._deadlines.pop(round_id, None)
+
+    def _next_due(self):
+        """Wait for and pop the next live deadline (called with the lock held)."""
+        while True:
+            if not self._heap:
+                self._cond.wait()
+                continue
+            stop_time, round_id = self._heap[0]
+            if self._deadlines.get(round_id) != stop_time:
+                heapq.heappop(self._heap)
+                continue
+            wait = (stop_time - datetime.now()).total_seconds()
+            if wait > 0:
+                self._cond.wait(wait)
+                continue
+            heapq.heappop(self._heap)
+            del self._deadlines[round_id]
+            return round_id
+
+    def _run(self):
+        while True:
+            with self._cond:
+                round_id = self._next_due()
+            self.fired += 1
+            try:
+                if self.on_expire is not None:
+                    self.on_expire(round_id)
+            except Exception as e:
+                logger.exception("Error expiring round %s: %s", round_id, e)
+
+    def stats(self):
+        return {'scheduled': len(self._deadlines), 'fired': self.fired}
+
+round_timers = RoundTimerScheduler()
+
+def resolve_round_id(value):
+    """Pick the round a request refers to: the given id, or the only active round."""
+    if value not in (None, ''):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    active = sessions.rounds()
+    return active[0].round_id if len(active) == 1 else None
+
+########################################
+# Buffered sensor_history Writer
+########################################
+# A live notice relayed to the web workers through stream_event, see publish_notice
+StreamNotice = namedtuple('StreamNotice', "round_id kind data created_at")
+
+class SensorHistoryWriter:
+    """Background writer that group-commits accepted hits into sensor_history.
+
+    on_message only enqueues rows; a single thread drains the bounded queue and
+    writes them with one executemany per transaction, every `batch_size` rows or
+    `flush_interval` seconds after the first pending row, whichever comes first.
+    When the queue is full submit() blocks for up to `enqueue_timeout` seconds
+    (backpressure on the MQTT thread) and then drops the row.
+
+    The round_summary deltas of a batch are written in the same transaction
+    as its rows, and so are stream_event notices queued with submit_notice().
+    After each commit `on_commit(ids, rows)` is called with the new row ids."""
+    COLUMNS = ("timestamp", "reed_value", "event") + FORCE_COLUMNS + ("max_force_value", "force_level", "training_round_id")
+
+    def __init__(self, batch_size=200, flush_interval=0.02, max_queue=10000, enqueue_timeout=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.on_commit = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.notices = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sensor-history-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row, position=None):
+        """Queue a sensor_history row and the index of the position it hit; returns False if it was dropped."""
+        self.start()
+        try:
+            self._queue.put((row, position), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def submit_notice(self, round_id, kind, payload):
+        """Queue a stream_event row for the web workers, behind the rows already queued."""
+        self.start()
+        try:
+            self._queue.put(StreamNotice(round_id, kind, payload, time.time()), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout=5.0):
+        """Block until every row queued before this call has been committed."""
+        self.start()
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, notices, waiters = [], [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                if isinstance(item, StreamNotice):
+                    notices.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) + len(notices) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch or notices:
+                self._write(batch, notices)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch, notices=()):
+        rows = [row for row, _ in batch]
+        ids = []
+        try:
+            with metrics.time('db_insert'), get_db_connection() as conn:
+                if rows:
+                    ids = conn.insert_many("sensor_history", self.COLUMNS, rows)
+                    apply_summary_deltas(conn, summary_deltas(batch))
+                if notices:
+                    # After the rows, so a tailing web worker sees a round's hits before e.g. its timer_expired
+                    conn.executemany(f"INSERT INTO stream_event ({', '.join(StreamNotice._fields)}) VALUES (?, ?, ?, ?)",
+                                     notices)
+                conn.commit()
+            self.written += len(rows)
+            self.notices += len(notices)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(rows) + len(notices)
+            logger.error("Error writing sensor_history batch: %s", e)
+            return
+        if rows and self.on_commit is not None:
+            try:
+                self.on_commit(ids, rows)
+            except Exception as e:
+                logger.exception("Error in sensor_history commit callback: %s", e)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'notices': self.notices
+        }
+
+history_writer = SensorHistoryWriter(
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "200")),
+    flush_interval=int(os.getenv("HISTORY_FLUSH_MS", "20")) / 1000.0,
+    max_queue=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+    enqueue_timeout=int(os.getenv("HISTORY_ENQUEUE_TIMEOUT_MS", "50")) / 1000.0
+)
+
+########################################
+# Round Summary Table
+########################################
+SUMMARY_POSITIONS = 4
+SUMMARY_LEVELS = (1, 2, 3)
+SUMMARY_COUNTER_COLUMNS = ("hit_count", "force_sum") + tuple(f"level{level}_hits" for level in SUMMARY_LEVELS) + \
+    tuple(f"pos{i}_{kind}" for i in range(1, SUMMARY_POSITIONS + 1) for kind in ("hits", "sum"))
+SUMMARY_MAX_COLUMNS = ("force_max",) + tuple(f"pos{i}_max" for i in range(1, SUMMARY_POSITIONS + 1))
+SUMMARY_SORT_COLUMNS = ("hit_count", "force_max", "duration_seconds")
+
+def summary_deltas(batch):
+    """Aggregate (sensor_history row, position index) pairs into round_summary deltas per round."""
+    deltas = {}
+    for row, position in batch:
+        timestamp = row[0]
+        max_force, level, round_id = row[-3:]
+        delta = deltas.get(round_id)
+        if delta is None:
+            delta = deltas[round_id] = dict.fromkeys(SUMMARY_COUNTER_COLUMNS + SUMMARY_MAX_COLUMNS, 0)
+            delta['first_hit'] = delta['last_hit'] = timestamp
+        delta['hit_count'] += 1
+        delta['force_sum'] += max_force
+        delta['force_max'] = max(delta['force_max'], max_force)
+        if level in SUMMARY_LEVELS:
+            delta[f'level{level}_hits'] += 1
+        if position is not None and position < SUMMARY_POSITIONS:
+            prefix = f'pos{position + 1}'
+            delta[f'{prefix}_hits'] += 1
+            delta[f'{prefix}_sum'] += max_force
+            delta[f'{prefix}_max'] = max(delta[f'{prefix}_max'], max_force)
+        # Timestamps are '%Y-%m-%d %H:%M:%S' text, so they order as strings
+        delta['first_hit'] = min(delta['first_hit'], timestamp)
+        delta['last_hit'] = max(delta['last_hit'], timestamp)
+    return deltas
+
+def apply_summary_deltas(conn, deltas):
+    """Add per-round deltas onto round_summary with one upsert per round."""
+    if not deltas:
+        return
+    greatest = "MAX" if USE_SQLITE else "GREATEST"
+    columns = ("round_id",) + SUMMARY_COUNTER_COLUMNS + SUMMARY_MAX_COLUMNS + ("first_hit", "last_hit")
+    updates = [f"{column} = round_summary.{column} + excluded.{column}" for column in SUMMARY_COUNTER_COLUMNS]
+    updates += [f"{column} = {greatest}(round_summary.{column}, excluded.{column})" for column in SUMMARY_MAX_COLUMNS]
+    updates += [
+        "first_hit = CASE WHEN round_summary.first_hit IS NULL OR excluded.first_hit < round_summary.first_hit "
+        "THEN excluded.first_hit ELSE round_summary.first_hit END",
+        "last_hit = CASE WHEN round_summary.last_hit IS NULL OR excluded.last_hit > round_summary.last_hit "
+        "THEN excluded.last_hit ELSE round_summary.last_hit END",
+    ]
+    conn.executemany(f"""
+        INSERT INTO round_summary ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})
+        ON CONFLICT (round_id) DO UPDATE SET {", ".join(updates)}
+    """, [(round_id,) + tuple(delta[column] for column in columns[1:]) for round_id, delta in deltas.items()])
+
+def finalize_round_summary(conn, round_id):
+    """Mark a stopped round's summary final and record its duration (rounds without hits get a row too)."""
+    cur = conn.execute("SELECT start_time, stop_time FROM training_round WHERE id = ?", (round_id,))
+    round_info = cur.fetchone()
+    if round_info is None:
+        return
+    duration = round_duration_seconds(round_info)
+    if duration is None:
+        # Timed rounds stopped early still carry their planned stop_time
+        try:
+            duration = (datetime.now() - datetime.strptime(round_info['start_time'], '%Y-%m-%d %H:%M:%S')).total_seconds()
+        except (TypeError, ValueError):
+            duration = None
+    if USE_SQLITE:
+        conn.execute("INSERT OR IGNORE INTO round_summary (round_id) VALUES (?)", (round_id,))
+    else:
+        conn.execute("INSERT INTO round_summary (round_id) VALUES (?) ON CONFLICT (round_id) DO NOTHING", (round_id,))
+    conn.execute("UPDATE round_summary SET finalized = 1, duration_seconds = ? WHERE round_id = ?",
+                 (int(duration) if duration is not None else None, round_id))
+
+def hit_position(values, reed_value, channels):
+    """Index of the position that carried a stored hit's max force (used when rebuilding summaries)."""
+    best, best_value = None, None
+    for index, channel in enumerate(channels):
+        if channel is None or (index == 0 and reed_value):
+            continue
+        value = values[channel] or 0
+        if best_value is None or value > best_value:
+            best, best_value = index, value
+    return best
+
+########################################
+# sensor_history Archive
+########################################
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))  # 0 turns the background job off
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))  # seconds between archive runs
+ARCHIVE_BATCH_ROUNDS = 50
+
+class HistoryArchive:
+    """Finished rounds moved out of sensor_history into gzip files.
+
+    A round's rows are written to <directory>/<YYYY-MM of its start>/round_<id>.jsonl.gz,
+    one JSON object with the HISTORY_SELECT_COLUMNS per line in id order, and are
+    then deleted from the table through the (training_round_id, id) index in
+    the same transaction that sets training_round.archive_path. Reads go
+    through round_history_chunks, so /history/<id>, stats and exports work the
+    same for archived rounds. A month is dropped whole with drop_period()."""
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._thread = None
+        self.archived = 0
+        self.rows = 0
+
+    def start(self, older_than_days, interval):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(older_than_days, interval),
+                                                name="history-archive", daemon=True)
+                self._thread.start()
+
+    def _run(self, older_than_days, interval):
+        while True:
+            try:
+                while self.archive_older_than(older_than_days) == ARCHIVE_BATCH_ROUNDS:
+                    pass
+            except Exception as e:
+                logger.exception("Error archiving rounds: %s", e)
+            time.sleep(interval)
+
+    def archive_older_than(self, days, limit=ARCHIVE_BATCH_ROUNDS):
+        """Archive up to `limit` finished rounds that started more than `days` days ago; returns how many."""
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        with get_db_connection() as conn:
+            cur = conn.execute("""
+                SELECT id FROM training_round
+                WHERE active = 0 AND archive_path IS NULL AND start_time < ?
+                ORDER BY id LIMIT ?
+            """, (cutoff, limit))
+            round_ids = [row['id'] for row in cur.fetchall()]
+        for round_id in round_ids:
+            self.archive_round(round_id)
+        return len(round_ids)
+
+    def archive_round(self, round_id):
+        """Move one finished round's rows to its archive file; returns False if it cannot be archived."""
+        with get_db_connection() as conn:
+            cur = conn.execute("SELECT id, start_time, active, archive_path FROM training_round WHERE id = ?", (round_id,))
+            round_info = cur.fetchone()
+            if round_info is None or round_info['active'] or round_info['archive_path']:
+                return False
+            period = (round_info['start_time'] or '')[:7] or 'unknown'
+            archive_path = f"{period}/round_{round_id}.jsonl.gz"
+            path = os.path.join(self.directory, archive_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            count = 0
+            query = f"SELECT {HISTORY_SELECT_COLUMNS} FROM sensor_history WHERE training_round_id = ? ORDER BY id"
+            with gzip.open(path + ".tmp", 'wt', encoding='utf-8') as f:
+                for rows in conn.stream(query, (round_id,), EXPORT_CHUNK_ROWS):
+                    for row in rows:
+                        f.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+                    count += len(rows)
+            # The file is complete before the rows go; a crash in between only leaves a file to overwrite
+            os.replace(path + ".tmp", path)
+            conn.execute("UPDATE training_round SET archive_path = ? WHERE id = ?", (archive_path, round_id))
+            conn.execute("DELETE FROM sensor_history WHERE training_round_id = ?", (round_id,))
+            conn.commit()
+        self.archived += 1
+        self.rows += count
+        logger.info("Archived round %s (%s rows) to %s", round_id, count, archive_path)
+        return True
+
+    def chunks(self, archive_path, chunk_size):
+        """Rows of an archived round as dicts, oldest first, in lists of up to `chunk_size`."""
+        with gzip.open(os.path.join(self.directory, archive_path), 'rt', encoding='utf-8') as f:
+            chunk = []
+            for line in f:
+                chunk.append(json.loads(line))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    def page(self, archive_path, before_id, limit):
+        """Up to `limit` rows older than `before_id` (all rows if None), newest first, and how many rows are older.
+
+        The file is streamed once keeping only the last `limit` matching rows, so a page never loads the round."""
+        window = deque(maxlen=limit)
+        older = 0
+        for chunk in self.chunks(archive_path, EXPORT_CHUNK_ROWS):
+            for row in chunk:
+                if before_id is not None and row['id'] >= before_id:
+                    # Rows are in id order, nothing after this belongs to the page
+                    return list(reversed(window)), older
+                window.append(row)
+                older += 1
+        return list(reversed(window)), older
+
+    def delete(self, archive_path):
+        path = os.path.join(self.directory, archive_path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def drop_period(self, period):
+        """Delete every archived round that started in `period` (YYYY-MM) along with its directory."""
+        period = datetime.strptime(period, '%Y-%m').strftime('%Y-%m')  # raises ValueError for anything else
+        with get_db_connection() as conn:
+            cur = conn.execute("SELECT id FROM training_round WHERE archive_path LIKE ?", (f"{period}/%",))
+            round_ids = [row['id'] for row in cur.fetchall()]
+            if round_ids:
+                placeholders = ", ".join("?" * len(round_ids))
+                conn.execute(f"DELETE FROM round_summary WHERE round_id IN ({placeholders})", round_ids)
+                conn.execute(f"DELETE FROM training_round WHERE id IN ({placeholders})", round_ids)
+            conn.commit()
+        shutil.rmtree(os.path.join(self.directory, period), ignore_errors=True)
+        for round_id in round_ids:
+            captures.delete(round_id)
+        return len(round_ids)
+
+    def stats(self):
+        return {'archived': self.archived, 'rows': self.rows}
+
+history_archive = HistoryArchive(ARCHIVE_DIR)
+
+def round_history_chunks(conn, round_info, chunk_size=1000):
+    """A round's rows (HISTORY_SELECT_COLUMNS), oldest first, from sensor_history or its archive file."""
+    if round_info['archive_path']:
+        return history_archive.chunks(round_info['archive_path'], chunk_size)
+    query = f"SELECT {HISTORY_SELECT_COLUMNS} FROM sensor_history WHERE training_round_id = ? ORDER BY id"
+    return conn.stream(query, (round_info['id'],), chunk_size)
+
+########################################
+# Live Event Bus
+########################################
+class Subscription:
+    """A subscriber's bounded inbox. `lagged` is set when events had to be dropped."""
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lagged = False
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+class EventBus:
+    """In-process pub/sub used to push accepted hits to /stream clients.
+
+    publish() never blocks: a subscriber whose queue is full loses the event
+    and is flagged as lagged so it can catch up from the database."""
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        subscription = Subscription(self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        self.published += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.lagged = True
+                self.dropped += 1
+
+    def stats(self):
+        return {'subscribers': len(self._subscribers), 'published': self.published, 'dropped': self.dropped}
+
+event_bus = EventBus(max_queue=int(os.getenv("STREAM_QUEUE_SIZE", "256")))
+
+def format_history_frame(row_id, timestamp, reed_value, event, values, max_force, level, sensor_label):
+    """Serialize one sensor_history row as an SSE frame carrying its id."""
+    data = {
+        "timestamp": timestamp,
+        "reed_value": reed_value,
+        "event": event,
+        "forces": dict(zip(FORCE_CHANNELS, values)),
+        "max_force": format_max_force(max_force, level),
+        "sensor_label": sensor_label,
+    }
+    return f"id: {row_id}\ndata: {json.dumps(data)}\n\n"
+
+def compact_history_row(row_id, timestamp, reed_value, event, values, max_force, level):
+    """One row in the /stream v2 array layout, see STREAM_V2_FIELDS."""
+    return json.dumps([row_id, timestamp, reed_value, event, list(values), max_force, level],
+                      ensure_ascii=False, separators=(',', ':'))
+
+def publish_notice(round_id, kind, data, lossy=False):
+    """Publish a non-hit event (timer_expired, waveform) for a round's viewers.
+
+    `frame` is the v1 encoding; v2 streams send `data` as an SSE event named `kind`.
+    In the ingest role notices are relayed to the web workers through the
+    history writer; lossy ones (waveform frames) are not relayed at all."""
+    payload = json.dumps(data)
+    if APP_ROLE == 'ingest':
+        # Viewers are connected to the web workers, which pick this up in RoleSync.tail
+        if not lossy:
+            history_writer.submit_notice(round_id, kind, payload)
+        return
+    # v1 pages only understand timer_expired as a plain message; anything newer is a named event
+    frame = f"data: {payload}\n\n" if kind == 'timer_expired' else f"event: {kind}\ndata: {payload}\n\n"
+    event_bus.publish({'id': None, 'round_id': round_id, 'kind': kind, 'data': payload, 'frame': frame, 'lossy': lossy})
+
+def publish_presence(entry, online):
+    """Push a sensor's online/offline transition to /online/stream viewers."""
+    if APP_ROLE == 'web':
+        return  # web workers only mirror presence; the ingest process reports the transitions
+    publish_notice(None, 'presence', {'sensor_id': entry.sensor_id, 'online': online, 'last_seen': entry.last_seen_text})
+
+presence.on_change = publish_presence
+
+def publish_history_rows(ids, rows):
+    with metrics.time('sse_push'):
+        _publish_history_rows(ids, rows)
+
+def _publish_history_rows(ids, rows):
+    # Serialize once here so the cost does not grow with the number of viewers
+    sensor_label = config_cache.snapshot().labels
+    for row_id, row in zip(ids, rows):
+        timestamp, reed_value, event = row[:3]
+        values = row[3:3 + len(FORCE_COLUMNS)]
+        max_force, level, round_id = row[3 + len(FORCE_COLUMNS):]
+        event_bus.publish({
+            'id': row_id,
+            'round_id': round_id,
+            'frame': format_history_frame(row_id, timestamp, reed_value, event, values, max_force, level, sensor_label),
+            'compact': compact_history_row(row_id, timestamp, reed_value, event, values, max_force, level)
+        })
+
+history_writer.on_commit = publish_history_rows
+
+########################################
+# Ingest Pipeline
+########################################
+class IngestPipeline:
+    """Decouples the MQTT network loop from message processing.
+
+    submit() only queues the raw (topic, payload, recv_ts). Each message is
+    routed to one of `workers` threads by the sensor id at the end of the
+    topic, so messages from the same sensor are always handled in arrival
+    order. A full worker queue drops the message rather than stalling paho."""
+    STAGES = ('queue', 'decode', 'map', 'persist')
+
+    def __init__(self, handler, workers=2, max_queue=5000):
+        self.handler = handler
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(max(1, workers))]
+        self._lock = threading.Lock()
+        self._threads = []
+        self.timers = {stage: metrics.timer(stage) for stage in self.STAGES}
+        self.received = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index, inbox in enumerate(self._queues):
+                thread = threading.Thread(target=self._run, args=(inbox,), name=f"ingest-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, topic, payload, recv_ts):
+        if not self._threads:
+            self.start()
+        self.received += 1
+        sensor_id = sensor_id_from_topic(topic)
+        inbox = self._queues[hash(sensor_id) % len(self._queues)]
+        try:
+            inbox.put_nowait((topic, payload, recv_ts, time.perf_counter()))
+        except queue.Full:
+            self.dropped += 1
+
+    def observe(self, stage, started):
+        """Record the time since `started` for a stage and return the new start mark."""
+        now = time.perf_counter()
+        self.timers[stage].add(now - started)
+        return now
+
+    def wait_idle(self, timeout=5.0):
+        """Block until every queued message has been processed (used by stop and benchmarks)."""
+        deadline = time.monotonic() + timeout
+        for inbox in self._queues:
+            while inbox.unfinished_tasks:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.001)
+        return True
+
+    def _run(self, inbox):
+        while True:
+            topic, payload, recv_ts, queued_at = inbox.get()
+            try:
+                self.observe('queue', queued_at)
+                self.handler(topic, payload, recv_ts)
+            finally:
+                inbox.task_done()
+
+    def stats(self):
+        return {
+            'workers': len(self._queues),
+            'received': self.received,
+            'dropped': self.dropped,
+            'queue_depth': [inbox.qsize() for inbox in self._queues],
+            'stages': {stage: timer.stats() for stage, timer in self.timers.items()}
+        }
+
+########################################
+# Sensor Payload Decoding
+########################################
+# Binary payload v1, little endian, 22 bytes:
+#   magic "EB", version, flags (bit 0 = critical), seq (uint32),
+#   device_ts (uint32 ms since boot), reed (uint16), A0 A1 A3 A4 (int16)
+PAYLOAD_MAGIC = b"EB"
+PAYLOAD_VERSION = 1
+PAYLOAD_V1 = struct.Struct("<2sBBIIH4h")
+FLAG_CRITICAL = 0x01
+
+SensorReading = namedtuple('SensorReading', 'reed values critical seq device_ts')
+
+def decode_payload(raw_payload):
+    """Decode a sensor message into a SensorReading.
+
+    Binary frames are recognised by their magic bytes and unpacked straight
+    into a tuple; anything else is treated as the legacy JSON payload
+    {"reed": int, "critical": bool, "forces": {"A0": int, ...}}, which has
+    no seq/device_ts. Raises ValueError on a malformed message."""
+    view = memoryview(raw_payload)
+    if view[:2] == PAYLOAD_MAGIC:
+        if len(view) < 3 or view[2] != PAYLOAD_VERSION:
+            raise ValueError(f"Unsupported binary payload version {view[2] if len(view) > 2 else None}")
+        if len(view) != PAYLOAD_V1.size:
+            raise ValueError(f"Binary payload is {len(view)} bytes, expected {PAYLOAD_V1.size}")
+        _, _, flags, seq, device_ts, reed, *values = PAYLOAD_V1.unpack_from(view)
+        return SensorReading(reed, tuple(values), bool(flags & FLAG_CRITICAL), seq, device_ts)
+    payload = json.loads(bytes(raw_payload))
+    return SensorReading(payload.get("reed", None), forces_to_values(payload.get("forces", {})),
+                         bool(payload.get("critical", False)), None, None)
+
+########################################
+# Multi-sensor Fusion
+########################################
+FUSION_REORDER_MS = int(os.getenv("FUSION_REORDER_MS", "100"))
+FUSION_RESYNC_SECONDS = 2.0  # clock offset jump treated as a device reboot or device_ts wrap
+
+class SensorFusion:
+    """Merges the hits of fused rounds into one stream ordered by device time.
+
+    Every device stamps readings with its own ms-since-boot clock, so each
+    sensor gets an offset onto the wall clock: the smallest recv_ts - device_ts
+    seen, i.e. the least delayed message. Hits wait in a single heap until
+    `window` seconds past their event time and then go to the history writer
+    in event time order, so a hit delayed on one device still lands before a
+    later one from another. Readings without device_ts (JSON) use recv_ts.
+    A hit that arrives after later ones were already written is counted as
+    late and written straight away."""
+    def __init__(self, window):
+        self.window = window
+        self._cond = threading.Condition()
+        self._heap = []        # (event time, seq, round_id, row, position)
+        self._seq = itertools.count()
+        self._offsets = {}     # sensor_id -> wall clock minus device clock, seconds
+        self._released = {}    # round_id -> event time of the last hit handed on
+        self._thread = None
+        self.merged = 0
+        self.late = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sensor-fusion", daemon=True)
+                self._thread.start()
+
+    def event_time(self, sensor_id, reading, recv_ts):
+        """Wall clock time of a reading (called from the one ingest worker that owns the sensor)."""
+        if reading.device_ts is None:
+            return recv_ts
+        device_time = reading.device_ts / 1000.0
+        offset = self._offsets.get(sensor_id)
+        candidate = recv_ts - device_time
+        if offset is None or candidate < offset or candidate - offset > FUSION_RESYNC_SECONDS:
+            offset = self._offsets[sensor_id] = candidate
+        return device_time + offset
+
+    def submit(self, round_id, event_time, row, position):
+        self.start()
+        with self._cond:
+            if event_time < self._released.get(round_id, event_time):
+                self.late += 1
+                self._hand_on(round_id, event_time, row, position)
+                return
+            seq = next(self._seq)
+            heapq.heappush(self._heap, (event_time, seq, round_id, row, position))
+            if self._heap[0][1] == seq:
+                # New earliest hit: the thread may be sleeping towards a later one
+                self._cond.notify()
+
+    def flush(self, round_id):
+        """Hand on every buffered hit of a round now (the round is stopping)."""
+        with self._cond:
+            pending = sorted(entry for entry in self._heap if entry[2] == round_id)
+            if pending:
+                self._heap = [entry for entry in self._heap if entry[2] != round_id]
+                heapq.heapify(self._heap)
+            for event_time, _, _, row, position in pending:
+                self._hand_on(round_id, event_time, row, position)
+            self._released.pop(round_id, None)
+
+    def _hand_on(self, round_id, event_time, row, position):
+        # Called with the lock held, so hits of a round reach the writer in the order they leave the heap
+        self._released[round_id] = max(event_time, self._released.get(round_id, event_time))
+        self.merged += 1
+        if history_writer.submit(row, position):
+            metrics.inc('messages_total', outcome='accepted')
+        else:
+            self.dropped += 1
+            metrics.inc('messages_total', outcome='dropped')
+
+    def _run(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] + self.window - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                event_time, _, round_id, row, position = heapq.heappop(self._heap)
+                self._hand_on(round_id, event_time, row, position)
+
+    def stats(self):
+        return {'buffered': len(self._heap), 'sensors': len(self._offsets), 'merged': self.merged,
+                'late': self.late, 'dropped': self.dropped}
+
+fusion = SensorFusion(window=FUSION_REORDER_MS / 1000.0)
+
+########################################
+# Raw Waveform Capture
+########################################
+# Raw sample batch v1 on espboxing/sensors/<id>/raw, little endian:
+#   18-byte header: magic "EW", version, flags, seq (uint32),
+#   device_ts (uint32 ms of the first sample), sample_rate (uint16 Hz),
+#   count (uint16), reed (uint16)
+#   then `count` rows of A0 A1 A3 A4 (int16)
+RAW_MAGIC = b"EW"
+RAW_VERSION = 1
+RAW_HEADER_V1 = struct.Struct("<2sBBIIHHH")
+RAW_TOPIC_SUFFIX = "/raw"
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "captures")
+CAPTURE_VIEW_HZ = int(os.getenv("CAPTURE_VIEW_HZ", "50"))  # live view resolution
+
+RawBatch = namedtuple('RawBatch', 'seq device_ts sample_rate count reed samples')
+
+def decode_raw_batch(raw_payload):
+    """Split a raw sample batch into its header fields and the sample bytes (not copied)."""
+    view = memoryview(raw_payload)
+    if len(view) < RAW_HEADER_V1.size or view[:2] != RAW_MAGIC:
+        raise ValueError("Not a raw sample batch")
+    _, version, _, seq, device_ts, sample_rate, count, reed = RAW_HEADER_V1.unpack_from(view)
+    if version != RAW_VERSION:
+        raise ValueError(f"Unsupported raw batch version {version}")
+    expected = RAW_HEADER_V1.size + count * len(FORCE_CHANNELS) * 2
+    if len(view) != expected or not sample_rate:
+        raise ValueError(f"Raw batch is {len(view)} bytes at {sample_rate} Hz, expected {expected}")
+    return RawBatch(seq, device_ts, sample_rate, count, reed, view[RAW_HEADER_V1.size:])
+
+class RoundCapture:
+    """An open capture: the append-only sample file of one round plus its peak detector."""
+    def __init__(self, round_id, path, sample_rate, started, detector):
+        self.round_id = round_id
+        self.path = path
+        self.sample_rate = sample_rate
+        self.started = started  # wall clock time of the first sample
+        self.detector = detector
+        self.file = open(path, 'ab')
+        self.samples = 0
+
+class CaptureStore:
+    """Per-round raw sample files under CAPTURE_DIR.
+
+    round_<id>.bin holds int16 rows of FORCE_CHANNELS in arrival order and is
+    only ever appended to; round_<id>.json records the sample rate and start
+    time needed to put the rows on a clock. Reads memory-map the .bin file."""
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._captures = {}
+        self.batches = 0
+        self.samples = 0
+
+    def paths(self, round_id):
+        base = os.path.join(self.directory, f"round_{round_id}")
+        return base + ".bin", base + ".json"
+
+    def open(self, active_round, batch, recv_ts):
+        capture = self._captures.get(active_round.round_id)
+        if capture is not None:
+            return capture
+        with self._lock:
+            capture = self._captures.get(active_round.round_id)
+            if capture is None:
+                os.makedirs(self.directory, exist_ok=True)
+                data_path, meta_path = self.paths(active_round.round_id)
+                started = recv_ts - batch.count / batch.sample_rate
+                with open(meta_path, 'w') as f:
+                    json.dump({'round_id': active_round.round_id, 'sensor_id': active_round.sensor_id,
+                               'channels': FORCE_CHANNELS, 'sample_rate': batch.sample_rate,
+                               'started': started, 'device_ts': batch.device_ts}, f)
+                import analytics
+                mapping = active_round.mapping
+                # No level range left means no force can be a hit
+                detector = analytics.PeakDetector(mapping.channels, min(mapping.lows, default=float('inf')))
+                capture = RoundCapture(active_round.round_id, data_path, batch.sample_rate, started, detector)
+                self._captures[active_round.round_id] = capture
+        return capture
+
+    def append(self, capture, batch):
+        capture.file.write(batch.samples)
+        capture.file.flush()  # readers memory-map the file
+        capture.samples += batch.count
+        self.batches += 1
+        self.samples += batch.count
+
+    def close(self, round_id):
+        with self._lock:
+            capture = self._captures.pop(round_id, None)
+        if capture is not None:
+            capture.file.close()
+
+    def delete(self, round_id):
+        self.close(round_id)
+        for path in self.paths(round_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def metadata(self, round_id):
+        data_path, meta_path = self.paths(round_id)
+        if not os.path.exists(meta_path) or not os.path.exists(data_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def stats(self):
+        return {'open': len(self._captures), 'batches': self.batches, 'samples': self.samples}
+
+captures = CaptureStore(CAPTURE_DIR)
+
+def process_raw_batch(sensor_id, raw_payload, recv_ts):
+    """Store a raw sample batch, turn detected peaks into hits and publish a downsampled view."""
+    import analytics
+    batch = decode_raw_batch(raw_payload)
+    active_round = sessions.for_sensor(sensor_id)
+    mapping = active_round.mapping if active_round is not None else None
+    if mapping is None:
+        metrics.inc('raw_batches_total', outcome='no_round')
+        return
+    if active_round.sensor_maps:
+        # A capture file holds one device's samples; fused rounds record hits only
+        metrics.inc('raw_batches_total', outcome='fused_round')
+        return
+    capture = captures.open(active_round, batch, recv_ts)
+    first_sample = capture.samples
+    with metrics.time('capture_write'):
+        captures.append(capture, batch)
+    metrics.inc('raw_batches_total', outcome='captured')
+
+    samples = analytics.samples_from_bytes(batch.samples, len(FORCE_CHANNELS))
+    for index, values in capture.detector.feed(samples, batch.reed):
+        result = classify_hit(mapping, values, batch.reed)
+        if result is None:
+            continue
+        position, event, max_force, level = result
+        hit_time = capture.started + index / capture.sample_rate
+        timestamp = datetime.fromtimestamp(hit_time).strftime('%Y-%m-%d %H:%M:%S')
+        if history_writer.submit((timestamp, batch.reed, event) + values + (max_force, level, active_round.round_id),
+                                 position):
+            metrics.inc('messages_total', outcome='accepted')
+
+    if APP_ROLE == 'ingest':
+        return  # live waveform viewers are on the web workers, which only get durable notices
+    # Min-max buckets keep every spike visible at a fraction of the sample rate
+    bucket = max(1, batch.sample_rate // CAPTURE_VIEW_HZ)
+    mins, maxs = analytics.minmax_downsample(samples, bucket)
+    frame = {
+        'round_id': active_round.round_id,
+        't': round(first_sample / capture.sample_rate, 4),
+        'dt': bucket / capture.sample_rate,
+        'channels': FORCE_CHANNELS,
+        'min': mins.tolist(),
+        'max': maxs.tolist()
+    }
+    # Lossy: a lagging viewer just misses some of the live waveform
+    publish_notice(active_round.round_id, 'waveform', frame, lossy=True)
 
 ########################################
 # MQTT Subscriber Setup
@@ -169,168 +2266,465 @@ MQTT_PORT = 1883
 MQTT_TOPIC = "espboxing/sensors/#"
 
 def on_connect(client, userdata, flags, rc):
-    print("MQTT connected with result code " + str(rc))
+    logger.info("MQTT connected with result code %s", rc)
     client.subscribe(MQTT_TOPIC)
 
+def sensor_id_from_topic(topic):
+    # "espboxing/sensors/<id>" carries hits, "espboxing/sensors/<id>/raw" raw sample batches
+    if topic.endswith(RAW_TOPIC_SUFFIX):
+        topic = topic[:-len(RAW_TOPIC_SUFFIX)]
+    return topic.rsplit('/', 1)[-1]
+
 def on_message(client, userdata, msg):
-    topic = msg.topic  # e.g., "espboxing/sensors/64E833ACC838652B"
+    # Receive stage: runs on the paho network thread, so it only queues the raw message
+    ingest_pipeline.submit(msg.topic, msg.payload, time.time())
+
+def process_message(topic, raw_payload, recv_ts):
+    """Decode, map, classify and persist one sensor message (runs on an ingest worker)."""
+    # topic e.g., "espboxing/sensors/64E833ACC838652B"
     try:
-        sensor_id_in_topic = topic.split('/')[-1]
-        online_sensors[sensor_id_in_topic] = time.time()
-
-        payload = json.loads(msg.payload.decode())
-        # Expected payload: {"reed": int, "critical": bool, "forces": {"A0": int,"A1": int ...}}
-        reed_value = payload.get("reed", None)
-        forces_json = payload.get("forces", {})
-        forces_json_str = json.dumps(forces_json)
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"Received message: {topic} - {payload}")
-        
-        # Get the configured sensor id from settings
-        with get_db_connection() as conn:
-            cur = conn.execute("SELECT sensor_id, map_force_position FROM training_round WHERE id = (?)", (current_training_round_id,))
-            row = cur.fetchone()
-            config_sensor_id = row['sensor_id'] if row else None
-            event = "Head" if payload.get("critical", True) else "Body"
-            map_force_position = row['map_force_position'] if row else None
-            map_force_position_json = json.loads(map_force_position) if map_force_position else None
-            sensor_value_range_min1 = int(conn.execute("SELECT value FROM config WHERE key = 'sensor_value_range_min1'").fetchone()[0])
-            sensor_value_range_min2 = int(conn.execute("SELECT value FROM config WHERE key = 'sensor_value_range_min2'").fetchone()[0])
-            sensor_value_range_min3 = int(conn.execute("SELECT value FROM config WHERE key = 'sensor_value_range_min3'").fetchone()[0])
-            sensor_value_range_max1 = int(conn.execute("SELECT value FROM config WHERE key = 'sensor_value_range_max1'").fetchone()[0])
-            sensor_value_range_max2 = int(conn.execute("SELECT value FROM config WHERE key = 'sensor_value_range_max2'").fetchone()[0])
-            sensor_value_range_max3 = int(conn.execute("SELECT value FROM config WHERE key = 'sensor_value_range_max3'").fetchone()[0])
-            print(f"Sensor ID: {config_sensor_id}, Map Force Position: {map_force_position_json}")
-            # Map forces to positions
-            pos1, pos2, pos3, pos4 = None, None, None, None
-            if map_force_position_json:
-                try:
-                    pos1 = forces_json["A" + map_force_position_json[0]] if not reed_value and map_force_position_json[0] != '' else 0
-                    pos2 = forces_json["A" + map_force_position_json[1]] if map_force_position_json[1] != '' else 0
-                    pos3 = forces_json["A" + map_force_position_json[2]] if map_force_position_json[2] != '' else 0
-                    pos4 = forces_json["A" + map_force_position_json[3]] if map_force_position_json[3] != '' else 0
-
-                    print(f"Sensor positions: {pos1}, {pos2}, {pos3}, {pos4}")
-
-                    # find the maximum force
-                    max_force = max(pos1, pos2, pos3, pos4) if all(x is not None for x in [pos1, pos2, pos3, pos4]) else 0
-                    max_force_str = str(max_force)
-                    # check maximum force in the range
-                    if sensor_value_range_min1 <= max_force <= sensor_value_range_max1:
-                        max_force_str += " [ ระดับ 1 ]"
-                    elif sensor_value_range_min2 <= max_force <= sensor_value_range_max2:
-                        max_force_str += " [ ระดับ 2 ]"
-                    elif sensor_value_range_min3 <= max_force <= sensor_value_range_max3:
-                        max_force_str += " [ ระดับ 3 ]"
-                    else:
-                        max_force_str = "Out of range"
-                    
-                    # Map max force to the corresponding position
-                    if max_force == pos1:
-                        event = conn.execute("SELECT value FROM config WHERE key = 'sensor_label1'").fetchone()[0]
-                    elif max_force == pos2:
-                        event = conn.execute("SELECT value FROM config WHERE key = 'sensor_label2'").fetchone()[0]
-                    elif max_force == pos3:
-                        event = conn.execute("SELECT value FROM config WHERE key = 'sensor_label3'").fetchone()[0]
-                    elif max_force == pos4:
-                        event = conn.execute("SELECT value FROM config WHERE key = 'sensor_label4'").fetchone()[0]
-                    else:
-                        event = "ไม่พบตำแหน่ง"
-                    
-                except Exception as e:
-                    print("Mapping error:", e)
+        stage_start = time.perf_counter()
+        sensor_id_in_topic = sensor_id_from_topic(topic)
+        sensor_presence = presence.seen(sensor_id_in_topic, recv_ts)
+        metrics.inc('messages_total', outcome='received')
+        if topic.endswith(RAW_TOPIC_SUFFIX):
+            process_raw_batch(sensor_id_in_topic, raw_payload, recv_ts)
+            return
 
-        # Record sensor data only if sensor id matches and a round is active.
-        if sensor_id_in_topic == config_sensor_id and current_training_round_id is not None and max_force_str != "Out of range":
-            with get_db_connection() as conn:
-                conn.execute("INSERT INTO sensor_history (timestamp, reed_value, event, forces, max_force, training_round_id) VALUES (?, ?, ?, ?, ?, ?)",
-                            (timestamp, reed_value, event, forces_json_str, max_force_str, current_training_round_id))
-                conn.commit()
-            print(f"Recorded sensor data: {timestamp} - Reed:{reed_value} - {event} - {forces_json}")
+        # Binary v1 frames or legacy JSON, see decode_payload
+        reading = decode_payload(raw_payload)
+        sensor_presence.last_payload = reading
+        reed_value = reading.reed
+        values = reading.values
+        timestamp = datetime.fromtimestamp(recv_ts).strftime('%Y-%m-%d %H:%M:%S')
+        logger.debug("Received message: %s - %s", topic, reading)
+        stage_start = ingest_pipeline.observe('decode', stage_start)
+
+        # The round's mapping was compiled when it started, so this is a dict lookup plus one bisect
+        active_round = sessions.for_sensor(sensor_id_in_topic)
+        # Read once: a settings change may swap in a recompiled mapping meanwhile
+        mapping = sensor_mappings = None
+        if active_round is not None:
+            sensor_mappings = active_round.sensor_mappings
+            mapping = sensor_mappings.get(sensor_id_in_topic) if sensor_mappings is not None else active_round.mapping
+        if sensor_mappings is not None:
+            # Every message of a fused round's sensor keeps its clock offset current, hit or not
+            event_time = fusion.event_time(sensor_id_in_topic, reading, recv_ts)
+        result = None
+        if mapping is not None:
+            result = classify_hit(mapping, values, reed_value)
+            logger.debug("Sensor ID: %s, Round: %s, Result: %s", sensor_id_in_topic, active_round.round_id, result)
+        stage_start = ingest_pipeline.observe('map', stage_start)
+
+        # Record sensor data only if a round is active for this sensor and the force is in range.
+        if result is not None and sensor_mappings is not None:
+            # Fused round: merged with its other sensors in device time order, see SensorFusion
+            position, event, max_force, level = result
+            timestamp = datetime.fromtimestamp(event_time).strftime('%Y-%m-%d %H:%M:%S')
+            fusion.submit(active_round.round_id, event_time,
+                          (timestamp, reed_value, event) + position_values(mapping, values) +
+                          (max_force, level, active_round.round_id),
+                          position)
+            ingest_pipeline.observe('persist', stage_start)
+        elif result is not None:
+            position, event, max_force, level = result
+            if history_writer.submit((timestamp, reed_value, event) + values + (max_force, level, active_round.round_id),
+                                     position):
+                metrics.inc('messages_total', outcome='accepted')
+                logger.debug("Recorded sensor data: %s - Reed:%s - %s - %s", timestamp, reed_value, event, values)
+            else:
+                metrics.inc('messages_total', outcome='dropped')
+                logger.warning("Dropped sensor data, writer queue full: %s - %s", timestamp, event)
+            ingest_pipeline.observe('persist', stage_start)
+        elif active_round is not None:
+            metrics.inc('messages_total', outcome='out_of_range')
+        else:
+            metrics.inc('messages_total', outcome='no_round')
     except Exception as e:
-        print("Error in on_message:", e)
+        metrics.inc('messages_total', outcome='error')
+        # Malformed payloads are expected from misbehaving devices; tracebacks only when debugging
+        logger.warning("Error in on_message: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+
+ingest_pipeline = IngestPipeline(
+    process_message,
+    workers=int(os.getenv("INGEST_WORKERS", "2")),
+    max_queue=int(os.getenv("INGEST_QUEUE_SIZE", "5000"))
+)
+
+def mqtt_address(config):
+    try:
+        port = int(config.get('mqtt_port', MQTT_PORT))
+    except ValueError:
+        port = MQTT_PORT
+    return config.get('mqtt_broker', MQTT_BROKER), port
+
+class MqttSubscriber:
+    """Owns the paho client and its network loop.
+
+    retarget() switches broker in place: it disconnects the client, which makes
+    loop_forever() return, and run() connects the same client to the new
+    address. Messages already handed to the ingest pipeline keep being
+    processed during the swap."""
+    RETRY_SECONDS = 5
+
+    def __init__(self):
+        self.client = None
+        self.broker = None
+        self.port = None
+        self.connects = 0
+        self.retargets = 0
+
+    def run(self, broker, port):
+        import paho.mqtt.client as mqtt
+        self.broker, self.port = broker, port
+        self.client = mqtt.Client()
+        self.client.on_connect = on_connect
+        self.client.on_message = on_message
+        while True:
+            broker, port = self.broker, self.port
+            try:
+                self.client.connect(broker, port, 60)
+            except Exception as e:
+                logger.warning("MQTT connect to %s:%s failed: %s", broker, port, e)
+                time.sleep(self.RETRY_SECONDS)
+                continue
+            self.connects += 1
+            # Only returns after disconnect(); dropped connections are retried inside the loop
+            self.client.loop_forever()
+
+    def retarget(self, broker, port):
+        # Before run() starts there is nothing to switch; it reads the current config itself
+        if self.client is None or (broker, port) == (self.broker, self.port):
+            return
+        logger.info("Switching MQTT broker to %s:%s", broker, port)
+        self.broker, self.port = broker, port
+        self.retargets += 1
+        self.client.disconnect()
+
+    def stats(self):
+        return {'connects': self.connects, 'retargets': self.retargets}
+
+mqtt_subscriber = MqttSubscriber()
 
 def mqtt_thread():
-    db_ready = False
-    while not db_ready:
-        try:
-            with get_db_connection() as conn:
-                cur = conn.execute("SELECT 1 FROM config LIMIT 1")
-                db_ready = True
-                print("Database initialized, MQTT thread starting...")
-        except Exception as e:
-            print("Waiting for database to be initialized...")
-            time.sleep(2)  # Wait 2 seconds before trying again
-    
-    with get_db_connection() as conn:
-        cur = conn.execute("SELECT value FROM config WHERE key = 'mqtt_broker'")
-        row = cur.fetchone()
-        broker = row['value'] if row else MQTT_BROKER
-        cur = conn.execute("SELECT value FROM config WHERE key = 'mqtt_port'")
-        row = cur.fetchone()
-        try:
-            port = int(row['value']) if row else MQTT_PORT
-        except ValueError:
-            port = MQTT_PORT
+    # Set by Boot.run once the database is initialized and recording rounds are restored
+    boot.ready.wait()
+    logger.info("Database initialized, MQTT thread starting...")
+    mqtt_subscriber.run(*mqtt_address(config_cache.snapshot()))
 
-    client = mqtt.Client()
-    client.on_connect = on_connect
-    client.on_message = on_message
-    client.connect(broker, port, 60)
-    client.loop_forever()
+def apply_config_changes(changed, config):
+    """Apply the config keys in `changed` to the running process (see ConfigWatcher)."""
+    if changed & MQTT_CONFIG_KEYS and owns_ingest():
+        mqtt_subscriber.retarget(*mqtt_address(config))
+    if changed & MAPPING_CONFIG_KEYS:
+        # A new mapping is swapped in whole, so a hit is classified with either the old one or the new one
+        for active_round in sessions.rounds():
+            try:
+                active_round.mapping, active_round.sensor_mappings = compile_round_mappings(
+                    active_round.map_force_position, active_round.sensor_maps, config)
+            except ValueError as e:
+                logger.warning("Round %s keeps its previous mapping: %s", active_round.round_id, e)
 
 @app.context_processor
 def inject_current_year():
     from datetime import datetime
     return {'current_year': datetime.now().year}
 
-def check_timer_expired():
-    """Check if the current training session timer has expired"""
-    # If no active training, return False
-    if current_training_round_id is None:
-        return False
-        
-    with get_db_connection() as conn:
-        # Get the training end time from config
-        cur = conn.execute("SELECT stop_time FROM training_round WHERE id = (?)", (current_training_round_id,))
-        row = cur.fetchone()
-        
-        # If no stop_time or it's null/empty, return False (unlimited time)
-        if not row or not row['stop_time']:
-            return False
-            
-        end_time_str = row['stop_time']
-        
-        # Check if current time is past the end time
-        try:
-            end_time = datetime.strptime(end_time_str, '%Y-%m-%d %H:%M:%S')
-            if datetime.now() >= end_time:
-                return True
-        except (ValueError, TypeError):
-            # If we can't parse the date, assume no expiration
-            return False
-            
-    return False
+def release_round(round_id):
+    """Drop a round from this process; the ingest side also flushes everything received for it."""
+    # Only the first caller (/stop, the timer or RoleSync) releases the round
+    active_round = sessions.begin_stop(round_id)
+    if active_round is None:
+        return None
+    if not owns_ingest():
+        sessions.stop(round_id)
+        return active_round
+    round_timers.cancel(round_id)
+
+    # Queued hits still find the round while the workers drain, so they are recorded, not dropped as no_round
+    ingest_pipeline.wait_idle(timeout=1.0)
+    sessions.stop(round_id)
+    # Make sure every hit received for this round is on disk before closing it
+    fusion.flush(round_id)
+    history_writer.flush()
+    captures.close(round_id)
+    return active_round
+
+def stop_training(round_id):
+    """Stop an active training round and update database"""
+    release_round(round_id)
 
-def stop_training():
-    """Stop the current training session and update database"""
-    global current_training_round_id
-    if current_training_round_id is None:
-        return False
-        
     stop_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     with get_db_connection() as conn:
-        # Only update stop_time if it's not already set (not auto-set by timer)
-        conn.execute("""
+        # Only update stop_time if it's not already set (not auto-set by timer).
+        # Clearing `active` in the same statement stops a round only once, across processes too.
+        cur = conn.execute("""
             UPDATE training_round 
-            SET stop_time = CASE WHEN stop_time IS NULL THEN ? ELSE stop_time END 
-            WHERE id = ?
-        """, (stop_time, current_training_round_id))
+            SET stop_time = CASE WHEN stop_time IS NULL THEN ? ELSE stop_time END, active = 0
+            WHERE id = ? AND active = 1
+        """, (stop_time, round_id))
+        stopped = cur.rowcount > 0
+        if stopped:
+            finalize_round_summary(conn, round_id)
         conn.commit()
-    
-    # Reset the global training ID
-    current_training_round_id = None
-    return True
+    return stopped
+
+def expire_round(round_id):
+    """Scheduler callback: stop a timed round at its deadline and tell its viewers."""
+    if stop_training(round_id):
+        logger.info("Round %s stopped by its timer", round_id)
+        publish_notice(round_id, 'timer_expired', {'timer_expired': True, 'round_id': round_id})
+
+round_timers.on_expire = expire_round
+
+########################################
+# Process Roles
+########################################
+# `all` runs everything in one process (the default). A split deployment runs a
+# single `ingest` process (MQTT subscriber, history writer, round timers) and any
+# number of stateless `web` workers, which share active rounds, sensor presence
+# and live events with it through the database.
+APP_ROLES = ('all', 'ingest', 'web')
+APP_ROLE = os.getenv("APP_ROLE", "all")
+ROLE_SYNC_INTERVAL = float(os.getenv("ROLE_SYNC_INTERVAL", "1"))
+STREAM_TAIL_MS = int(os.getenv("STREAM_TAIL_MS", "200"))
+STREAM_TAIL_ROWS = 1000
+STREAM_EVENT_TTL = 60      # seconds a relayed notice stays in stream_event
+
+def owns_ingest():
+    """True if this process runs the MQTT subscriber, history writer and round timers."""
+    return APP_ROLE != 'web'
+
+def restore_round(row):
+    """Register an active training_round row in this process's session registry."""
+    map_force_position = json.loads(row['map_force_position']) if row['map_force_position'] else []
+    sensor_maps = json.loads(row['sensor_maps']) if row['sensor_maps'] else None
+    try:
+        mapping, sensor_mappings = compile_round_mappings(map_force_position, sensor_maps, config_cache.snapshot())
+    except ValueError as e:
+        mapping = sensor_mappings = None
+        logger.warning("Round %s has no usable force mapping: %s", row['id'], e)
+    stop_time = datetime.strptime(row['stop_time'], '%Y-%m-%d %H:%M:%S') if row['stop_time'] else None
+    active_round = ActiveRound(row['id'], row['sensor_id'], map_force_position, row['training_name'], stop_time, mapping,
+                               sensor_maps, sensor_mappings)
+    if sessions.start(active_round) and stop_time is not None and owns_ingest():
+        round_timers.schedule(row['id'], stop_time)
+
+def sensor_recording(sensor_ids):
+    """The first of `sensor_ids` a round is recording on, started by this process or another one, or None."""
+    for sensor_id in sensor_ids:
+        if sessions.for_sensor(sensor_id) is not None:
+            return sensor_id
+    with get_db_connection() as conn:
+        # Fused rounds store their sensors comma separated, so match in Python; there are only a few active rounds
+        cur = conn.execute("SELECT sensor_id FROM training_round WHERE active = 1")
+        busy = {sensor_id for row in cur.fetchall() for sensor_id in parse_sensor_ids(row['sensor_id'] or '')}
+    return next((sensor_id for sensor_id in sensor_ids if sensor_id in busy), None)
+
+class RoleSync:
+    """Keeps the processes of a split deployment in step through the database.
+
+    Every `interval` seconds each process reconciles `sessions` with the active
+    training_round rows; the ingest process also writes sensor presence and
+    prunes old notices, while web workers read the presence back. Web workers
+    additionally tail sensor_history and stream_event every `tail_interval`
+    seconds and republish new rows on their own event bus."""
+    def __init__(self, interval=1.0, tail_interval=0.2):
+        self.interval = interval
+        self.tail_interval = tail_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._presence_since = 0.0
+        self.last_history_id = None
+        self.last_event_id = None
+        self.syncs = 0
+        self.tailed = 0
+        self.errors = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, name="role-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        next_sync = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_sync:
+                    next_sync = time.monotonic() + self.interval
+                    self.sync()
+                if APP_ROLE == 'web':
+                    self.tail()
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Role sync failed: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            time.sleep(self.tail_interval if APP_ROLE == 'web' else self.interval)
+
+    def sync(self):
+        with get_db_connection() as conn:
+            if APP_ROLE == 'ingest':
+                self._publish_presence(conn)
+                conn.execute("DELETE FROM sensor_presence WHERE last_seen < ?", (time.time() - presence.timeout,))
+                conn.execute("DELETE FROM stream_event WHERE created_at < ?", (time.time() - STREAM_EVENT_TTL,))
+                conn.commit()
+            else:
+                self._load_presence(conn)
+        config_watcher.check()
+        self.sync_rounds()
+        self.syncs += 1
+
+    def sync_rounds(self):
+        """Start rounds that are active in the database and release the ones that no longer are."""
+        with get_db_connection() as conn:
+            cur = conn.execute(
+                "SELECT id, sensor_id, map_force_position, sensor_maps, training_name, stop_time FROM training_round WHERE active = 1")
+            rows = cur.fetchall()
+        active_ids = set()
+        for row in rows:
+            active_ids.add(row['id'])
+            if sessions.get(row['id']) is None:
+                restore_round(row)
+        for active_round in sessions.rounds():
+            if active_round.round_id not in active_ids:
+                release_round(active_round.round_id)
+
+    def _publish_presence(self, conn):
+        now = time.time()
+        since, self._presence_since = self._presence_since, now
+        seen = [(entry.sensor_id, entry.last_seen, entry.messages, entry.rate(now), json.dumps(entry.payload_dict()))
+                for entry in presence.changed_since(since)]
+        if seen:
+            conn.executemany("""
+                INSERT INTO sensor_presence (sensor_id, last_seen, messages, rate, last_payload) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (sensor_id) DO UPDATE SET last_seen = excluded.last_seen, messages = excluded.messages,
+                    rate = excluded.rate, last_payload = excluded.last_payload
+            """, seen)
+
+    def _load_presence(self, conn):
+        # Oldest first, so the tracker keeps its last-seen order
+        cur = conn.execute("""
+            SELECT sensor_id, last_seen, messages, rate, last_payload FROM sensor_presence
+            WHERE last_seen > ? ORDER BY last_seen
+        """, (time.time() - presence.timeout,))
+        for row in cur.fetchall():
+            presence.restore(row['sensor_id'], row['last_seen'], row['messages'], row['rate'],
+                             json.loads(row['last_payload']) if row['last_payload'] else None)
+
+    def tail(self):
+        """Republish hits and notices written since the last call on this process's event bus."""
+        columns = SensorHistoryWriter.COLUMNS
+        with get_db_connection(readonly=True) as conn:
+            if self.last_history_id is None:
+                # Start at the current end; /stream replays older rows itself
+                self.last_history_id = conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM sensor_history").fetchone()['id']
+                self.last_event_id = conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM stream_event").fetchone()['id']
+                return
+            cur = conn.execute(f"SELECT id, {', '.join(columns)} FROM sensor_history WHERE id > ? ORDER BY id LIMIT ?",
+                               (self.last_history_id, STREAM_TAIL_ROWS))
+            rows = cur.fetchall()
+            cur = conn.execute("SELECT id, round_id, kind, data FROM stream_event WHERE id > ? ORDER BY id",
+                               (self.last_event_id,))
+            notices = cur.fetchall()
+        if rows:
+            self.last_history_id = rows[-1]['id']
+            self.tailed += len(rows)
+            publish_history_rows([row['id'] for row in rows], [tuple(row[column] for column in columns) for row in rows])
+        for notice in notices:
+            self.last_event_id = notice['id']
+            publish_notice(notice['round_id'], notice['kind'], json.loads(notice['data']))
+
+    def stats(self):
+        return {'syncs': self.syncs, 'tailed': self.tailed, 'errors': self.errors}
+
+role_sync = RoleSync(interval=ROLE_SYNC_INTERVAL, tail_interval=STREAM_TAIL_MS / 1000.0)
+
+@app.before_request
+def start_web_role():
+    # gunicorn imports the app without running __main__, so each web worker starts syncing on its first request
+    if APP_ROLE == 'web' and not role_sync.running:
+        try:
+            # The ingest process created the schema; this worker only needs to know which search index it has
+            init_name_search(create=False)
+        except Exception as e:
+            logger.warning("Could not check the name search index: %s", e)
+        try:
+            role_sync.sync_rounds()
+        except Exception as e:
+            logger.warning("Could not load active rounds: %s", e)
+        role_sync.start()
+
+########################################
+# Startup
+########################################
+BOOT_WAIT_SECONDS = float(os.getenv("BOOT_WAIT_SECONDS", "30"))  # longest a request waits for startup
+
+class Boot:
+    """Startup phases, their timings and the readiness signal.
+
+    run() initializes the database and starts this role's workers, then sets
+    `ready`. The MQTT thread waits on it, and so do requests while run() is
+    still going in the background, instead of polling the database."""
+    def __init__(self):
+        self.ready = threading.Event()
+        self.booting = False
+        self.failed = False
+        self.phases = []  # (name, seconds) in order
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def start(self):
+        """run() in the background; requests wait for it."""
+        self.booting = True
+        threading.Thread(target=self.run, name="boot", daemon=True).start()
+
+    def run(self):
+        self.phases.append(('module', time.perf_counter() - MODULE_STARTED))
+        try:
+            with self.phase('init_db'):
+                init_db()
+            # Rounds that were recording when the previous process exited carry on
+            with self.phase('restore_rounds'):
+                role_sync.sync_rounds()
+            with self.phase('workers'):
+                if owns_ingest():
+                    history_writer.start()
+                    ingest_pipeline.start()
+                    round_timers.start()
+                    if ARCHIVE_AFTER_DAYS > 0:
+                        history_archive.start(ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL)
+                if APP_ROLE != 'all':
+                    role_sync.start()
+        except Exception:
+            self.failed = True
+            raise
+        self.ready.set()
+        logger.info("Started %s role in %.0f ms: %s", APP_ROLE, (time.perf_counter() - MODULE_STARTED) * 1000,
+                    ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases))
+
+    def stats(self):
+        stats = {'ready': int(self.ready.is_set()), 'failed': int(self.failed)}
+        stats.update({f'{name}_ms': round(seconds * 1000, 1) for name, seconds in self.phases})
+        return stats
+
+boot = Boot()
+
+@app.before_request
+def wait_for_boot():
+    # The server listens while Boot.run initializes the database in the background
+    if boot.booting and (boot.failed or not boot.ready.wait(BOOT_WAIT_SECONDS)):
+        return "ระบบกำลังเริ่มทำงาน กรุณาลองใหม่อีกครั้ง", 503, {'Retry-After': '5'}
 
 ########################################
 # Routes
@@ -377,26 +2771,30 @@ def settings():
         with get_db_connection() as conn:
             query_sql = ("REPLACE INTO config (key, value) VALUES (?, ?)" if USE_SQLITE else
                          "INSERT INTO config (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value")
-            conn.execute(query_sql, ('mqtt_broker', mqtt_broker))
-            conn.execute(query_sql, ('mqtt_port', mqtt_port))
-            conn.execute(query_sql, ('sensor_label1', sensor_label1))
-            conn.execute(query_sql, ('sensor_label2', sensor_label2))
-            conn.execute(query_sql, ('sensor_label3', sensor_label3))
-            conn.execute(query_sql, ('sensor_label4', sensor_label4))
-            conn.execute(query_sql, ('default_position_sensor1', default_position_sensor1))
-            conn.execute(query_sql, ('default_position_sensor2', default_position_sensor2))
-            conn.execute(query_sql, ('default_position_sensor3', default_position_sensor3))
-            conn.execute(query_sql, ('default_position_sensor4', default_position_sensor4))
-            conn.execute(query_sql, ('sensor_value_range_min1', sensor_value_range_min1))
-            conn.execute(query_sql, ('sensor_value_range_min2', sensor_value_range_min2))
-            conn.execute(query_sql, ('sensor_value_range_min3', sensor_value_range_min3))
-            conn.execute(query_sql, ('sensor_value_range_max1', sensor_value_range_max1))
-            conn.execute(query_sql, ('sensor_value_range_max2', sensor_value_range_max2))
-            conn.execute(query_sql, ('sensor_value_range_max3', sensor_value_range_max3))
-            conn.execute(query_sql, ('timer_duration', timer_duration))
-            conn.execute(query_sql, ('custom_fields', custom_fields_json))
-
+            conn.executemany(query_sql, [
+                ('mqtt_broker', mqtt_broker),
+                ('mqtt_port', mqtt_port),
+                ('sensor_label1', sensor_label1),
+                ('sensor_label2', sensor_label2),
+                ('sensor_label3', sensor_label3),
+                ('sensor_label4', sensor_label4),
+                ('default_position_sensor1', default_position_sensor1),
+                ('default_position_sensor2', default_position_sensor2),
+                ('default_position_sensor3', default_position_sensor3),
+                ('default_position_sensor4', default_position_sensor4),
+                ('sensor_value_range_min1', sensor_value_range_min1),
+                ('sensor_value_range_min2', sensor_value_range_min2),
+                ('sensor_value_range_min3', sensor_value_range_min3),
+                ('sensor_value_range_max1', sensor_value_range_max1),
+                ('sensor_value_range_max2', sensor_value_range_max2),
+                ('sensor_value_range_max3', sensor_value_range_max3),
+                ('timer_duration', timer_duration),
+                ('custom_fields', custom_fields_json)
+            ])
+            # Same transaction, so other processes never see new values under the old version
+            conn.execute("UPDATE config SET value = CAST(CAST(value AS INTEGER) + 1 AS TEXT) WHERE key = 'config_version'")
             conn.commit()
+        config_watcher.check()
         flash("MQTT configuration and custom fields updated successfully!")
         return redirect(url_for('settings'))
     else:
@@ -410,52 +2808,42 @@ def settings():
 @app.route('/get_remaining_time')
 def get_remaining_time():
     try:
-        with get_db_connection() as conn:
-            # Check if training is active first
-            if current_training_round_id is None:
-                print("Debug: No active training session")
-                return jsonify({'remaining_seconds': 0, 'status': 'no_active_session'})
-                
-            # Get the training end time
-            cur = conn.execute("SELECT stop_time FROM training_round WHERE id = (?)", (current_training_round_id,))
-            row = cur.fetchone()
-            
-            if not row or not row['stop_time']:
-                print("Debug: No stop_time in training round")
-                return jsonify({'remaining_seconds': 0, 'status': 'no_timer_config'})
-                
-            end_time_str = row['stop_time']
-            
-            # Calculate remaining time
-            try:
-                end_time = datetime.strptime(end_time_str, '%Y-%m-%d %H:%M:%S')
-                now = datetime.now()
-                remaining = max(0, (end_time - now).total_seconds())
-                
-                print(f"Debug: Timer calculation - End: {end_time}, Now: {now}, Remaining: {remaining}")
-                return jsonify({
-                    'remaining_seconds': int(remaining), 
-                    'status': 'active',
-                    'end_time': end_time_str,
-                    'current_time': now.strftime('%Y-%m-%d %H:%M:%S')
-                })
-            except (ValueError, TypeError):
-                print("Debug: Could not parse stop_time date format")
-                return jsonify({'remaining_seconds': 0, 'status': 'invalid_date_format'})
-            
+        # Check if training is active first
+        round_id = resolve_round_id(request.args.get('round_id'))
+        active_round = sessions.get(round_id) if round_id is not None else None
+        if active_round is None:
+            logger.debug("No active training session")
+            return jsonify({'remaining_seconds': 0, 'status': 'no_active_session'})
+
+        if active_round.stop_time is None:
+            logger.debug("No stop_time in training round %s", round_id)
+            return jsonify({'remaining_seconds': 0, 'status': 'no_timer_config', 'round_id': round_id})
+
+        # Calculate remaining time
+        now = datetime.now()
+        remaining = active_round.remaining_seconds(now)
+        logger.debug("Timer calculation - End: %s, Now: %s, Remaining: %s", active_round.stop_time, now, remaining)
+        return jsonify({
+            'remaining_seconds': int(remaining),
+            'status': 'active',
+            'round_id': round_id,
+            'end_time': active_round.stop_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'current_time': now.strftime('%Y-%m-%d %H:%M:%S')
+        })
     except Exception as e:
-        print(f"Debug: Error in get_remaining_time: {e}")
+        logger.exception("Error in get_remaining_time: %s", e)
         return jsonify({'remaining_seconds': 0, 'status': 'error', 'message': str(e)})
-        
+
 @app.route('/record', methods=['GET', 'POST'])
 def record():
-    global current_training_round_id, online_sensors
 
     if request.method == 'POST':
         # Fetch training details
         training_name = request.form.get('training_name', '').strip()
         recorder_name = request.form.get('recorder_name', '').strip()
-        sensor_id = request.form.get('sensor_id', '').strip()
+        # Several comma separated ids record one fused round
+        sensor_ids = parse_sensor_ids(request.form.get('sensor_id', ''))
+        sensor_id = ",".join(sensor_ids)
 
         # Get timer duration
         timer_duration = request.form.get('timer_duration', '0')
@@ -477,127 +2865,384 @@ def record():
 
         # Map forces positions
         map_force_position = [sensor_label1, sensor_label2, sensor_label3, sensor_label4]
+
+        # Fused round: each position reads its channel on the sensor picked for it (the first one by default)
+        sensor_maps = None
+        if len(sensor_ids) > 1:
+            devices = [request.form.get(f'sensor_device{n}', '').strip() or sensor_ids[0] for n in range(1, 5)]
+            unknown = [device for device in devices if device not in sensor_ids]
+            if unknown:
+                flash(f"⚠ เซ็นเซอร์ {unknown[0]} ไม่อยู่ในรายการรหัสโมดูลของรอบนี้", "warning")
+                return redirect(url_for('record'))
+            sensor_maps = {device_id: [pos if device == device_id else '' for pos, device in zip(map_force_position, devices)]
+                           for device_id in sensor_ids}
+            map_force_position = fused_round_map(map_force_position)
         
         # Process custom field values.
-        with get_db_connection() as conn:
-            cur = conn.execute("SELECT key, value FROM config")
-            rows = cur.fetchall()
-            config = {row['key']: row['value'] for row in rows}
+        config = config_cache.snapshot()
+
+        # Compile the mapping once here; on_message reuses it for every hit of the round
+        try:
+            mapping, sensor_mappings = compile_round_mappings(map_force_position, sensor_maps, config)
+        except ValueError as e:
+            mapping = sensor_mappings = None
+            flash(f"⚠ {e}", "warning")
         custom_fields_def = json.loads(config.get('custom_fields', '[]'))
         custom_values = {}
         for field in custom_fields_def:
             custom_values[field["name"]] = request.form.get(field["name"], field.get("default", ""))
         custom_values_json = json.dumps(custom_values)
+        sensor_maps_json = json.dumps(sensor_maps) if sensor_maps else None
         
-        # Start training session
-        if current_training_round_id is None:
-            start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            start_datetime = datetime.now()
+        # Start training session, one active round per sensor
+        if not sensor_ids:
+            flash("⚠ กรุณาระบุรหัสโมดูล", "warning")
+            return redirect(url_for('record'))
+        # Claim the sensors first, so two concurrent requests cannot both insert an active round for one sensor
+        busy_sensor = sessions.reserve(sensor_ids)
+        try:
+            if busy_sensor is None:
+                busy_sensor = sensor_recording(sensor_ids)
+            if busy_sensor is None:
+                start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                start_datetime = datetime.now()
             
-            # Handle timer_duration to auto-calculate stop_time if needed
-            stop_time = None
-            if timer_duration and int(timer_duration) > 0:
-                # Calculate end time by adding minutes to start time
-                end_datetime = start_datetime + timedelta(minutes=int(timer_duration))
-                stop_time = end_datetime.strftime('%Y-%m-%d %H:%M:%S')
+                # Handle timer_duration to auto-calculate stop_time if needed
+                stop_time = None
+                end_datetime = None
+                if timer_duration and int(timer_duration) > 0:
+                    # Calculate end time by adding minutes to start time
+                    end_datetime = start_datetime + timedelta(minutes=int(timer_duration))
+                    stop_time = end_datetime.strftime('%Y-%m-%d %H:%M:%S')
             
-            with get_db_connection() as conn:
-                if stop_time:
-                    query = (
-                        "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, custom_fields, start_time, stop_time) VALUES (?, ?, ?, ?, ?, ?, ?)"
-                        if USE_SQLITE else
-                        "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, custom_fields, start_time, stop_time) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id"
-                    )
-                    params = (training_name, recorder_name, sensor_id, json.dumps(map_force_position), custom_values_json, start_time, stop_time)
-                else:
-                    query = (
-                        "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, custom_fields, start_time) VALUES (?, ?, ?, ?, ?, ?, ?)"
-                        if USE_SQLITE else
-                        "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, custom_fields, start_time) VALUES (%s, %s,  %s, %s, %s, %s) RETURNING id"
-                    )
-                    params = (training_name, recorder_name, sensor_id, json.dumps(map_force_position), custom_values_json, start_time)
+                with get_db_connection() as conn:
+                    if stop_time:
+                        query = (
+                            "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, sensor_maps, custom_fields, start_time, stop_time, active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)"
+                            if USE_SQLITE else
+                            "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, sensor_maps, custom_fields, start_time, stop_time, active) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1) RETURNING id"
+                        )
+                        params = (training_name, recorder_name, sensor_id, json.dumps(map_force_position), sensor_maps_json, custom_values_json, start_time, stop_time)
+                    else:
+                        query = (
+                            "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, sensor_maps, custom_fields, start_time, active) VALUES (?, ?, ?, ?, ?, ?, ?, 1)"
+                            if USE_SQLITE else
+                            "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, sensor_maps, custom_fields, start_time, active) VALUES (%s, %s,  %s, %s, %s, %s, %s, 1) RETURNING id"
+                        )
+                        params = (training_name, recorder_name, sensor_id, json.dumps(map_force_position), sensor_maps_json, custom_values_json, start_time)
                 
-                cur = conn.execute(query, params)
-                conn.commit()
-                current_training_round_id = cur.lastrowid if USE_SQLITE else cur.fetchone()['id']
-            flash("🎯 เริ่มต้นการฝึกซ้อมแล้ว!", "success")
+                    cur = conn.execute(query, params)
+                    round_id = cur.lastrowid if USE_SQLITE else cur.fetchone()['id']
+                    conn.commit()
+                if not sessions.start(ActiveRound(round_id, sensor_id, map_force_position, training_name, end_datetime,
+                                                  mapping, sensor_maps, sensor_mappings)):
+                    # RoleSync restored another process's round on one of these sensors meanwhile
+                    with get_db_connection() as conn:
+                        conn.execute("UPDATE training_round SET active = 0, stop_time = start_time WHERE id = ?", (round_id,))
+                        conn.commit()
+                    return f"⚠ เซ็นเซอร์ {sensor_id} กำลังบันทึกรอบอื่นอยู่", 409
+                # In a split deployment the ingest process schedules the timer when it picks the round up
+                if end_datetime is not None and owns_ingest():
+                    round_timers.schedule(round_id, end_datetime)
+                flash("🎯 เริ่มต้นการฝึกซ้อมแล้ว!", "success")
+        finally:
+            sessions.unreserve(sensor_ids)
+        if busy_sensor is not None:
+            flash(f"⚠ เซ็นเซอร์ {busy_sensor} กำลังบันทึกรอบอื่นอยู่", "warning")
         return redirect(url_for('record'))
 
     # Load configuration and online sensors
-    with get_db_connection() as conn:
-        cur = conn.execute("SELECT key, value FROM config")
-        config = {row['key']: row['value'] for row in cur.fetchall()}
-        custom_fields = json.loads(config.get('custom_fields', '[]'))
-
-    threshold = time.time() - 60
-    online_list = [
-        {'sensor_id': sensor_id, 'last_seen': datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M:%S')}
-        for sensor_id, last_seen in online_sensors.items() if last_seen > threshold
-    ]
+    config = config_cache.snapshot().values
+    custom_fields = json.loads(config.get('custom_fields', '[]'))
 
-    return render_template('record.html', config=config, custom_fields=custom_fields, online_sensors=online_list, training_active=(current_training_round_id is not None))
+    online_list = presence.online()
+
+    active_rounds = sessions.rounds()
+    return render_template('record.html', config=config, custom_fields=custom_fields, online_sensors=online_list,
+                           active_rounds=active_rounds)
 
 @app.route('/stop', methods=['POST'])
 def stop():
-    if stop_training():
+    round_id = resolve_round_id(request.form.get('round_id'))
+    if round_id is not None and stop_training(round_id):
         flash("บันทึกการฝึกซ้อมเสร็จสิ้นแล้ว!")
     else:
         flash("No training round in progress!")
     return redirect(url_for('history'))
 
+STREAM_COALESCE_MS = int(os.getenv("STREAM_COALESCE_MS", "100"))
+STREAM_HEARTBEAT_S = float(os.getenv("STREAM_HEARTBEAT_S", "15"))
+STREAM_CATCH_UP_ROWS = 500  # rows per v2 frame when replaying missed hits
+STREAM_V2_FIELDS = ("id", "timestamp", "reed_value", "event", "forces", "max_force", "level")
+
+def stream_scope(scoped_round_id):
+    """Ids of the active rounds a stream follows: the requested one, or all of them."""
+    if scoped_round_id is not None:
+        return [scoped_round_id] if sessions.get(scoped_round_id) else []
+    return [r.round_id for r in sessions.rounds()]
+
+def catch_up_rows(round_ids, after_id):
+    """(id, timestamp, reed, event, values, max force, level) of hits in `round_ids` after `after_id`."""
+    if not round_ids:
+        return []
+    placeholders = ", ".join("?" * len(round_ids))
+    with metrics.time('db_read'), get_db_connection(readonly=True) as conn:
+        cur = conn.execute(f"""
+            SELECT {HISTORY_SELECT_COLUMNS}
+            FROM sensor_history
+            WHERE training_round_id IN ({placeholders}) AND id > ?
+            ORDER BY id ASC
+        """, (*round_ids, after_id))
+        rows = cur.fetchall()
+    return [(row["id"], row["timestamp"], row["reed_value"], row["event"]) + history_row_forces(row) for row in rows]
+
+def stream_meta(round_ids, heartbeat):
+    """The v2 metadata frame: everything that used to be repeated in each hit frame."""
+    config = config_cache.snapshot()
+    low_high = sorted((low, high, level) for level, (low, high) in enumerate(config.ranges, start=1))
+    rounds = []
+    for round_id in round_ids:
+        active_round = sessions.get(round_id)
+        if active_round is None:
+            continue
+        rounds.append({
+            'round_id': round_id,
+            'sensor_id': active_round.sensor_id,
+            'sensor_ids': list(active_round.sensor_ids),
+            'training_name': active_round.training_name,
+            'map_force_position': active_round.map_force_position,
+            # 'position': a fused round's hit rows hold forces in body-position order, not `channels` order
+            'force_layout': force_layout(active_round.sensor_maps),
+            'stop_time': active_round.stop_time.strftime('%Y-%m-%d %H:%M:%S') if active_round.stop_time else None,
+            'remaining_seconds': active_round.remaining_seconds()
+        })
+    data = {
+        'version': 2,
+        'channels': FORCE_CHANNELS,
+        'labels': config.labels,
+        'levels': low_high,
+        'fields': STREAM_V2_FIELDS,
+        'rounds': rounds,
+        'heartbeat': heartbeat
+    }
+    return f"event: meta\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def hits_frame(compact_rows, last_id):
+    return f"id: {last_id}\nevent: hits\ndata: {{\"rows\":[{','.join(compact_rows)}]}}\n\n"
+
 @app.route('/stream')
 def stream():
-    config = {}
-    with get_db_connection() as conn:
-        cur = conn.execute("SELECT key, value FROM config")
-        rows = cur.fetchall()
-        config = {row['key']: row['value'] for row in rows}
-    sensor_label = [
-        config.get('sensor_label1', 'หัว'),
-        config.get('sensor_label2', 'ลำตัว'),
-        config.get('sensor_label3', 'ท้อง'),
-        config.get('sensor_label4', 'ขา')
-    ]
-    
+    # EventSource sends the last id it received when it reconnects
+    try:
+        resume_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        resume_id = None
+
+    # Scope the stream to one round, or follow every active round when none is given
+    scoped_round_id = request.args.get('round_id', type=int)
+    if request.args.get('v') == '2':
+        heartbeat = min(max(request.args.get('heartbeat', STREAM_HEARTBEAT_S, type=float), 1.0), 300.0)
+        return Response(event_stream_v2(scoped_round_id, resume_id, heartbeat), mimetype="text/event-stream")
+
+    sensor_label = config_cache.snapshot().labels
+
+    def in_scope(round_id):
+        # Notices without a round (sensor presence) are for the online page only
+        return round_id is not None and scoped_round_id in (None, round_id)
+
+    def active_scope():
+        return stream_scope(scoped_round_id)
+
+    def catch_up(after_id):
+        return [(row[0], format_history_frame(*row, sensor_label)) for row in catch_up_rows(active_scope(), after_id)]
+
     def event_stream():
-        last_sent_id = 0
+        subscription = event_bus.subscribe()
+        try:
+            last_sent_id = 0
+            pending = []
+            if resume_id is not None:
+                last_sent_id = resume_id
+                pending = catch_up(resume_id)
+            while True:
+                for row_id, frame in pending:
+                    if row_id is not None:
+                        last_sent_id = row_id
+                    yield frame
+                pending = []
+
+                try:
+                    event = subscription.get(timeout=1)
+                except queue.Empty:
+                    event = None
+
+                if subscription.lagged:
+                    # Events were dropped for this client; re-read what it missed
+                    subscription.lagged = False
+                    notices = []
+                    while not subscription.queue.empty():
+                        dropped = subscription.queue.get_nowait()
+                        # Hits are re-read from the database; notices such as timer_expired are not stored there
+                        if dropped['id'] is None and not dropped.get('lossy') and in_scope(dropped['round_id']):
+                            notices.append((None, dropped['frame']))
+                    if event is not None and event['id'] is None and in_scope(event['round_id']):
+                        notices.insert(0, (None, event['frame']))
+                    pending = catch_up(last_sent_id) + notices
+                    continue
+
+                if event is None:
+                    if not active_scope():
+                        yield f"data: {json.dumps({'heartbeat': True})}\n\n"
+                elif not in_scope(event['round_id']):
+                    continue
+                elif event['id'] is None:
+                    # Round notices (timer_expired) are sent to every viewer of the round
+                    yield event['frame']
+                elif event['id'] > last_sent_id:
+                    pending = [(event['id'], event['frame'])]
+        finally:
+            event_bus.unsubscribe(subscription)
+    return Response(event_stream(), mimetype="text/event-stream")
+
+def event_stream_v2(scoped_round_id, resume_id, heartbeat):
+    """Stream protocol v2.
+
+    - `meta` once on connect (and again when the set of followed rounds or the settings change)
+      with labels, level ranges, round info and the layout of a hit row
+    - `hits` frames holding every hit that arrived within STREAM_COALESCE_MS,
+      each row an array (see STREAM_V2_FIELDS), with the last row id as the SSE id
+    - named `timer_expired` / `waveform` events
+    - an SSE comment as heartbeat after `heartbeat` seconds of silence"""
+    coalesce = STREAM_COALESCE_MS / 1000.0
+
+    def in_scope(round_id):
+        # Notices without a round (sensor presence) are for the online page only
+        return round_id is not None and scoped_round_id in (None, round_id)
+
+    def replay(after_id):
+        rows = catch_up_rows(stream_scope(scoped_round_id), after_id)
+        for start in range(0, len(rows), STREAM_CATCH_UP_ROWS):
+            chunk = rows[start:start + STREAM_CATCH_UP_ROWS]
+            yield chunk[-1][0], hits_frame([compact_history_row(*row) for row in chunk], chunk[-1][0])
+
+    def meta_changed():
+        # Labels and level ranges are in the meta frame, so settings changes resend it too
+        nonlocal scope, meta_version
+        current = stream_scope(scoped_round_id)
+        if current == scope and config_cache.version == meta_version:
+            return None
+        scope, meta_version = current, config_cache.version
+        return stream_meta(scope, heartbeat)
+
+    subscription = event_bus.subscribe()
+    try:
+        scope = stream_scope(scoped_round_id)
+        meta_version = config_cache.version
+        yield f"retry: 2000\n{stream_meta(scope, heartbeat)}"
+        last_sent_id = resume_id or 0
+        if resume_id is not None:
+            for last_sent_id, frame in replay(resume_id):
+                yield frame
+        last_write = time.monotonic()
         while True:
-            # Check if timer has expired and stop the training if needed
-            if current_training_round_id is not None and check_timer_expired():
-                # Auto-stop the training session
-                stop_training()
-                # Send a special event to notify frontend
-                yield f"data: {json.dumps({'timer_expired': True})}\n\n"
-                
-            if current_training_round_id is not None:
-                # Your existing code for fetching and sending events
-                with get_db_connection() as conn:
-                    cur = conn.execute("""
-                        SELECT id, timestamp, reed_value, event, forces, max_force
-                        FROM sensor_history 
-                        WHERE training_round_id = ? AND id > ?
-                        ORDER BY id ASC
-                    """, (current_training_round_id, last_sent_id))
-                    rows = cur.fetchall()
-                for row in rows:
-                    last_sent_id = row["id"]
-                    data = {
-                        "timestamp": row["timestamp"],
-                        "reed_value": row["reed_value"],
-                        "event": row["event"],
-                        "forces": json.loads(row["forces"]) if row["forces"] else [],
-                        "max_force": row["max_force"],
-                        "sensor_label": sensor_label,
-                    }
-                    yield f"data: {json.dumps(data)}\n\n"
+            try:
+                batch = [subscription.get(timeout=max(0.0, heartbeat - (time.monotonic() - last_write)))]
+            except queue.Empty:
+                # A round stopping or a settings change with no events behind it still reaches the client
+                yield meta_changed() or ": heartbeat\n\n"
+                last_write = time.monotonic()
+                continue
+
+            # Coalesce everything that arrives within the window into one frame
+            deadline = time.monotonic() + coalesce
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(subscription.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            wrote = False
+            notices = [event for event in batch
+                       if event['id'] is None and in_scope(event['round_id'])]
+            if subscription.lagged:
+                # Events were dropped for this client; hits are re-read from the database
+                subscription.lagged = False
+                while not subscription.queue.empty():
+                    event = subscription.queue.get_nowait()
+                    if event['id'] is None and in_scope(event['round_id']):
+                        notices.append(event)
+                notices = [event for event in notices if not event.get('lossy')]
+                for last_sent_id, frame in replay(last_sent_id):
+                    yield frame
+                    wrote = True
             else:
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-            time.sleep(1)
-    return Response(event_stream(), mimetype="text/event-stream")
+                rows = [event for event in batch
+                        if event['id'] is not None and in_scope(event['round_id']) and event['id'] > last_sent_id]
+                if rows:
+                    last_sent_id = rows[-1]['id']
+                    yield hits_frame([event['compact'] for event in rows], last_sent_id)
+                    wrote = True
+            for event in notices:
+                yield f"event: {event['kind']}\ndata: {event['data']}\n\n"
+                wrote = True
+            meta = meta_changed()
+            if meta:
+                yield meta
+                wrote = True
+
+            # Events for other rounds are not traffic for this client, so they do not put off its heartbeat
+            if wrote:
+                last_write = time.monotonic()
+    finally:
+        event_bus.unsubscribe(subscription)
 
 @app.route('/visualize_mockup')
 def visualize_mockup():
-    return render_template('visualize_mockup.html', training_active=(current_training_round_id is not None))
+    round_id = resolve_round_id(request.args.get('round_id'))
+    return render_template('visualize_mockup.html', round_id=round_id,
+                           training_active=(round_id is not None and sessions.get(round_id) is not None))
+
+HISTORY_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def page_size_arg(default):
+    size = request.args.get('page_size', default, type=int)
+    return max(1, min(size or default, MAX_PAGE_SIZE))
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+
+def name_filter_condition(column, text):
+    """SQL condition and params for a substring filter, using the FTS5 trigram index when possible."""
+    # Trigram lookups need at least three characters; shorter filters fall back to a scan
+    if NAME_SEARCH == 'fts5' and len(text) >= 3:
+        return f"id IN (SELECT rowid FROM training_round_fts WHERE {column} LIKE ?)", f"%{text}%"
+    return f"{column} LIKE ?", f"%{text}%"
+
+def round_filter_conditions(training_name_filter, sensor_id_filter):
+    """WHERE conditions and params on training_round for the /history filter form."""
+    conditions = []
+    params = []
+    
+    if training_name_filter:
+        condition, param = name_filter_condition('training_name', training_name_filter)
+        conditions.append(condition)
+        params.append(param)
+    
+    if sensor_id_filter:
+        condition, param = name_filter_condition('sensor_id', sensor_id_filter)
+        conditions.append(condition)
+        params.append(param)
+    return conditions, params
 
 @app.route('/history')
 def history():
@@ -605,52 +3250,167 @@ def history():
     sensor_id_filter = request.args.get('sensor_id', '').strip()
     sort_by = request.args.get('sort_by', 'start_time')
     sort_order = request.args.get('sort_order', 'desc').lower()
+    min_hits = request.args.get('min_hits', type=int)
+    min_peak = request.args.get('min_peak', type=int)
+    page_size = page_size_arg(HISTORY_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('cursor', ''))
 
-    allowed_columns = ['id', 'training_name', 'sensor_id', 'start_time', 'stop_time']
+    allowed_columns = ['id', 'training_name', 'sensor_id', 'start_time', 'stop_time'] + list(SUMMARY_SORT_COLUMNS)
     if sort_by not in allowed_columns:
         sort_by = 'start_time'
     if sort_order not in ['asc', 'desc']:
         sort_order = 'desc'
+    # stop_time is NULL while a round runs and rounds without hits have no summary;
+    # NULLs would break the keyset comparison
+    if sort_by == 'stop_time':
+        sort_expr = "COALESCE(stop_time, '')"
+    elif sort_by in SUMMARY_SORT_COLUMNS:
+        sort_expr = f"COALESCE(round_summary.{sort_by}, 0)"
+    else:
+        sort_expr = sort_by
 
-    query = "SELECT * FROM training_round"
-    conditions = []
-    params = []
-    
-    if training_name_filter:
-        conditions.append("training_name LIKE ?")
-        params.append(f"%{training_name_filter}%")
-    
-    if sensor_id_filter:
-        conditions.append("sensor_id LIKE ?")
-        params.append(f"%{sensor_id_filter}%")
+    query = f"""
+        SELECT training_round.*, round_summary.hit_count, round_summary.force_max,
+               round_summary.duration_seconds, {sort_expr} AS sort_value
+        FROM training_round LEFT JOIN round_summary ON round_summary.round_id = training_round.id
+    """
+    conditions, params = round_filter_conditions(training_name_filter, sensor_id_filter)
+    if min_hits:
+        conditions.append("COALESCE(round_summary.hit_count, 0) >= ?")
+        params.append(min_hits)
+    if min_peak:
+        conditions.append("COALESCE(round_summary.force_max, 0) >= ?")
+        params.append(min_peak)
+
+    # Keyset pagination: continue after the (sort value, id) of the previous page's last row
+    comparison = ">" if sort_order == 'asc' else "<"
+    if cursor and len(cursor) == 2:
+        if sort_by == 'id':
+            conditions.append(f"id {comparison} ?")
+            params.append(cursor[1])
+        else:
+            conditions.append(f"({sort_expr}, id) {comparison} (?, ?)")
+            params.extend(cursor)
     
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
     
-    query += f" ORDER BY {sort_by} {sort_order.upper()}"
+    query += f" ORDER BY {sort_expr} {sort_order.upper()}, id {sort_order.upper()} LIMIT ?"
+    params.append(page_size + 1)
     
-    with get_db_connection() as conn:
+    with metrics.time('db_read'), get_db_connection(readonly=True) as conn:
         cur = conn.execute(query, params)
         rounds = cur.fetchall()
+
+    next_cursor = None
+    if len(rounds) > page_size:
+        rounds = rounds[:page_size]
+        last = rounds[-1]
+        next_cursor = encode_cursor(last['sort_value'], last['id'])
     
-    return render_template('history.html', rounds=rounds)
+    return render_template('history.html', rounds=rounds, next_cursor=next_cursor, page_size=page_size)
+
+def round_duration_seconds(round_info):
+    """Length of a finished round from its start/stop times, or None if it is still running."""
+    try:
+        start = datetime.strptime(round_info['start_time'], '%Y-%m-%d %H:%M:%S')
+        stop = datetime.strptime(round_info['stop_time'], '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+    if stop > datetime.now():
+        return None
+    return (stop - start).total_seconds()
+
+def summarize_round_rows(round_info, rows):
+    """Per-round statistics from (timestamp, reed value, channel values, max force, level) tuples."""
+    import analytics
+    map_force_position = json.loads(round_info['map_force_position']) if round_info['map_force_position'] else []
+    data = analytics.load_round_forces(rows, position_channels(map_force_position))
+    return analytics.summarize_round(data, config_cache.snapshot().labels, round_duration_seconds(round_info))
+
+@app.route('/history/<int:round_id>/stats')
+def round_stats(round_id):
+    with metrics.time('db_read'), get_db_connection(readonly=True) as conn:
+        cur = conn.execute("SELECT * FROM training_round WHERE id = ?", (round_id,))
+        round_info = cur.fetchone()
+        if not round_info:
+            return jsonify({'error': 'round not found'}), 404
+        rows = [(row['timestamp'], row['reed_value']) + history_row_forces(row)
+                for chunk in round_history_chunks(conn, round_info) for row in chunk]
+    summary = summarize_round_rows(round_info, rows)
+    summary['round_id'] = round_id
+    return jsonify(summary)
+
+ROUND_DETAILS_PAGE_SIZE = 200
+
+WAVEFORM_MAX_POINTS = 5000
+
+@app.route('/history/<int:round_id>/waveform')
+def round_waveform(round_id):
+    """Min-max downsampled raw waveform of a captured round, optionally limited to [start, end) seconds."""
+    meta = captures.metadata(round_id)
+    if meta is None:
+        return jsonify({'error': 'no waveform captured for this round'}), 404
+    import analytics
+    samples = analytics.load_waveform(captures.paths(round_id)[0], len(meta['channels']))
+    rate = meta['sample_rate']
+    start = max(0, int(request.args.get('start', 0, type=float) * rate))
+    end = request.args.get('end', type=float)
+    end = len(samples) if end is None else min(len(samples), int(end * rate))
+    points = max(1, min(request.args.get('points', 1000, type=int), WAVEFORM_MAX_POINTS))
+    window = samples[start:max(start, end)]
+    bucket = max(1, -(-len(window) // points))
+    mins, maxs = analytics.minmax_downsample(window, bucket)
+    return jsonify({
+        'round_id': round_id,
+        'sample_rate': rate,
+        'channels': meta['channels'],
+        'start': start / rate,
+        'end': (start + len(window)) / rate,
+        'samples': len(window),
+        'dt': bucket / rate,
+        'min': mins.tolist(),
+        'max': maxs.tolist()
+    })
 
 @app.route('/history/<int:round_id>')
 def round_details(round_id):
-    with get_db_connection() as conn:
-        cur = conn.execute("SELECT * FROM config")
-        config = {row['key']: row['value'] for row in cur.fetchall()}
-
+    config = config_cache.snapshot().values
+    page_size = page_size_arg(ROUND_DETAILS_PAGE_SIZE)
+    before_id = request.args.get('before', type=int)
+    with metrics.time('db_read'), get_db_connection(readonly=True) as conn:
         cur = conn.execute("SELECT * FROM training_round WHERE id = ?", (round_id,))
         round_info = cur.fetchone()
+        first_number = None
+
+        if round_info and round_info['archive_path']:
+            sensor_events, first_number = history_archive.page(round_info['archive_path'], before_id, page_size + 1)
+        # Newest first, one page at a time, walking the (training_round_id, id) index
+        elif before_id is None:
+            cur = conn.execute(f"SELECT {HISTORY_SELECT_COLUMNS} FROM sensor_history WHERE training_round_id = ? ORDER BY id DESC LIMIT ?",
+                               (round_id, page_size + 1))
+            sensor_events = cur.fetchall()
+            cur = conn.execute("SELECT COUNT(*) AS n FROM sensor_history WHERE training_round_id = ?", (round_id,))
+        else:
+            cur = conn.execute(f"SELECT {HISTORY_SELECT_COLUMNS} FROM sensor_history WHERE training_round_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                               (round_id, before_id, page_size + 1))
+            sensor_events = cur.fetchall()
+            cur = conn.execute("SELECT COUNT(*) AS n FROM sensor_history WHERE training_round_id = ? AND id < ?", (round_id, before_id))
+        if first_number is None:
+            # Sequence number of the newest event on this page (1 = first hit of the round)
+            first_number = cur.fetchone()['n']
 
-        cur = conn.execute("SELECT * FROM sensor_history WHERE training_round_id = ? ORDER BY timestamp DESC ", (round_id,))
-        sensor_events = cur.fetchall()
+    next_before = None
+    if len(sensor_events) > page_size:
+        sensor_events = sensor_events[:page_size]
+        next_before = sensor_events[-1]['id']
 
     processed_events = []
     for row in sensor_events:
         d = dict(row)
-        d["forces_list"] = json.loads(d["forces"]) if d.get("forces") else []
+        values, max_force, level = history_row_forces(row)
+        d["forces_list"] = dict(zip(FORCE_CHANNELS, values))
+        d["max_force"] = format_max_force(max_force, level)
         processed_events.append(d)
     
     custom_fields_data = []
@@ -658,37 +3418,369 @@ def round_details(round_id):
         try:
             custom_fields_data = json.loads(round_info["custom_fields"])
         except Exception as e:
-            print("Error parsing custom_fields:", e)
+            logger.warning("Error parsing custom_fields of round %s: %s", round_id, e)
+
+    return render_template("round_details.html", round=round_info, sensor_events=processed_events, config=config,
+                           custom_fields_data=custom_fields_data, first_number=first_number,
+                           next_before=next_before, page_size=page_size)
+
+
+########################################
+# Export
+########################################
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+EXPORT_COLUMNS = ("id", "round_id", "training_name", "sensor_id", "timestamp", "reed_value", "event") + \
+    FORCE_COLUMNS + ("max_force_value", "force_level", "force_layout")
+# Fused rounds store their forces in body-position order (see fused_round_map), so a
+# fused round's own export names the force columns by position instead of by channel
+FUSED_FORCE_COLUMNS = tuple(f"force_pos{i}" for i in range(1, len(FORCE_COLUMNS) + 1))
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+def export_columns(fused):
+    """Header of an export: EXPORT_COLUMNS, with the force columns named by position for a fused round."""
+    if not fused:
+        return EXPORT_COLUMNS
+    return tuple(FUSED_FORCE_COLUMNS[FORCE_COLUMNS.index(column)] if column in FORCE_COLUMNS else column
+                 for column in EXPORT_COLUMNS)
+
+def export_rows(conditions, params):
+    """Yield chunks of EXPORT_COLUMNS tuples for every event of the rounds matching `conditions`."""
+    columns = ", ".join(f"h.{column}" for column in HISTORY_SELECT_COLUMNS.split(", "))
+    query = f"""
+        SELECT {columns}, h.training_round_id, r.training_name, r.sensor_id, r.sensor_maps
+        FROM sensor_history h JOIN training_round r ON r.id = h.training_round_id
+    """
+    if conditions:
+        query += f" WHERE h.training_round_id IN (SELECT id FROM training_round WHERE {' AND '.join(conditions)})"
+    query += " ORDER BY h.training_round_id, h.id"
+
+    def export_chunk(rows, round_info):
+        chunk = []
+        for row in rows:
+            info = round_info or row
+            values, max_force, level = history_row_forces(row)
+            chunk.append((row['id'], round_info['id'] if round_info else row['training_round_id'], info['training_name'],
+                          info['sensor_id'], row['timestamp'], row['reed_value'], row['event']) +
+                         tuple(values) + (max_force, level, force_layout(info['sensor_maps'])))
+        return chunk
+
+    with get_db_connection(readonly=True) as conn:
+        for rows in conn.stream(query, params, EXPORT_CHUNK_ROWS):
+            yield export_chunk(rows, None)
+
+        # Archived rounds have no rows left in sensor_history; they follow from their files
+        archived_query = ("SELECT id, training_name, sensor_id, sensor_maps, archive_path FROM training_round "
+                          "WHERE archive_path IS NOT NULL")
+        if conditions:
+            archived_query += " AND " + " AND ".join(conditions)
+        cur = conn.execute(archived_query + " ORDER BY id", params)
+        for round_info in cur.fetchall():
+            for rows in round_history_chunks(conn, round_info, EXPORT_CHUNK_ROWS):
+                yield export_chunk(rows, round_info)
 
-    return render_template("round_details.html", round=round_info, sensor_events=processed_events, config=config, custom_fields_data=custom_fields_data)
+def export_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the Thai labels as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
 
+class _ByteSink:
+    """Write-only file for pyarrow writers; the response generator drains it after every batch."""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_arrow_schema(pa, columns):
+    fields = [("id", pa.int64()), ("round_id", pa.int64()), ("training_name", pa.string()),
+              ("sensor_id", pa.string()), ("timestamp", pa.timestamp('s')), ("reed_value", pa.int32()),
+              ("event", pa.string())]
+    fields += [(column, pa.int32()) for column in columns[len(fields):len(fields) + len(FORCE_COLUMNS)]]
+    fields += [("max_force_value", pa.int32()), ("force_level", pa.int8()), ("force_layout", pa.string())]
+    return pa.schema(fields)
+
+def export_columnar(chunks, file_format, columns):
+    """Parquet (one row group per chunk) or Arrow IPC stream (one record batch per chunk)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = export_arrow_schema(pa, columns)
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema) if file_format == 'parquet' else pa.ipc.new_stream(sink, schema)
+    for chunk in chunks:
+        columns = list(zip(*chunk))
+        arrays = [pa.array(column, type=field.type) if field.name != 'timestamp'
+                  else pa.array(column, type=pa.string()).cast(field.type)
+                  for column, field in zip(columns, schema)]
+        if file_format == 'parquet':
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        else:
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def export_response(conditions, params, filename, fused=False):
+    file_format = request.args.get('format', 'csv').lower()
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format {file_format}, use one of {', '.join(EXPORT_FORMATS)}"}), 400
+    mimetype, extension = EXPORT_FORMATS[file_format]
+    chunks = export_rows(conditions, params)
+    columns = export_columns(fused)
+    if file_format == 'csv':
+        body = export_csv(chunks, columns)
+    else:
+        # pyarrow is optional and only needed for the columnar formats
+        if importlib.util.find_spec("pyarrow") is None:
+            return jsonify({'error': f"{file_format} export requires the pyarrow package"}), 501
+        body = export_columnar(chunks, file_format, columns)
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}.{extension}"'})
+
+@app.route('/history/<int:round_id>/export')
+def export_round(round_id):
+    """All events of one round as CSV, Parquet or Arrow (?format=)."""
+    with get_db_connection(readonly=True) as conn:
+        round_info = conn.execute("SELECT sensor_maps FROM training_round WHERE id = ?", (round_id,)).fetchone()
+    fused = round_info is not None and bool(round_info['sensor_maps'])
+    return export_response(["id = ?"], [round_id], f"round_{round_id}", fused)
+
+@app.route('/export')
+def export():
+    """Events of every round matching the /history filters, streamed as CSV, Parquet or Arrow (?format=)."""
+    conditions, params = round_filter_conditions(request.args.get('training_name', '').strip(),
+                                                 request.args.get('sensor_id', '').strip())
+    return export_response(conditions, params, f"training_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
 
 @app.route('/delete/<int:round_id>', methods=['POST'])
 def delete_round(round_id):
     with get_db_connection() as conn:
+        cur = conn.execute("SELECT archive_path FROM training_round WHERE id = ?", (round_id,))
+        round_info = cur.fetchone()
         conn.execute("DELETE FROM sensor_history WHERE training_round_id = ?", (round_id,))
+        conn.execute("DELETE FROM round_summary WHERE round_id = ?", (round_id,))
         conn.execute("DELETE FROM training_round WHERE id = ?", (round_id,))
         conn.commit()
+    captures.delete(round_id)
+    if round_info and round_info['archive_path']:
+        history_archive.delete(round_info['archive_path'])
     flash("Training round and associated sensor events deleted successfully!")
     return redirect(url_for('history'))
 
 @app.route('/online')
 def online():
-    threshold = time.time() - 60
-    online_list = []
-    for sensor_id, last_seen in online_sensors.items():
-        if last_seen > threshold:
-            online_list.append({
-                'sensor_id': sensor_id,
-                'last_seen': datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M:%S')
-            })
-    return render_template('online.html', online_list=online_list)
+    return render_template('online.html', online_list=presence.online(), timeout=int(presence.timeout))
 
-if __name__ == '__main__':
+def presence_snapshot_frame():
+    data = json.dumps({'sensors': presence.online()}, ensure_ascii=False)
+    return f"event: snapshot\ndata: {data}\n\n"
+
+@app.route('/online/stream')
+def online_stream():
+    """SSE feed for the online page: a `snapshot` of every online sensor on connect and
+    every STREAM_HEARTBEAT_S seconds, and a `presence` event for each online/offline transition."""
+    def event_stream():
+        subscription = event_bus.subscribe()
+        try:
+            yield f"retry: 2000\n{presence_snapshot_frame()}"
+            while True:
+                try:
+                    event = subscription.get(timeout=STREAM_HEARTBEAT_S)
+                except queue.Empty:
+                    yield presence_snapshot_frame()
+                    continue
+                if subscription.lagged:
+                    # Transitions were dropped for this client; send the whole list instead
+                    subscription.lagged = False
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    yield presence_snapshot_frame()
+                elif event.get('kind') == 'presence':
+                    yield event['frame']
+        finally:
+            event_bus.unsubscribe(subscription)
+    return Response(event_stream(), mimetype="text/event-stream")
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text format: message counters, stage latencies, sensor rates and component stats."""
+    text = metrics.render([
+        ('ingest', ingest_pipeline.stats()),
+        ('history_writer', history_writer.stats()),
+        ('event_bus', event_bus.stats()),
+        ('config_cache', config_cache.stats()),
+        ('config_watcher', config_watcher.stats()),
+        ('mqtt', mqtt_subscriber.stats()),
+        ('db_pool', get_db_pool().stats()),
+        ('db_read_pool', get_db_pool(readonly=True).stats() if USE_SQLITE else {}),
+        ('active_rounds', {'count': len(sessions)}),
+        ('round_timers', round_timers.stats()),
+        ('captures', captures.stats()),
+        ('history_archive', history_archive.stats()),
+        ('role_sync', role_sync.stats()),
+        ('boot', boot.stats()),
+        ('fusion', fusion.stats()),
+        ('presence', presence.stats())
+    ], presence.rates(time.time()))
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+########################################
+# CLI Commands
+########################################
+@app.cli.command('backfill-forces')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows converted per transaction.')
+@click.option('--drop-legacy', is_flag=True, help='Clear the forces/max_force text of converted rows afterwards.')
+def backfill_forces_command(batch_size, drop_legacy):
+    """Fill the numeric force columns of sensor_history rows written before they existed."""
+    import analytics
+    init_db()
+    update_sql = ("UPDATE sensor_history SET " + ", ".join(f"{column} = ?" for column in FORCE_COLUMNS) +
+                  ", max_force_value = ?, force_level = ? WHERE id = ?")
+    last_id = 0
+    converted = 0
+    while True:
+        with get_db_connection() as conn:
+            cur = conn.execute("""
+                SELECT id, forces, max_force FROM sensor_history
+                WHERE max_force_value IS NULL AND id > ?
+                ORDER BY id ASC LIMIT ?
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                forces = json.loads(row['forces']) if row['forces'] else {}
+                max_force, level = analytics.parse_max_force(row['max_force'])
+                updates.append(forces_to_values(forces) + (max_force, level, row['id']))
+            conn.executemany(update_sql, updates)
+            conn.commit()
+        last_id = rows[-1]['id']
+        converted += len(rows)
+        print(f"Backfilled {converted} rows (up to id {last_id})")
+
+    if drop_legacy:
+        with get_db_connection() as conn:
+            conn.execute("UPDATE sensor_history SET forces = NULL, max_force = NULL WHERE max_force_value IS NOT NULL")
+            conn.commit()
+        if USE_SQLITE:
+            # Give the freed space back to the filesystem
+            with get_db_connection() as conn:
+                conn.conn.execute("VACUUM")
+        print("Cleared legacy forces/max_force text")
+    print(f"Done, {converted} rows backfilled")
+
+@app.cli.command('rebuild-round-summaries')
+@click.option('--round-id', type=int, help='Only rebuild this round.')
+def rebuild_round_summaries_command(round_id):
+    """Recompute round_summary from sensor_history (for rounds recorded before the table existed)."""
+    init_db()
+    with get_db_connection() as conn:
+        if round_id is None:
+            cur = conn.execute("SELECT id, map_force_position, stop_time, archive_path FROM training_round ORDER BY id")
+        else:
+            cur = conn.execute("SELECT id, map_force_position, stop_time, archive_path FROM training_round WHERE id = ?",
+                               (round_id,))
+        rounds = cur.fetchall()
+
+    for round_info in rounds:
+        map_force_position = json.loads(round_info['map_force_position']) if round_info['map_force_position'] else []
+        channels = position_channels(map_force_position)
+        with get_db_connection() as conn:
+            batch = []
+            for rows in round_history_chunks(conn, round_info, EXPORT_CHUNK_ROWS):
+                for row in rows:
+                    values, max_force, level = history_row_forces(row)
+                    batch.append(((row['timestamp'], max_force or 0, level, round_info['id']),
+                                  hit_position(values, row['reed_value'], channels)))
+            conn.execute("DELETE FROM round_summary WHERE round_id = ?", (round_info['id'],))
+            apply_summary_deltas(conn, summary_deltas(batch))
+            if round_info['stop_time'] is not None:
+                finalize_round_summary(conn, round_info['id'])
+            conn.commit()
+        print(f"Round {round_info['id']}: {len(batch)} hits")
+    print(f"Done, {len(rounds)} rounds rebuilt")
+
+@app.cli.command('archive-rounds')
+@click.option('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS or 90, show_default=True,
+              help='Archive finished rounds that started more than this many days ago.')
+@click.option('--vacuum', is_flag=True, help='Compact the SQLite file afterwards.')
+def archive_rounds_command(older_than_days, vacuum):
+    """Move old rounds from sensor_history into gzip files under ARCHIVE_DIR."""
+    init_db()
+    total = 0
+    rows_before = history_archive.rows
+    while True:
+        count = history_archive.archive_older_than(older_than_days)
+        total += count
+        if count < ARCHIVE_BATCH_ROUNDS:
+            break
+    print(f"Archived {total} rounds ({history_archive.rows - rows_before} rows)")
+    if vacuum and USE_SQLITE:
+        # VACUUM cannot run inside a transaction, so it gets its own autocommit connection
+        conn = sqlite3.connect(DATABASE, isolation_level=None)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        print("Database file compacted")
+
+@app.cli.command('drop-archive-period')
+@click.argument('period')
+def drop_archive_period_command(period):
+    """Delete every archived round that started in PERIOD (YYYY-MM) and its files."""
     init_db()
+    print(f"Deleted {history_archive.drop_period(period)} rounds from {period}")
 
-    mqtt_thread_instance = threading.Thread(target=mqtt_thread)
-    mqtt_thread_instance.daemon = True
-    mqtt_thread_instance.start()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ESP Boxing web app")
+    parser.add_argument('role', nargs='?', choices=APP_ROLES, default=APP_ROLE,
+                        help="all: ingest and web in one process (default); "
+                             "ingest: MQTT subscriber only; web: web server only")
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", "5005")))
+    args = parser.parse_args()
+    APP_ROLE = args.role
 
-    app.run(host="0.0.0.0", port=5005)
+    if APP_ROLE == 'ingest':
+        # No viewers connect to the ingest process; web workers pick the rows up in RoleSync.tail
+        history_writer.on_commit = None
+        boot.run()
+        mqtt_thread()
+    else:
+        if APP_ROLE == 'all':
+            mqtt_thread_instance = threading.Thread(target=mqtt_thread)
+            mqtt_thread_instance.daemon = True
+            mqtt_thread_instance.start()
+        # Start listening right away; requests wait for boot.ready
+        boot.start()
+        app.run(host="0.0.0.0", port=args.port)
@@ -0,0 +1,384 @@
+"""Ingest benchmark for esp-boxing-web.
+
+Drives the app's MQTT ingest path with simulated sensors (payloads from
+mockup_sensor.build_payload) or replays recorded sensor_history rounds, then
+reports messages/sec, send-to-commit ingest latency, DB write rate and
+send-to-/stream SSE delivery latency as JSON.
+
+    python bench_ingest.py synth --sensors 8 --rate 5 --duration 30
+    python bench_ingest.py --speed 10x replay --source sensor_data.db --rounds 3
+    python bench_ingest.py --transport mqtt --broker localhost --out result.json synth
+
+The app runs in-process against a scratch SQLite file (or DATABASE_URL when
+set). Runs use a fixed seed and record the git commit, machine and tuning
+env vars so result files from different commits can be compared directly.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import subprocess
+from collections import deque, defaultdict
+
+from mockup_sensor import build_payload, encode_payload
+
+# Settings that change ingest performance; copied into every result file
+TUNING_ENV = ("HISTORY_BATCH_SIZE", "HISTORY_FLUSH_MS", "HISTORY_QUEUE_SIZE", "HISTORY_ENQUEUE_TIMEOUT_MS",
+              "INGEST_WORKERS", "INGEST_QUEUE_SIZE", "STREAM_QUEUE_SIZE", "DB_POOL_MIN", "DB_POOL_MAX")
+
+SPEEDS = {"1x": 1.0, "10x": 10.0, "max": None}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark MQTT ingest, DB writes and SSE delivery.")
+    parser.add_argument("--transport", choices=("direct", "mqtt"), default="direct",
+                        help="direct calls on_message in-process; mqtt publishes through a real broker")
+    parser.add_argument("--broker", default="localhost", help="broker for --transport mqtt")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--speed", choices=sorted(SPEEDS), default="1x", help="playback speed")
+    parser.add_argument("--format", choices=("json", "binary"), default="json", help="sensor payload encoding")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="SQLite file to write to (default: a scratch file)")
+    parser.add_argument("--out", help="write the JSON result here as well as to stdout")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="seconds to wait for the backlog to clear")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's own output")
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    synth = modes.add_parser("synth", help="simulate N sensors punching at a fixed rate")
+    synth.add_argument("--sensors", type=int, default=4)
+    synth.add_argument("--rate", type=float, default=3.0, help="punches per second per sensor (Poisson)")
+    synth.add_argument("--duration", type=float, default=10.0, help="seconds of simulated time")
+    synth.add_argument("--weights", default="1,1,0,1,1",
+                       help="relative frequency of mockup sensor keys 0-4 (2 is the reed switch)")
+    synth.add_argument("--force-min", type=int, default=100)
+    synth.add_argument("--force-max", type=int, default=399)
+    synth.add_argument("--idle-ratio", type=float, default=0.0,
+                       help="fraction of messages that are idle readings (no hit)")
+
+    replay = modes.add_parser("replay", help="replay recorded rounds from a sensor_data.db")
+    replay.add_argument("--source", default="sensor_data.db", help="SQLite database holding the rounds")
+    replay.add_argument("--round", type=int, action="append", dest="round_ids", help="round id (repeatable)")
+    replay.add_argument("--rounds", type=int, default=1, help="number of latest rounds when --round is not given")
+    return parser.parse_args()
+
+########################################
+# Workloads
+########################################
+def synthetic_schedule(args):
+    """[(offset seconds, sensor_id, map_force_position, payload)] for N simulated sensors."""
+    rng = random.Random(args.seed)
+    random.seed(args.seed)  # build_payload draws from the module-level generator
+    keys = [0, 1, 2, 3, 4]
+    weights = [float(w) for w in args.weights.split(",")]
+    schedule = []
+    for index in range(args.sensors):
+        sensor_id = f"bench{index:03d}"
+        offset = rng.expovariate(args.rate)
+        while offset < args.duration:
+            if rng.random() < args.idle_ratio:
+                payload = build_payload(None)
+            else:
+                payload = build_payload(rng.choices(keys, weights)[0], (args.force_min, args.force_max))
+            schedule.append((offset, sensor_id, ["0", "1", "3", "4"], payload))
+            offset += rng.expovariate(args.rate)
+    schedule.sort(key=lambda item: item[0])
+    return schedule
+
+def legacy_forces(row):
+    """Channel dict and reed value of a recorded row, old (JSON text) or new (numeric columns) layout."""
+    keys = row.keys()
+    if "max_force_value" in keys and row["max_force_value"] is not None:
+        forces = {"A" + column[-1]: row[column] for column in ("force_a0", "force_a1", "force_a3", "force_a4")}
+    else:
+        forces = json.loads(row["forces"]) if row["forces"] else {}
+    return forces, row["reed_value"]
+
+def replay_schedule(args):
+    """Rebuild the payloads of recorded rounds, one simulated sensor per round, on a shared clock."""
+    source = sqlite3.connect(f"file:{args.source}?mode=ro", uri=True)
+    source.row_factory = sqlite3.Row
+    if args.round_ids:
+        round_ids = args.round_ids
+    else:
+        cur = source.execute("SELECT id FROM training_round ORDER BY id DESC LIMIT ?", (args.rounds,))
+        round_ids = [row["id"] for row in cur.fetchall()]
+
+    schedule = []
+    for round_id in round_ids:
+        round_info = source.execute("SELECT * FROM training_round WHERE id = ?", (round_id,)).fetchone()
+        if round_info is None:
+            raise SystemExit(f"Round {round_id} not found in {args.source}")
+        map_force_position = json.loads(round_info["map_force_position"])
+        rows = source.execute("SELECT * FROM sensor_history WHERE training_round_id = ? ORDER BY timestamp, id",
+                              (round_id,)).fetchall()
+        # Timestamps only have whole seconds; spread the hits of each second evenly across it
+        per_second = defaultdict(list)
+        for row in rows:
+            per_second[row["timestamp"]].append(row)
+        start = None
+        for stamp in sorted(per_second):
+            second = time.mktime(time.strptime(stamp, "%Y-%m-%d %H:%M:%S"))
+            start = second if start is None else start
+            hits = per_second[stamp]
+            for index, row in enumerate(hits):
+                forces, reed = legacy_forces(row)
+                schedule.append((second - start + index / len(hits), f"replay{round_id}", map_force_position,
+                                 {"reed": reed, "critical": False, "forces": forces}))
+    source.close()
+    schedule.sort(key=lambda item: item[0])
+    return schedule
+
+########################################
+# Measurement
+########################################
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000, 3)
+    return {"count": len(ordered), "p50_ms": pick(50), "p90_ms": pick(90), "p99_ms": pick(99),
+            "max_ms": round(ordered[-1] * 1000, 3)}
+
+class LatencyRecorder:
+    """Matches committed rows and /stream frames back to the time their message was sent.
+
+    Messages of one sensor keep their order through the pipeline and the writer,
+    so each round's committed rows pop that round's send times first-in first-out."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(deque)  # round_id -> send times of expected hits
+        self._sent_at = {}                  # sensor_history id -> send time
+        self.ingest = []
+        self.sse = []
+        self.first_commit = None
+        self.last_commit = None
+        self.unmatched = 0
+
+    def expect(self, round_id, sent):
+        with self._lock:
+            self._pending[round_id].append(sent)
+
+    def wrap_commit(self, on_commit):
+        def recorded(ids, rows):
+            now = time.perf_counter()
+            with self._lock:
+                self.first_commit = self.first_commit or now
+                self.last_commit = now
+                for row_id, row in zip(ids, rows):
+                    pending = self._pending[row[-1]]
+                    if not pending:
+                        self.unmatched += 1
+                        continue
+                    sent = pending.popleft()
+                    self.ingest.append(now - sent)
+                    self._sent_at[row_id] = sent
+            on_commit(ids, rows)
+        return recorded
+
+    def frame(self, row_id):
+        now = time.perf_counter()
+        with self._lock:
+            sent = self._sent_at.pop(row_id, None)
+            if sent is not None:
+                self.sse.append(now - sent)
+
+def follow_stream(A, recorder, stop):
+    """Read the unscoped /stream endpoint like a browser would and time each hit frame."""
+    client = A.app.test_client()
+    response = client.get("/stream", buffered=False)
+    try:
+        for chunk in response.response:
+            if stop.is_set():
+                break
+            text = chunk.decode() if isinstance(chunk, bytes) else chunk
+            for line in text.splitlines():
+                if line.startswith("id: "):
+                    recorder.frame(int(line[4:]))
+    finally:
+        response.close()
+
+def git_revision():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=here, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=here, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+########################################
+# Run
+########################################
+def start_rounds(A, schedule):
+    """Start one untimed round per simulated sensor through /record; returns {sensor_id: ActiveRound}."""
+    client = A.app.test_client()
+    rounds = {}
+    for _, sensor_id, map_force_position, _ in schedule:
+        if sensor_id in rounds:
+            continue
+        form = {"training_name": f"bench {sensor_id}", "recorder_name": "bench", "sensor_id": sensor_id,
+                "timer_duration": "0"}
+        form.update({f"sensor_label{i + 1}": pos for i, pos in enumerate(map_force_position)})
+        client.post("/record", data=form)
+        rounds[sensor_id] = A.sessions.for_sensor(sensor_id)
+        if rounds[sensor_id] is None:
+            raise SystemExit(f"Could not start a round for {sensor_id}")
+    return rounds
+
+def mqtt_publisher(A, args):
+    """Point the app's subscriber at the benchmark broker and return a publish function."""
+    import paho.mqtt.client as mqtt
+    with A.get_db_connection() as conn:
+        conn.execute("UPDATE config SET value = ? WHERE key = 'mqtt_broker'", (args.broker,))
+        conn.execute("UPDATE config SET value = ? WHERE key = 'mqtt_port'", (str(args.port),))
+        conn.commit()
+    A.config_cache.invalidate()
+    threading.Thread(target=A.mqtt_thread, daemon=True).start()
+
+    publisher = mqtt.Client()
+    publisher.connect(args.broker, args.port)
+    publisher.loop_start()
+    time.sleep(2)  # give the app's subscriber time to connect and subscribe
+
+    def publish(topic, payload):
+        publisher.publish(topic, payload)
+    return publish, publisher
+
+def direct_publisher(A):
+    class Message:
+        __slots__ = ("topic", "payload")
+
+        def __init__(self, topic, payload):
+            self.topic = topic
+            self.payload = payload
+
+    def publish(topic, payload):
+        A.on_message(None, None, Message(topic, payload))
+    return publish
+
+def run(args):
+    schedule = synthetic_schedule(args) if args.mode == "synth" else replay_schedule(args)
+    if not schedule:
+        raise SystemExit("Nothing to send")
+
+    scratch = None
+    if not os.getenv("DATABASE_URL"):
+        if not args.db:
+            scratch = tempfile.NamedTemporaryFile(prefix="bench_", suffix=".db", delete=False)
+            scratch.close()
+        os.environ["SQLITE_PATH"] = args.db or scratch.name
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+
+    quiet = open(os.devnull, "w")
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+        # Same startup as app.py: init_db, the workers, then boot.ready, which A.mqtt_thread waits for
+        A.boot.run()
+        recorder = LatencyRecorder()
+        A.history_writer.on_commit = recorder.wrap_commit(A.history_writer.on_commit)
+
+        rounds = start_rounds(A, schedule)
+        stop = threading.Event()
+        threading.Thread(target=follow_stream, args=(A, recorder, stop), daemon=True).start()
+        time.sleep(0.2)  # let the stream subscribe before the first hit
+
+        publisher = None
+        if args.transport == "mqtt":
+            publish, publisher = mqtt_publisher(A, args)
+        else:
+            publish = direct_publisher(A)
+
+        speed = SPEEDS[args.speed]
+        expected = 0
+        started = time.perf_counter()
+        for offset, sensor_id, _, payload in schedule:
+            if speed is not None:
+                delay = started + offset / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            active_round = rounds[sensor_id]
+            values = A.forces_to_values(payload["forces"])
+            sent = time.perf_counter()
+            # Only hits the app will classify produce a row, so only those are waited for
+            if A.classify_hit(active_round.mapping, values, payload.get("reed")) is not None:
+                recorder.expect(active_round.round_id, sent)
+                expected += 1
+            publish(f"espboxing/sensors/{sensor_id}", encode_payload(payload, args.format))
+        send_seconds = time.perf_counter() - started
+
+        deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < deadline and len(recorder.ingest) + A.history_writer.dropped < expected:
+            time.sleep(0.01)
+        A.ingest_pipeline.wait_idle(timeout=max(0.0, deadline - time.monotonic()))
+        A.history_writer.flush()
+        time.sleep(0.2)  # last frames in flight to the stream reader
+        wall_seconds = time.perf_counter() - started
+        stop.set()
+        if publisher is not None:
+            publisher.loop_stop()
+            publisher.disconnect()
+
+        for active_round in rounds.values():
+            A.stop_training(active_round.round_id)
+    quiet.close()
+
+    commit, dirty = git_revision()
+    writer = A.history_writer.stats()
+    write_span = (recorder.last_commit - recorder.first_commit) if recorder.first_commit else 0.0
+    result = {
+        "benchmark": "ingest",
+        "commit": commit,
+        "dirty": dirty,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "database": "sqlite" if A.USE_SQLITE else "postgres",
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "db", "verbose")},
+        "env": {name: os.getenv(name) for name in TUNING_ENV if os.getenv(name) is not None},
+        "results": {
+            "sensors": len(rounds),
+            "messages_sent": len(schedule),
+            "hits_expected": expected,
+            "rows_written": writer["written"],
+            "send_seconds": round(send_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "messages_per_sec": round(len(schedule) / send_seconds, 1) if send_seconds else None,
+            "processed_per_sec": round(len(schedule) / wall_seconds, 1) if wall_seconds else None,
+            "db_rows_per_sec": round(writer["written"] / write_span, 1) if write_span else None,
+            "db_batches": writer["batches"],
+            "ingest_latency": percentiles(recorder.ingest),
+            "sse_latency": percentiles(recorder.sse),
+            "unmatched_rows": recorder.unmatched,
+        },
+        "pipeline": A.ingest_pipeline.stats(),
+        "writer": writer,
+        "event_bus": A.event_bus.stats(),
+    }
+    if scratch is not None:
+        try:
+            os.unlink(scratch.name)
+        except OSError:
+            pass  # still held open by a pooled connection (Windows)
+    return result
+
+def main():
+    args = parse_args()
+    result = run(args)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ import paho.mqtt.client as mqtt
 import random
 import time
 import json
+import math
+import struct
+import argparse
 
 # MQTT Configuration
 MQTT_BROKER = "broker.mqtt.cool"
@@ -9,6 +12,17 @@ MQTT_PORT = 1883
 DEVICE_ID = "mocup_sensor"
 MQTT_TOPIC = f"espboxing/sensors/{DEVICE_ID}"
 
+# Binary payload v1 (see decode_payload in app.py): magic, version, flags,
+# seq, device_ts (ms), reed, A0 A1 A3 A4
+PAYLOAD_V1 = struct.Struct("<2sBBIIH4h")
+FLAG_CRITICAL = 0x01
+# Raw sample batch v1 (see decode_raw_batch in app.py): magic, version, flags,
+# seq, device_ts (ms), sample_rate, count, reed, then count rows of A0 A1 A3 A4
+RAW_HEADER_V1 = struct.Struct("<2sBBIIHHH")
+RAW_BATCH_SIZE = 50
+_seq = 0
+_boot = time.monotonic()
+
 # Initialize MQTT client
 client = mqtt.Client()
 
@@ -20,20 +34,21 @@ def connect_mqtt():
     except Exception as e:
         print(f"Failed to connect to MQTT broker: {e}")
 
-def send_sensor_data(active_sensor=None):
+def build_payload(active_sensor=None, force_range=(100, 400)):
+    """Payload for one hit on sensor index 0-4 (2 is the reed switch), or an idle reading."""
     force_values = [0] * 4  # Now 4 force sensors (A0, A1, A3, A4)
     reed_value = 0  # Default reed value
     
     # If a specific sensor is activated
     if active_sensor is not None:
         if active_sensor == 2:  # A2 is reed sensor
-            reed_value = random.randint(100, 400)
+            reed_value = random.randint(*force_range)
         else:
             # Map the sensor index for A0, A1, A3, A4
             actual_index = active_sensor if active_sensor < 2 else active_sensor - 1
-            force_values[actual_index] = random.randint(100, 400)
+            force_values[actual_index] = random.randint(*force_range)
 
-    payload = {
+    return {
         "reed": reed_value,
         "critical": False,
         "forces": {
@@ -43,14 +58,64 @@ def send_sensor_data(active_sensor=None):
             "A4": force_values[3]
         }
     }
+
+def encode_payload(payload, payload_format="json"):
+    """Serialize a build_payload() dict as legacy JSON or as a binary v1 frame."""
+    global _seq
+    if payload_format == "json":
+        return json.dumps(payload).encode()
+    _seq = (_seq + 1) & 0xFFFFFFFF
+    device_ts = int((time.monotonic() - _boot) * 1000) & 0xFFFFFFFF
+    forces = payload["forces"]
+    return PAYLOAD_V1.pack(b"EB", 1, FLAG_CRITICAL if payload.get("critical") else 0, _seq, device_ts,
+                           payload.get("reed") or 0, *(forces.get(ch) or 0 for ch in ("A0", "A1", "A3", "A4")))
+
+def build_waveform(active_sensor, sample_rate=500, duration=0.3, force_range=(100, 400)):
+    """Raw samples of one punch: a half-sine pulse on one force channel between quiet stretches."""
+    actual_index = active_sensor if active_sensor < 2 else active_sensor - 1
+    peak = random.randint(*force_range)
+    total = int(sample_rate * duration)
+    pulse = total // 3
+    rows = []
+    for i in range(total):
+        row = [random.randint(0, 5) for _ in range(4)]  # sensor noise floor
+        if pulse <= i < 2 * pulse:
+            row[actual_index] = int(peak * math.sin(math.pi * (i - pulse) / pulse))
+        rows.append(row)
+    return rows
+
+def encode_raw_batches(rows, sample_rate, reed=0):
+    """Split sample rows into raw batch frames of RAW_BATCH_SIZE samples."""
+    global _seq
+    frames = []
+    for start in range(0, len(rows), RAW_BATCH_SIZE):
+        chunk = rows[start:start + RAW_BATCH_SIZE]
+        _seq = (_seq + 1) & 0xFFFFFFFF
+        device_ts = int((time.monotonic() - _boot) * 1000) & 0xFFFFFFFF
+        header = RAW_HEADER_V1.pack(b"EW", 1, 0, _seq, device_ts, sample_rate, len(chunk), reed)
+        frames.append(header + struct.pack(f"<{len(chunk) * 4}h", *(v for row in chunk for v in row)))
+    return frames
+
+def send_waveform(active_sensor, sample_rate=500):
+    for frame in encode_raw_batches(build_waveform(active_sensor, sample_rate), sample_rate):
+        client.publish(f"{MQTT_TOPIC}/raw", frame)
+        time.sleep(RAW_BATCH_SIZE / sample_rate)  # publish at the real sample rate
+    print(f"Sent raw waveform on sensor {active_sensor}")
+
+def send_sensor_data(active_sensor=None, payload_format="json"):
+    payload = build_payload(active_sensor)
     
     try:
-        client.publish(MQTT_TOPIC, json.dumps(payload))
+        client.publish(MQTT_TOPIC, encode_payload(payload, payload_format))
         print(f"Sent data: {payload}")
     except Exception as e:
         print(f"Failed to send data: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Publish simulated ESP boxing sensor hits.")
+    parser.add_argument("--format", choices=("json", "binary"), default="json", help="payload encoding")
+    args = parser.parse_args()
+
     connect_mqtt()
     print("Enter number to simulate sensors:")
     print("0 - Force sensor A0")
@@ -58,6 +123,7 @@ def main():
     print("2 - Reed sensor A2")
     print("3 - Force sensor A3")
     print("4 - Force sensor A4")
+    print("w0, w1, w3, w4 - Raw waveform of a punch on that force sensor")
     print("q - Quit")
     
     while True:
@@ -66,7 +132,9 @@ def main():
         if key == 'q':
             break
         elif key in ['0', '1', '2', '3', '4']:
-            send_sensor_data(int(key))
+            send_sensor_data(int(key), args.format)
+        elif key in ['w0', 'w1', 'w3', 'w4']:
+            send_waveform(int(key[1]))
         else:
             print("Invalid input. Please enter 0-4 or 'q'")
 
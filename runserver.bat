@@ -12,8 +12,10 @@ echo Installing dependencies...
 python -m pip install -r requirements.txt
 
 REM Start your Python application in a new window
+REM "all" runs MQTT ingest and the web server in one process;
+REM for a split setup start "python app.py ingest" and "python app.py web" instead
 echo Starting the application...
-start "PythonApp" python app.py
+start "PythonApp" python app.py all
 
 REM Wait a few seconds to allow the server to start (adjust if needed)
 timeout /t 3 /nobreak >nul
@@ -10,8 +10,10 @@ Write-Host "Installing dependencies..."
 python -m pip install -r requirements.txt
 
 # Start your Python application in a separate process
+# "all" runs MQTT ingest and the web server in one process;
+# for a split setup start "app.py ingest" and "app.py web" instead
 Write-Host "Starting the application..."
-Start-Process python -ArgumentList "app.py"
+Start-Process python -ArgumentList "app.py all"
 
 # Wait a few seconds to allow the server to start up (adjust time if needed)
 Start-Sleep -Seconds 3
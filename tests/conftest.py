@@ -0,0 +1,56 @@
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# Keep the database, captures and archives of a test run out of the working tree;
+# these must be set before app is imported
+_data_dir = tempfile.mkdtemp(prefix="espboxing-tests-")
+os.environ.setdefault("SQLITE_PATH", os.path.join(_data_dir, "sensor_data.db"))
+os.environ.setdefault("CAPTURE_DIR", os.path.join(_data_dir, "captures"))
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(_data_dir, "archive"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def database():
+    """The app module with its schema created in the test database."""
+    import app
+    app.init_db()
+    return app
+
+
+@pytest.fixture
+def make_round(database):
+    """Insert a stopped round and write its hits the way the history writer does; returns the round id.
+
+    `hits` are FORCE_CHANNELS-ordered value tuples, optionally (values, reed_value) pairs,
+    one second apart and classified with the round's mapping and the current settings."""
+    app = database
+
+    def make_round(hits, training_name="test", sensor_id="S1", map_force_position=("0", "1", "3", "4"),
+                   start_time="2025-01-05 10:00:00", stop_time="2025-01-05 10:05:00"):
+        with app.get_db_connection() as conn:
+            cur = conn.execute(
+                "INSERT INTO training_round (training_name, recorder_name, sensor_id, map_force_position, "
+                "start_time, stop_time, active) VALUES (?, 'tester', ?, ?, ?, ?, 0)",
+                (training_name, sensor_id, json.dumps(list(map_force_position)), start_time, stop_time))
+            round_id = cur.lastrowid
+            conn.commit()
+        mapping = app.compile_force_mapping(list(map_force_position), app.config_cache.snapshot())
+        started = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
+        batch = []
+        for second, hit in enumerate(hits):
+            values, reed_value = hit if isinstance(hit[0], tuple) else (hit, 0)
+            position, event, max_force, level = app.classify_hit(mapping, values, reed_value)
+            timestamp = (started + timedelta(seconds=second)).strftime("%Y-%m-%d %H:%M:%S")
+            batch.append(((timestamp, reed_value, event) + tuple(values) + (max_force, level, round_id), position))
+        if batch:
+            app.SensorHistoryWriter()._write(batch)
+        return round_id
+
+    return make_round
@@ -0,0 +1,75 @@
+import csv
+import io
+import os
+from contextlib import contextmanager
+
+from flask import template_rendered
+
+import app
+
+HITS = [(150, 0, 0, 0), (0, 250, 0, 0), (0, 0, 350, 120), (0, 0, 0, 180), (120, 0, 0, 0)]
+# A month no other test records in, since drop-archive-period removes every archived round of it
+PERIOD = "2019-03"
+
+
+@contextmanager
+def rendered():
+    contexts = []
+
+    def record(sender, template, context, **extra):
+        contexts.append(context)
+
+    with template_rendered.connected_to(record, app.app):
+        yield contexts
+
+
+def details(round_id, **args):
+    with rendered() as contexts:
+        assert app.app.test_client().get(f"/history/{round_id}", query_string=args).status_code == 200
+    context = contexts[0]
+    return [event["id"] for event in context["sensor_events"]], context["first_number"], context["next_before"]
+
+
+def read_back(round_id):
+    """Everything /history/<id> and its stats and export show for a round."""
+    client = app.app.test_client()
+    first_page = details(round_id, page_size=2)
+    return {
+        "pages": [first_page, details(round_id, page_size=2, before=first_page[2])],
+        "stats": client.get(f"/history/{round_id}/stats").get_json(),
+        "export": list(csv.reader(io.StringIO(client.get(f"/history/{round_id}/export").get_data(as_text=True)))),
+    }
+
+
+def round_row(round_id):
+    with app.get_db_connection() as conn:
+        return conn.execute("SELECT archive_path FROM training_round WHERE id = ?", (round_id,)).fetchone()
+
+
+def history_count(round_id):
+    with app.get_db_connection() as conn:
+        cur = conn.execute("SELECT COUNT(*) AS n FROM sensor_history WHERE training_round_id = ?", (round_id,))
+        return cur.fetchone()["n"]
+
+
+def test_archived_round_reads_back_the_same_until_its_period_is_dropped(make_round):
+    round_id = make_round(HITS, start_time=f"{PERIOD}-02 09:00:00", stop_time=f"{PERIOD}-02 09:05:00")
+    before = read_back(round_id)
+    assert before["stats"]["hit_count"] == len(HITS)
+    assert len(before["export"]) == 1 + len(HITS)
+
+    assert app.history_archive.archive_round(round_id)
+    archive_path = round_row(round_id)["archive_path"]
+    assert archive_path == f"{PERIOD}/round_{round_id}.jsonl.gz"
+    assert os.path.exists(os.path.join(app.history_archive.directory, archive_path))
+    assert history_count(round_id) == 0
+    assert read_back(round_id) == before
+    # An archived round is not archived again
+    assert not app.history_archive.archive_round(round_id)
+
+    result = app.app.test_cli_runner().invoke(args=["drop-archive-period", PERIOD])
+    assert result.exit_code == 0, result.output
+    assert "Deleted 1 rounds" in result.output
+    assert round_row(round_id) is None
+    assert not os.path.exists(os.path.join(app.history_archive.directory, PERIOD))
+    assert app.app.test_client().get(f"/history/{round_id}/stats").status_code == 404
@@ -0,0 +1,91 @@
+import pytest
+
+import app
+
+LABELS = ["หัว", "ลำตัว", "ท้อง", "ขา"]
+
+
+def make_mapping(ranges=((100, 199), (200, 299), (300, 399)), labels=LABELS, positions=("0", "1", "3", "4")):
+    values = {f"sensor_label{i}": label for i, label in enumerate(labels, start=1)}
+    for i, (low, high) in enumerate(ranges, start=1):
+        values[f"sensor_value_range_min{i}"] = str(low)
+        values[f"sensor_value_range_max{i}"] = str(high)
+    return app.compile_force_mapping(list(positions), app.ConfigSnapshot(values, 1))
+
+
+@pytest.mark.parametrize("force, level", [
+    (99, None),
+    (100, 1),
+    (199, 1),
+    (200, 2),
+    (299, 2),
+    (300, 3),
+    (399, 3),
+    (400, None),
+])
+def test_level_bounds_are_inclusive(force, level):
+    result = app.classify_hit(make_mapping(), (force, 0, 0, 0))
+    assert (result[3] if result else None) == level
+
+
+def test_force_in_a_gap_between_ranges_is_not_a_hit():
+    mapping = make_mapping(ranges=((100, 149), (200, 299), (300, 399)))
+    assert app.classify_hit(mapping, (150, 0, 0, 0)) is None
+    assert app.classify_hit(mapping, (199, 0, 0, 0)) is None
+
+
+def test_overlapping_ranges_keep_the_lower_level():
+    # Level 1 is checked first, as in the original if/elif chain
+    mapping = make_mapping(ranges=((100, 250), (200, 299), (150, 399)))
+    assert app.classify_hit(mapping, (170, 0, 0, 0))[3] == 1
+    assert app.classify_hit(mapping, (250, 0, 0, 0))[3] == 1
+    assert app.classify_hit(mapping, (251, 0, 0, 0))[3] == 2
+    assert app.classify_hit(mapping, (300, 0, 0, 0))[3] == 3
+
+
+def test_empty_range_is_ignored():
+    mapping = make_mapping(ranges=((100, 199), (300, 200), (300, 399)))
+    assert app.classify_hit(mapping, (250, 0, 0, 0)) is None
+    assert app.classify_hit(mapping, (300, 0, 0, 0))[3] == 3
+
+
+def test_level_pieces():
+    assert app.level_pieces([(100, 250), (200, 299), (150, 399)]) == [(100, 250, 1), (251, 299, 2), (300, 399, 3)]
+    assert app.level_pieces([(200, 299), (100, 399), (0, 10)]) == [
+        (0, 10, 3), (100, 199, 2), (200, 299, 1), (300, 399, 2)]
+
+
+def test_strongest_position_wins():
+    assert app.classify_hit(make_mapping(), (120, 0, 250, 130)) == (2, "ท้อง", 250, 2)
+
+
+def test_reed_ignores_the_first_position():
+    mapping = make_mapping()
+    assert app.classify_hit(mapping, (350, 0, 150, 0), reed_value=0) == (0, "หัว", 350, 3)
+    assert app.classify_hit(mapping, (350, 0, 150, 0), reed_value=1) == (2, "ท้อง", 150, 1)
+
+
+def test_position_order_follows_the_mapping():
+    # Position 1 reads channel A3 and position 3 reads A0
+    mapping = make_mapping(positions=("3", "1", "0", "4"))
+    assert app.classify_hit(mapping, (0, 0, 150, 0)) == (0, "หัว", 150, 1)
+
+
+def test_unmapped_position_reads_zero():
+    mapping = make_mapping(positions=("", "1", "3", "4"))
+    assert app.classify_hit(mapping, (350, 0, 0, 0)) is None
+    assert app.classify_hit(mapping, (350, 120, 0, 0)) == (1, "ลำตัว", 120, 1)
+
+
+def test_missing_channel_value_is_not_a_hit():
+    assert app.classify_hit(make_mapping(), (150, None, 0, 0)) is None
+
+
+def test_duplicate_labels_report_the_position_that_was_hit():
+    mapping = make_mapping(labels=["หัว", "หัว", "ท้อง", "ขา"])
+    assert app.classify_hit(mapping, (0, 150, 0, 0)) == (1, "หัว", 150, 1)
+
+
+def test_unknown_channel_is_rejected():
+    with pytest.raises(ValueError):
+        make_mapping(positions=("0", "1", "2", "4"))
@@ -0,0 +1,31 @@
+import sys
+import threading
+
+import app
+
+
+def test_concurrent_snapshots_are_all_counted(database):
+    # Switch threads as often as possible so an unlocked `+= 1` would lose counts
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    cache = app.ConfigCache()
+    threads = [threading.Thread(target=lambda: [cache.snapshot() for _ in range(2000)]) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] + stats["misses"] == 8 * 2000
+
+
+def test_invalidate_reloads_once(database):
+    cache = app.ConfigCache()
+    first = cache.snapshot()
+    assert cache.snapshot() is first
+    cache.invalidate()
+    assert cache.snapshot() is not first
+    assert cache.stats() == {"version": 1, "hits": 1, "misses": 2, "reloads": 1}
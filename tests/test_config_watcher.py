@@ -0,0 +1,54 @@
+import pytest
+
+import app
+
+SETTINGS_KEYS = ("mqtt_broker", "mqtt_port", "timer_duration") + tuple(sorted(app.MAPPING_CONFIG_KEYS)) + \
+    tuple(f"default_position_sensor{i}" for i in range(1, 5))
+
+
+def config_version():
+    with app.get_db_connection() as conn:
+        return int(conn.execute("SELECT value FROM config WHERE key = 'config_version'").fetchone()["value"])
+
+
+@pytest.fixture
+def save_settings(database, monkeypatch):
+    """POST /settings with the current values plus `changes`; the original values are saved back afterwards."""
+    applied = []
+    monkeypatch.setattr(app, "apply_config_changes", lambda changed, config: applied.append((changed, config)))
+    app.config_watcher.check()
+    original = {key: app.config_cache.snapshot().values[key] for key in SETTINGS_KEYS}
+
+    def save_settings(**changes):
+        response = app.app.test_client().post("/settings", data=dict(original, **changes))
+        assert response.status_code == 302
+        return applied
+
+    yield save_settings
+    app.app.test_client().post("/settings", data=original)
+
+
+def test_config_changes_lists_the_keys_that_differ():
+    old = app.ConfigSnapshot(dict(app.CONFIG_DEFAULTS, config_version="1"), 1)
+    new = app.ConfigSnapshot(dict(app.CONFIG_DEFAULTS, sensor_label1="ศีรษะ", mqtt_port="1884", config_version="2"), 2)
+    assert app.config_changes(old, new) == {"sensor_label1", "mqtt_port"}
+    assert app.config_changes(old, old) == set()
+
+
+def test_saving_settings_bumps_config_version_and_reports_the_diff(save_settings):
+    version = config_version()
+    applied = save_settings(sensor_label1="ศีรษะ", sensor_value_range_max3="450")
+    assert config_version() == version + 1
+    assert app.config_watcher.version == str(version + 1)
+    [(changed, config)] = applied
+    assert changed == {"sensor_label1", "sensor_value_range_max3"}
+    assert config.labels[0] == "ศีรษะ"
+    assert app.config_cache.snapshot().values["sensor_value_range_max3"] == "450"
+
+
+def test_saving_unchanged_settings_bumps_the_version_but_applies_nothing(save_settings):
+    version = config_version()
+    assert save_settings() == []
+    assert config_version() == version + 1
+    # Nothing new since the save, so another check is a no-op
+    assert not app.config_watcher.check()
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+
+import pytest
+
+import app
+
+HITS = [(150, 0, 0, 0), (0, 250, 0, 0), (0, 0, 350, 120)]
+
+
+def csv_rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('﻿'))))
+
+
+def test_round_csv_export(make_round):
+    round_id = make_round(HITS, training_name="ส่งออก")
+    response = app.app.test_client().get(f"/history/{round_id}/export")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert f'filename="round_{round_id}.csv"' in response.headers["Content-Disposition"]
+    # BOM first so Excel reads the Thai labels as UTF-8
+    assert response.get_data().startswith("﻿".encode())
+
+    header, *rows = csv_rows(response)
+    assert header == list(app.EXPORT_COLUMNS)
+    assert len(rows) == len(HITS)
+    records = [dict(zip(header, row)) for row in rows]
+    assert {record["round_id"] for record in records} == {str(round_id)}
+    assert [record["training_name"] for record in records] == ["ส่งออก"] * 3
+    assert [record["max_force_value"] for record in records] == ["150", "250", "350"]
+    assert [record["force_level"] for record in records] == ["1", "2", "3"]
+    assert [record["force_a4"] for record in records] == ["0", "0", "120"]
+
+
+def test_round_csv_export_streams_in_chunks(make_round, monkeypatch):
+    round_id = make_round(HITS * 3)
+    monkeypatch.setattr(app, "EXPORT_CHUNK_ROWS", 4)
+    response = app.app.test_client().get(f"/history/{round_id}/export")
+    assert response.is_streamed
+    assert len(csv_rows(response)) == 1 + 9
+
+
+def test_filtered_export_only_includes_matching_rounds(make_round):
+    first = make_round(HITS, training_name="export-filter-a")
+    make_round(HITS[:1], training_name="export-filter-b")
+    response = app.app.test_client().get("/export?training_name=export-filter-a")
+    header, *rows = csv_rows(response)
+    assert len(rows) == len(HITS)
+    assert {row[header.index("round_id")] for row in rows} == {str(first)}
+
+
+def test_export_of_an_empty_round_is_just_the_header(make_round):
+    round_id = make_round([])
+    assert csv_rows(app.app.test_client().get(f"/history/{round_id}/export")) == [list(app.EXPORT_COLUMNS)]
+
+
+def test_unknown_export_format(make_round):
+    round_id = make_round(HITS)
+    assert app.app.test_client().get(f"/history/{round_id}/export?format=xlsx").status_code == 400
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_columnar_export_without_pyarrow_is_501(make_round, monkeypatch, file_format):
+    round_id = make_round(HITS)
+    find_spec = app.importlib.util.find_spec
+    monkeypatch.setattr(app.importlib.util, "find_spec",
+                        lambda name, *args: None if name == "pyarrow" else find_spec(name, *args))
+    response = app.app.test_client().get(f"/history/{round_id}/export?format={file_format}")
+    assert response.status_code == 501
+    assert "pyarrow" in response.get_json()["error"]
+
+
+def test_parquet_export(make_round):
+    pq = pytest.importorskip("pyarrow.parquet")
+    round_id = make_round(HITS)
+    response = app.app.test_client().get(f"/history/{round_id}/export?format=parquet")
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.get_data()))
+    assert table.column_names == list(app.EXPORT_COLUMNS)
+    assert table.column("max_force_value").to_pylist() == [150, 250, 350]
+
+
+def make_fused_round(make_round, hits, training_name="test"):
+    round_id = make_round(hits, training_name=training_name, sensor_id="F1,F2")
+    sensor_maps = {"F1": ["0", "1", "", ""], "F2": ["", "", "3", "4"]}
+    with app.get_db_connection() as conn:
+        conn.execute("UPDATE training_round SET sensor_maps = ? WHERE id = ?", (json.dumps(sensor_maps), round_id))
+        conn.commit()
+    return round_id
+
+
+def test_fused_round_export_names_forces_by_position(make_round):
+    round_id = make_fused_round(make_round, HITS)
+    header, *rows = csv_rows(app.app.test_client().get(f"/history/{round_id}/export"))
+    assert header[7:11] == ["force_pos1", "force_pos2", "force_pos3", "force_pos4"]
+    assert {row[header.index("force_layout")] for row in rows} == {"position"}
+
+
+def test_mixed_export_marks_the_force_layout_of_each_row(make_round):
+    fused = make_fused_round(make_round, HITS[:1], training_name="export-layout")
+    single = make_round(HITS[:1], training_name="export-layout")
+    header, *rows = csv_rows(app.app.test_client().get("/export?training_name=export-layout"))
+    assert header == list(app.EXPORT_COLUMNS)
+    layouts = {row[header.index("round_id")]: row[header.index("force_layout")] for row in rows}
+    assert layouts == {str(fused): "position", str(single): "channel"}
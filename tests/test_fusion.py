@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+import app
+
+
+class RecordingWriter:
+    """Stands in for the history writer and keeps what the fusion hands on, in order."""
+    def __init__(self):
+        self.rows = []
+        self.changed = threading.Condition()
+
+    def submit(self, row, position=None):
+        with self.changed:
+            self.rows.append((row, position))
+            self.changed.notify_all()
+        return True
+
+    def wait_for(self, count, timeout=2.0):
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.rows) >= count, timeout)
+        return [row for row, _ in self.rows]
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = RecordingWriter()
+    monkeypatch.setattr(app, "history_writer", writer)
+    return writer
+
+
+def reading(device_ts):
+    return app.SensorReading(reed=0, values=(0, 0, 0, 0), critical=False, seq=None, device_ts=device_ts)
+
+
+def test_hits_are_handed_on_in_event_time_order(writer):
+    fusion = app.SensorFusion(window=0.05)
+    now = time.time()
+    fusion.submit(1, now + 0.02, "late device", 1)
+    fusion.submit(1, now, "early device", 0)
+    fusion.submit(1, now + 0.01, "middle", 2)
+    assert writer.wait_for(3) == ["early device", "middle", "late device"]
+    assert [position for _, position in writer.rows] == [0, 2, 1]
+    assert fusion.stats()["buffered"] == 0
+
+
+def test_hits_wait_for_the_reorder_window(writer):
+    fusion = app.SensorFusion(window=0.3)
+    fusion.submit(1, time.time(), "hit", 0)
+    time.sleep(0.1)
+    assert writer.rows == []
+    assert writer.wait_for(1) == ["hit"]
+
+
+def test_hit_older_than_one_already_written_is_late(writer):
+    fusion = app.SensorFusion(window=0.0)
+    now = time.time()
+    fusion.submit(1, now, "first", 0)
+    writer.wait_for(1)
+    fusion.submit(1, now - 1, "delayed", 0)
+    assert writer.wait_for(2) == ["first", "delayed"]
+    assert fusion.stats()["late"] == 1
+
+
+def test_flush_hands_on_one_round_in_order(writer):
+    fusion = app.SensorFusion(window=60)
+    now = time.time()
+    fusion.submit(1, now + 2, "round 1 second", 0)
+    fusion.submit(2, now, "round 2", 0)
+    fusion.submit(1, now + 1, "round 1 first", 0)
+    fusion.flush(1)
+    assert [row for row, _ in writer.rows] == ["round 1 first", "round 1 second"]
+    stats = fusion.stats()
+    assert (stats["buffered"], stats["merged"], stats["late"]) == (1, 2, 0)
+    fusion.flush(2)
+    assert [row for row, _ in writer.rows][-1] == "round 2"
+    assert fusion.stats()["buffered"] == 0
+
+
+def test_flush_forgets_the_round(writer):
+    # Hits submitted after a flush are not compared with the ones it handed on
+    fusion = app.SensorFusion(window=60)
+    now = time.time()
+    fusion.submit(1, now, "hit", 0)
+    fusion.flush(1)
+    fusion.submit(1, now - 10, "earlier", 0)
+    assert fusion.stats()["late"] == 0
+    fusion.flush(1)
+    assert [row for row, _ in writer.rows] == ["hit", "earlier"]
+
+
+def test_event_time_uses_the_least_delayed_message():
+    fusion = app.SensorFusion(window=0.1)
+    # Device clock 1.000 s received at 101.050 s, then 2.000 s received with less delay
+    assert fusion.event_time("S1", reading(1000), 101.05) == pytest.approx(101.05)
+    assert fusion.event_time("S1", reading(2000), 102.01) == pytest.approx(102.01)
+    # A later, more delayed message is placed by the smallest offset seen
+    assert fusion.event_time("S1", reading(3000), 103.5) == pytest.approx(103.01)
+
+
+def test_event_time_resyncs_after_a_device_reboot():
+    fusion = app.SensorFusion(window=0.1)
+    fusion.event_time("S1", reading(500000), 1000.0)
+    # The device clock went back to near zero, which moves the offset far beyond FUSION_RESYNC_SECONDS
+    assert fusion.event_time("S1", reading(100), 1001.0) == pytest.approx(1001.0)
+
+
+def test_event_time_without_device_clock_is_receive_time():
+    fusion = app.SensorFusion(window=0.1)
+    assert fusion.event_time("S1", reading(None), 42.5) == 42.5
+    assert fusion.stats()["sensors"] == 0
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import app
+
+
+def history_row(round_id, force=150):
+    return ("2026-01-01 10:00:00", 0, "หัว", force, 0, 0, 0, force, 1, round_id)
+
+
+def stored_rows(round_id):
+    with app.get_db_connection() as conn:
+        cur = conn.execute("SELECT COUNT(*) AS n FROM sensor_history WHERE training_round_id = ?", (round_id,))
+        return cur.fetchone()["n"]
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_full_batch_is_written_without_waiting_for_the_interval(database):
+    writer = app.SensorHistoryWriter(batch_size=3, flush_interval=30)
+    for _ in range(3):
+        assert writer.submit(history_row(2001), 0)
+    assert wait_until(lambda: writer.written == 3)
+    assert (writer.batches, stored_rows(2001)) == (1, 3)
+
+
+def test_partial_batch_is_written_after_the_interval(database):
+    writer = app.SensorHistoryWriter(batch_size=100, flush_interval=0.05)
+    started = time.monotonic()
+    writer.submit(history_row(2002), 0)
+    writer.submit(history_row(2002), 0)
+    assert wait_until(lambda: writer.written == 2)
+    assert time.monotonic() - started >= 0.05
+    assert (writer.batches, stored_rows(2002)) == (1, 2)
+
+
+def test_flush_waits_for_rows_queued_before_it(database):
+    writer = app.SensorHistoryWriter(batch_size=100, flush_interval=30)
+    for _ in range(5):
+        writer.submit(history_row(2003), 1)
+    assert writer.flush()
+    assert stored_rows(2003) == 5
+    with app.get_db_connection() as conn:
+        summary = conn.execute("SELECT hit_count, pos2_hits FROM round_summary WHERE round_id = 2003").fetchone()
+    assert (summary["hit_count"], summary["pos2_hits"]) == (5, 5)
+
+
+def test_rows_are_dropped_and_counted_when_the_queue_is_full(database, monkeypatch):
+    writer = app.SensorHistoryWriter(batch_size=1, flush_interval=0, max_queue=2, enqueue_timeout=0.01)
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_write(batch, notices=()):
+        writing.set()
+        release.wait(2)
+
+    monkeypatch.setattr(writer, "_write", slow_write)
+    assert writer.submit(history_row(2004), 0)      # taken by the writer thread, which then blocks
+    assert writing.wait(2)
+    assert writer.submit(history_row(2004), 0)
+    assert writer.submit(history_row(2004), 0)      # the queue is now full
+    assert not writer.submit(history_row(2004), 0)
+    stats = writer.stats()
+    assert (stats["enqueued"], stats["dropped"], stats["queued"]) == (3, 1, 2)
+    release.set()
@@ -0,0 +1,84 @@
+import json
+import struct
+
+import pytest
+
+import analytics
+import app
+
+
+def binary_payload(flags=0, seq=7, device_ts=123456, reed=1, values=(150, -2, 300, 0), version=1):
+    return app.PAYLOAD_V1.pack(b"EB", version, flags, seq, device_ts, reed, *values)
+
+
+def raw_batch(rows, seq=3, device_ts=5000, sample_rate=500, reed=0):
+    header = app.RAW_HEADER_V1.pack(b"EW", 1, 0, seq, device_ts, sample_rate, len(rows), reed)
+    return header + struct.pack(f"<{len(rows) * 4}h", *(value for row in rows for value in row))
+
+
+def test_payload_layout_is_22_little_endian_bytes():
+    assert app.PAYLOAD_V1.size == 22
+    expected = (b"EB" + bytes([1, app.FLAG_CRITICAL]) + (7).to_bytes(4, "little") + (123456).to_bytes(4, "little")
+                + (1).to_bytes(2, "little")
+                + b"".join(value.to_bytes(2, "little", signed=True) for value in (150, -2, 300, 0)))
+    assert binary_payload(flags=app.FLAG_CRITICAL) == expected
+
+
+def test_decode_binary_payload():
+    reading = app.decode_payload(binary_payload(flags=app.FLAG_CRITICAL))
+    assert reading == app.SensorReading(reed=1, values=(150, -2, 300, 0), critical=True, seq=7, device_ts=123456)
+
+
+def test_decode_binary_payload_from_memoryview():
+    reading = app.decode_payload(memoryview(binary_payload()))
+    assert reading.values == (150, -2, 300, 0)
+    assert reading.critical is False
+
+
+@pytest.mark.parametrize("payload, message", [
+    (binary_payload()[:-1], "expected 22"),
+    (binary_payload() + b"\x00", "expected 22"),
+    (binary_payload(version=2), "version 2"),
+    (b"EB", "version None"),
+])
+def test_decode_binary_payload_rejects_malformed_frames(payload, message):
+    with pytest.raises(ValueError, match=message):
+        app.decode_payload(payload)
+
+
+def test_decode_json_payload():
+    payload = json.dumps({"reed": 0, "critical": True, "forces": {"A0": 10, "A1": 20, "A4": 40}}).encode()
+    reading = app.decode_payload(payload)
+    # Channels missing from the payload decode as None, and JSON carries no seq/device_ts
+    assert reading == app.SensorReading(reed=0, values=(10, 20, None, 40), critical=True, seq=None, device_ts=None)
+
+
+def test_decode_json_payload_rejects_garbage():
+    with pytest.raises(ValueError):
+        app.decode_payload(b"not json")
+
+
+def test_decode_raw_batch():
+    rows = [(1, 2, 3, 4), (-5, 6, 7, 8), (100, 0, 0, 300)]
+    batch = app.decode_raw_batch(raw_batch(rows, reed=1))
+    assert (batch.seq, batch.device_ts, batch.sample_rate, batch.count, batch.reed) == (3, 5000, 500, 3, 1)
+    assert analytics.samples_from_bytes(batch.samples, len(app.FORCE_CHANNELS)).tolist() == [list(row) for row in rows]
+
+
+def test_decode_raw_batch_does_not_copy_samples():
+    payload = bytearray(raw_batch([(1, 2, 3, 4)]))
+    batch = app.decode_raw_batch(payload)
+    payload[app.RAW_HEADER_V1.size] = 9
+    assert batch.samples[0] == 9
+
+
+@pytest.mark.parametrize("payload", [
+    b"EW\x01",                                           # shorter than the header
+    binary_payload(),                                    # a single reading, not a batch
+    raw_batch([(1, 2, 3, 4)])[:-2],                      # truncated samples
+    raw_batch([(1, 2, 3, 4)], sample_rate=0),            # no sample rate
+    b"EW\x02" + raw_batch([(1, 2, 3, 4)])[3:],           # unknown version
+])
+def test_decode_raw_batch_rejects_malformed_batches(payload):
+    with pytest.raises(ValueError):
+        app.decode_raw_batch(payload)
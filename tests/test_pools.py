@@ -0,0 +1,168 @@
+import threading
+
+import pytest
+
+import app
+
+
+def in_other_thread(function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def config_value(key):
+    with app.get_db_connection() as conn:
+        row = conn.execute("SELECT value FROM config WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def test_sqlite_pool_reuses_the_thread_connection(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=4)
+    with pool.checkout() as first:
+        pass
+    with pool.checkout() as second:
+        assert second.conn is first.conn
+    other = in_other_thread(lambda: pool.checkout().conn)
+    assert other is not first.conn
+    assert pool.stats()["checkouts"] == 3
+
+
+def test_sqlite_pool_rolls_back_an_unfinished_transaction(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=4)
+    with pool.checkout() as conn:
+        conn.execute("INSERT INTO config (key, value) VALUES ('pool_rollback', '1')")
+        assert conn.conn.in_transaction
+    with pool.checkout() as conn:
+        assert not conn.conn.in_transaction
+    assert config_value("pool_rollback") is None
+
+
+def test_sqlite_pool_nested_checkout_keeps_the_outer_transaction(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=4)
+    with pool.checkout() as outer:
+        outer.execute("INSERT INTO config (key, value) VALUES ('pool_nested', '1')")
+        with pool.checkout() as inner:
+            inner.execute("SELECT 1")
+        assert outer.conn.in_transaction
+        outer.commit()
+    assert config_value("pool_nested") == "1"
+
+
+def test_sqlite_pool_overflow_connection_is_closed_on_release(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=1)
+    with pool.checkout():
+        # The cap is taken by this thread, so another live thread gets a one-off connection
+        ready, done = threading.Event(), threading.Event()
+
+        def hold():
+            conn = pool.checkout()
+            ready.set()
+            done.wait(2)
+            conn.__exit__(None, None, None)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        assert ready.wait(2)
+        assert pool.stats()["overflow"] == 1
+        done.set()
+        thread.join()
+    assert pool.stats()["in_use"] == 0
+
+
+def test_sqlite_pool_replaces_connections_of_exited_threads(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=1)
+    in_other_thread(lambda: pool.checkout().__exit__(None, None, None))
+    with pool.checkout():
+        assert pool.stats()["overflow"] == 0
+    assert len(pool._conns) == 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, query):
+        self.conn.queries.append(query)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeThreadedPool:
+    def __init__(self, minconn, maxconn, dsn):
+        self._pool = []
+        self.opened = 0
+
+    def getconn(self):
+        if self._pool:
+            return self._pool.pop()
+        self.opened += 1
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        if close:
+            conn.close()
+        else:
+            self._pool.append(conn)
+
+
+@pytest.fixture
+def postgres_pool(monkeypatch):
+    psycopg2 = pytest.importorskip("psycopg2")
+    import psycopg2.pool
+    monkeypatch.setattr(psycopg2.pool, "ThreadedConnectionPool", FakeThreadedPool)
+    monkeypatch.setattr(app, "psycopg2", psycopg2, raising=False)
+    return app.PostgresPool("postgresql://test", 1, 2, timeout=0.1, healthcheck_idle=30)
+
+
+def test_postgres_pool_reuses_and_rolls_back_connections(postgres_pool):
+    with postgres_pool.checkout() as first:
+        pass
+    with postgres_pool.checkout() as second:
+        assert second.conn is first.conn
+    assert postgres_pool._pool.opened == 1
+    # Only a connection idle for longer than healthcheck_idle is checked again
+    assert first.conn.queries == ["SELECT 1"]
+    # The health check and every release end whatever transaction was left open
+    assert first.conn.rollbacks == 3
+    assert postgres_pool.stats()["in_use"] == 0
+
+
+def test_postgres_pool_discards_closed_connections(postgres_pool):
+    with postgres_pool.checkout() as conn:
+        conn.conn.close()
+    assert postgres_pool.stats()["discarded"] == 1
+    assert postgres_pool._last_used == {}
+    with postgres_pool.checkout() as replacement:
+        assert replacement.conn is not conn.conn
+
+
+def test_postgres_pool_checkout_times_out_when_every_slot_is_taken(postgres_pool):
+    held = [postgres_pool.checkout(), postgres_pool.checkout()]
+    with pytest.raises(RuntimeError):
+        postgres_pool.checkout()
+    assert postgres_pool.stats()["timeouts"] == 1
+    for conn in held:
+        conn.__exit__(None, None, None)
@@ -0,0 +1,29 @@
+import pytest
+
+import app
+
+
+class StubRoleSync:
+    """Stands in for role_sync so a test request does not start the tailing thread."""
+    def __init__(self):
+        self.running = False
+        self.synced = False
+
+    def sync_rounds(self):
+        self.synced = True
+
+    def start(self):
+        self.running = True
+
+
+def test_web_worker_detects_the_name_search_index(database, monkeypatch):
+    # init_db ran in the ingest process; a gunicorn web worker only imports the module
+    if app.NAME_SEARCH is None:
+        pytest.skip("SQLite here has no FTS5 trigram tokenizer")
+    monkeypatch.setattr(app, "NAME_SEARCH", None)
+    monkeypatch.setattr(app, "APP_ROLE", "web")
+    monkeypatch.setattr(app, "role_sync", StubRoleSync())
+
+    assert app.app.test_client().get("/").status_code == 200
+    assert app.NAME_SEARCH == "fts5"
+    assert app.role_sync.synced and app.role_sync.running
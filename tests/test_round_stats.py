@@ -0,0 +1,23 @@
+import app
+
+# Reed hits where the ignored first position read the strongest force
+HITS = [
+    (150, 0, 0, 0),
+    ((390, 210, 0, 0), 1),
+    ((300, 0, 0, 140), 1),
+    (0, 250, 0, 0),
+    (0, 0, 350, 120),
+]
+
+
+def test_stats_and_round_summary_agree_per_position(make_round):
+    round_id = make_round(HITS)
+    stats = app.app.test_client().get(f"/history/{round_id}/stats").get_json()
+    with app.get_db_connection() as conn:
+        summary = conn.execute("SELECT * FROM round_summary WHERE round_id = ?", (round_id,)).fetchone()
+
+    hits = [position["hits"] for position in stats["positions"]]
+    assert hits == [summary[f"pos{i}_hits"] for i in range(1, app.SUMMARY_POSITIONS + 1)]
+    assert hits == [1, 2, 1, 1]
+    peaks = [position.get("peak", 0) for position in stats["positions"]]
+    assert peaks == [summary[f"pos{i}_max"] for i in range(1, app.SUMMARY_POSITIONS + 1)]
@@ -0,0 +1,51 @@
+import app
+
+# Every position, every level, and a reed hit whose strongest channel is the ignored first position
+HITS = [
+    (150, 0, 0, 0),
+    (0, 250, 0, 0),
+    (0, 0, 350, 120),
+    (0, 0, 0, 180),
+    ((390, 210, 0, 0), 1),
+    (120, 0, 0, 0),
+    (0, 0, 0, 399),
+]
+SUMMARY_COLUMNS = app.SUMMARY_COUNTER_COLUMNS + app.SUMMARY_MAX_COLUMNS + ("first_hit", "last_hit")
+
+
+def summary(round_id):
+    with app.get_db_connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM round_summary WHERE round_id = ?",
+                           (round_id,)).fetchone()
+    return dict(zip(SUMMARY_COLUMNS, row))
+
+
+def rebuild(round_id):
+    result = app.app.test_cli_runner().invoke(args=["rebuild-round-summaries", "--round-id", str(round_id)])
+    assert result.exit_code == 0, result.output
+
+
+def test_writer_deltas_match_a_rebuild_from_sensor_history(make_round, monkeypatch):
+    # Split the hits over several transactions so later batches are added onto an existing row
+    write = app.SensorHistoryWriter._write
+    monkeypatch.setattr(app.SensorHistoryWriter, "_write",
+                        lambda self, batch, notices=(): [write(self, batch[i:i + 3]) for i in range(0, len(batch), 3)])
+    round_id = make_round(HITS)
+    written = summary(round_id)
+    assert written["hit_count"] == len(HITS)
+    assert written["force_max"] == 399
+    assert (written["pos1_hits"], written["pos2_hits"], written["pos3_hits"], written["pos4_hits"]) == (2, 2, 1, 2)
+    assert (written["first_hit"], written["last_hit"]) == ("2025-01-05 10:00:00", "2025-01-05 10:00:06")
+
+    rebuild(round_id)
+    assert summary(round_id) == written
+
+
+def test_rebuild_of_a_round_without_hits_is_empty_and_final(make_round):
+    round_id = make_round([])
+    rebuild(round_id)
+    assert summary(round_id)["hit_count"] == 0
+    with app.get_db_connection() as conn:
+        row = conn.execute("SELECT finalized, duration_seconds FROM round_summary WHERE round_id = ?",
+                           (round_id,)).fetchone()
+    assert (row["finalized"], row["duration_seconds"]) == (1, 300)
@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import app
+
+
+class Expired:
+    def __init__(self):
+        self.rounds = []
+        self.times = []
+        self.fired = threading.Condition()
+
+    def __call__(self, round_id):
+        with self.fired:
+            self.rounds.append(round_id)
+            self.times.append(datetime.now())
+            self.fired.notify_all()
+
+    def wait_for(self, count, timeout=2.0):
+        with self.fired:
+            self.fired.wait_for(lambda: len(self.rounds) >= count, timeout)
+        return self.rounds
+
+
+def scheduler():
+    timers = app.RoundTimerScheduler()
+    timers.on_expire = Expired()
+    return timers
+
+
+def in_seconds(seconds):
+    return datetime.now() + timedelta(seconds=seconds)
+
+
+def test_round_expires_once_at_its_deadline():
+    timers = scheduler()
+    deadline = in_seconds(0.15)
+    timers.schedule(1, deadline)
+    assert timers.on_expire.wait_for(1) == [1]
+    assert timers.on_expire.times[0] >= deadline
+    time.sleep(0.2)
+    assert timers.on_expire.rounds == [1]
+    assert timers.stats() == {'scheduled': 0, 'fired': 1}
+
+
+def test_cancelled_round_does_not_expire():
+    timers = scheduler()
+    timers.schedule(1, in_seconds(0.1))
+    timers.schedule(2, in_seconds(0.2))
+    timers.cancel(1)
+    assert timers.on_expire.wait_for(1) == [2]
+    time.sleep(0.1)
+    assert timers.on_expire.rounds == [2]
+
+
+def test_rescheduled_round_expires_at_the_new_deadline_only():
+    timers = scheduler()
+    timers.schedule(1, in_seconds(0.1))
+    later = in_seconds(0.3)
+    timers.schedule(1, later)
+    assert timers.on_expire.wait_for(1) == [1]
+    assert timers.on_expire.times[0] >= later
+    time.sleep(0.1)
+    assert timers.on_expire.rounds == [1]
+
+
+def test_earlier_deadline_wakes_the_scheduler():
+    timers = scheduler()
+    timers.schedule(1, in_seconds(30))
+    time.sleep(0.05)    # the thread is now sleeping towards the 30 s deadline
+    timers.schedule(2, in_seconds(0.05))
+    assert timers.on_expire.wait_for(1) == [2]
+    assert timers.stats()['scheduled'] == 1
+
+
+def test_deadlines_fire_in_order():
+    timers = scheduler()
+    for round_id, seconds in ((3, 0.15), (1, 0.05), (2, 0.1)):
+        timers.schedule(round_id, in_seconds(seconds))
+    assert timers.on_expire.wait_for(3) == [1, 2, 3]
+
+
+def test_failing_callback_does_not_stop_the_scheduler():
+    timers = scheduler()
+    expired = timers.on_expire
+
+    def on_expire(round_id):
+        expired(round_id)
+        if round_id == 1:
+            raise RuntimeError("boom")
+
+    timers.on_expire = on_expire
+    timers.schedule(1, in_seconds(0.02))
+    timers.schedule(2, in_seconds(0.05))
+    assert expired.wait_for(2) == [1, 2]
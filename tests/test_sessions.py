@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+
+import pytest
+
+import app
+
+RECORD_FORM = {'training_name': 'test', 'recorder_name': 'tester', 'timer_duration': '0',
+               'sensor_label1': '0', 'sensor_label2': '1', 'sensor_label3': '3', 'sensor_label4': '4'}
+
+
+def record(sensor_id):
+    return app.app.test_client().post('/record', data=dict(RECORD_FORM, sensor_id=sensor_id))
+
+
+def active_rounds(sensor_id):
+    with app.get_db_connection() as conn:
+        cur = conn.execute("SELECT COUNT(*) AS n FROM training_round WHERE active = 1 AND sensor_id = ?", (sensor_id,))
+        return cur.fetchone()['n']
+
+
+def counter(outcome):
+    return app.metrics.counters.get(('messages_total', (('outcome', outcome),)), 0)
+
+
+def test_start_refuses_a_sensor_that_is_recording():
+    registry = app.SessionRegistry()
+    assert registry.start(app.ActiveRound(1, 'S1', ['0', '1', '3', '4']))
+    assert not registry.start(app.ActiveRound(2, 'S1', ['0', '1', '3', '4']))
+    # A fused round is refused if any of its sensors is busy
+    fused = app.ActiveRound(3, 'S2,S1', [], sensor_maps={'S2': ['0'], 'S1': ['0']})
+    assert not registry.start(fused)
+    assert registry.for_sensor('S2') is None
+    assert [r.round_id for r in registry.rounds()] == [1]
+
+
+def test_reserve_refuses_busy_and_claimed_sensors():
+    registry = app.SessionRegistry()
+    registry.start(app.ActiveRound(1, 'S1', ['0', '1', '3', '4']))
+    assert registry.reserve(['S1']) == 'S1'
+    assert registry.reserve(['S2', 'S3']) is None
+    assert registry.reserve(['S4', 'S3']) == 'S3'
+    # A refused reservation claims nothing
+    assert registry.reserve(['S4']) is None
+    registry.unreserve(['S2', 'S3'])
+    assert registry.reserve(['S2']) is None
+
+
+def test_begin_stop_hands_the_round_to_one_caller():
+    registry = app.SessionRegistry()
+    active_round = app.ActiveRound(1, 'S1', ['0', '1', '3', '4'])
+    registry.start(active_round)
+    assert registry.begin_stop(1) is active_round
+    assert registry.begin_stop(1) is None
+    # A stopping round still takes its hits until it is unregistered
+    assert registry.for_sensor('S1') is active_round
+    registry.stop(1)
+    assert registry.for_sensor('S1') is None
+    assert registry.begin_stop(1) is None
+
+
+def test_concurrent_record_requests_start_one_round(database, monkeypatch):
+    both_checked = threading.Barrier(2, timeout=1)
+    sensor_recording = app.sensor_recording
+
+    def checked_together(sensor_ids):
+        # Both requests pass the "is this sensor free" check before either inserts its round
+        try:
+            both_checked.wait()
+        except threading.BrokenBarrierError:
+            pass
+        return sensor_recording(sensor_ids)
+
+    monkeypatch.setattr(app, 'sensor_recording', checked_together)
+    threads = [threading.Thread(target=record, args=('SESSION-RACE',)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert active_rounds('SESSION-RACE') == 1
+    assert app.sessions._reserved == set()
+    app.stop_training(app.sessions.for_sensor('SESSION-RACE').round_id)
+
+
+def test_record_returns_409_when_the_round_cannot_be_registered(database, monkeypatch):
+    # Another process's round shows up between the check and the registration
+    other = app.ActiveRound(-1, 'SESSION-CONFLICT', ['0', '1', '3', '4'])
+    monkeypatch.setattr(app, 'sensor_recording', lambda sensor_ids: app.sessions.start(other) and None)
+    response = record('SESSION-CONFLICT')
+    assert response.status_code == 409
+    assert active_rounds('SESSION-CONFLICT') == 0
+    app.sessions.stop(-1)
+
+
+def test_stop_records_hits_still_queued_for_the_round(database, monkeypatch):
+    record('SESSION-DRAIN')
+    round_id = app.sessions.for_sensor('SESSION-DRAIN').round_id
+    gate = threading.Event()
+    decode_payload = app.decode_payload
+
+    def held_decode(raw_payload):
+        gate.wait(2)
+        return decode_payload(raw_payload)
+
+    monkeypatch.setattr(app, 'decode_payload', held_decode)
+    payload = json.dumps({"reed": 0, "forces": {"A0": 150, "A1": 0, "A3": 0, "A4": 0}}).encode()
+    for _ in range(20):
+        app.ingest_pipeline.submit('espboxing/sensors/SESSION-DRAIN', payload, time.time())
+    no_round = counter('no_round')
+
+    stopping = threading.Thread(target=app.stop_training, args=(round_id,))
+    stopping.start()
+    time.sleep(0.1)
+    assert app.sessions.get(round_id).stopping
+    gate.set()
+    stopping.join(5)
+
+    assert app.sessions.get(round_id) is None
+    assert counter('no_round') == no_round
+    with app.get_db_connection() as conn:
+        cur = conn.execute("SELECT COUNT(*) AS n FROM sensor_history WHERE training_round_id = ?", (round_id,))
+        assert cur.fetchone()['n'] == 20
+    assert active_rounds('SESSION-DRAIN') == 0
+
+
+@pytest.mark.parametrize('sensor_id', ['', ' , '])
+def test_record_without_a_sensor_starts_nothing(database, sensor_id):
+    rounds = len(app.sessions)
+    assert record(sensor_id).status_code == 302
+    assert len(app.sessions) == rounds
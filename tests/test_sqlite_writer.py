@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def pool(database):
+    return app.SQLitePool(app.DATABASE, maxconn=4)
+
+
+def write_lock_held(pool):
+    return pool.write_lock._lock.locked()
+
+
+def test_write_transactions_begin_immediate(pool):
+    with pool.checkout() as conn:
+        statements = []
+        conn.conn.set_trace_callback(statements.append)
+        conn.execute("SELECT COUNT(*) FROM config").fetchone()
+        assert not conn.conn.in_transaction
+        conn.execute("INSERT INTO config (key, value) VALUES ('lock_begin', '1')")
+        conn.commit()
+    assert "BEGIN IMMEDIATE" in [statement.strip().upper() for statement in statements]
+
+
+def test_write_lock_is_released_on_commit(pool):
+    with pool.checkout() as conn:
+        conn.execute("INSERT INTO config (key, value) VALUES ('lock_commit', '1')")
+        assert write_lock_held(pool)
+        conn.commit()
+        assert not write_lock_held(pool)
+    assert pool.stats()["write_transactions"] == 1
+
+
+def test_write_lock_is_released_when_the_pool_rolls_back(pool):
+    with pool.checkout() as conn:
+        conn.execute("INSERT INTO config (key, value) VALUES ('lock_rollback', '1')")
+        with pool.checkout() as nested:
+            nested.execute("SELECT 1")
+        # Only the outermost release may end the transaction
+        assert write_lock_held(pool)
+    assert not write_lock_held(pool)
+
+
+def test_writers_in_other_threads_wait_for_the_lock(pool):
+    order = []
+    with pool.checkout() as conn:
+        conn.execute("INSERT INTO config (key, value) VALUES ('lock_wait_1', '1')")
+
+        def other_writer():
+            with pool.checkout() as other:
+                other.execute("INSERT INTO config (key, value) VALUES ('lock_wait_2', '1')")
+                order.append("other")
+                other.commit()
+
+        thread = threading.Thread(target=other_writer)
+        thread.start()
+        time.sleep(0.1)
+        # Queued on the lock rather than on SQLite's busy timeout
+        assert thread.is_alive() and pool.write_lock.acquired == 1
+        order.append("first")
+        conn.commit()
+    thread.join(2)
+    assert order == ["first", "other"]
+    assert pool.stats()["write_transactions"] == 2
+
+
+def test_write_lock_belongs_to_the_connection_that_took_it(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=0)   # every checkout is a one-off connection
+    with pool.checkout() as outer:
+        outer.execute("INSERT INTO config (key, value) VALUES ('lock_owner', '1')")
+        with pool.checkout() as inner:
+            inner.execute("SELECT 1")
+        # Closing another connection of the same thread leaves the lock with `outer`
+        assert pool.write_lock._owner is outer.conn
+        assert write_lock_held(pool)
+        outer.commit()
+    assert not write_lock_held(pool)
+
+
+def test_write_lock_of_an_exited_thread_is_released_with_its_connection(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=1)
+
+    def leave_transaction_open():
+        pool.checkout().execute("INSERT INTO config (key, value) VALUES ('lock_exited', '1')")
+
+    thread = threading.Thread(target=leave_transaction_open)
+    thread.start()
+    thread.join()
+    assert write_lock_held(pool)
+    with pool.checkout() as conn:
+        conn.execute("UPDATE config SET value = '2' WHERE key = 'lock_exited'")
+        conn.commit()
+    assert not write_lock_held(pool)
+
+
+def test_connections_get_the_configured_pragmas(pool):
+    with pool.checkout() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == app.SQLITE_JOURNAL_MODE
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == app.SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_readonly_pool_refuses_writes(database):
+    pool = app.SQLitePool(app.DATABASE, maxconn=2, readonly=True)
+    assert pool.write_lock is None
+    with pool.checkout() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO config (key, value) VALUES ('lock_readonly', '1')")
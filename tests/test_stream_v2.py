@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+import pytest
+
+import app
+
+HITS = [(150, 0, 0, 0), (0, 250, 0, 0), (0, 0, 350, 120)]
+
+
+def parse_frame(frame):
+    fields = {}
+    for line in frame.strip().splitlines():
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    return fields
+
+
+def row_ids(frame):
+    fields = parse_frame(frame)
+    assert fields["event"] == "hits"
+    return [row[0] for row in json.loads(fields["data"])["rows"]]
+
+
+def history_ids(round_id):
+    with app.get_db_connection() as conn:
+        cur = conn.execute("SELECT id FROM sensor_history WHERE training_round_id = ? ORDER BY id", (round_id,))
+        return [row["id"] for row in cur.fetchall()]
+
+
+@pytest.fixture
+def live_round(make_round):
+    """A round registered as recording, so the stream follows it."""
+    rounds = []
+
+    def live_round(hits=()):
+        round_id = make_round(list(hits))
+        app.sessions.start(app.ActiveRound(round_id, f"STREAM-{round_id}", ["0", "1", "3", "4"]))
+        rounds.append(round_id)
+        return round_id
+
+    yield live_round
+    for round_id in rounds:
+        app.sessions.stop(round_id)
+
+
+def publish(round_id, first_id, count):
+    """Publish `count` hits for `round_id` the way the history writer does after a commit."""
+    ids = list(range(first_id, first_id + count))
+    rows = [("2025-01-05 10:00:00", 0, "hit", 150, 0, 0, 0, 150, 1, round_id) for _ in ids]
+    app.publish_history_rows(ids, rows)
+
+
+def test_hits_within_the_window_share_one_frame(live_round, monkeypatch):
+    monkeypatch.setattr(app, "STREAM_COALESCE_MS", 300)
+    round_id = live_round()
+    other_round = live_round()
+    stream = app.event_stream_v2(round_id, None, heartbeat=5)
+    try:
+        assert parse_frame(next(stream))["event"] == "meta"
+        publish(round_id, 1, 1)
+        later = threading.Timer(0.05, lambda: (publish(other_round, 2, 1), publish(round_id, 3, 2)))
+        later.start()
+        started = time.monotonic()
+        frame = next(stream)
+        # The rows that followed the first within the window came in the same frame; the other round's did not
+        assert row_ids(frame) == [1, 3, 4]
+        assert parse_frame(frame)["id"] == "4"
+        assert time.monotonic() - started >= 0.25
+        later.join()
+    finally:
+        stream.close()
+
+
+def test_resume_replays_hits_after_the_last_event_id(live_round):
+    round_id = live_round(HITS)
+    ids = history_ids(round_id)
+    response = app.app.test_client().get(f"/stream?v=2&round_id={round_id}", headers={"Last-Event-ID": str(ids[0])})
+    frames = iter(response.response)
+    try:
+        meta = json.loads(parse_frame(next(frames).decode().split("\n", 1)[1])["data"])
+        assert [r["round_id"] for r in meta["rounds"]] == [round_id]
+        assert [r["force_layout"] for r in meta["rounds"]] == ["channel"]
+        frame = next(frames).decode()
+        assert row_ids(frame) == ids[1:]
+        assert parse_frame(frame)["id"] == str(ids[-1])
+    finally:
+        response.close()
+
+
+def test_resume_skips_live_hits_already_replayed(live_round, monkeypatch):
+    monkeypatch.setattr(app, "STREAM_COALESCE_MS", 10)
+    round_id = live_round(HITS)
+    ids = history_ids(round_id)
+    stream = app.event_stream_v2(round_id, ids[0], heartbeat=5)
+    try:
+        next(stream)
+        assert row_ids(next(stream)) == ids[1:]
+        # A live copy of a replayed row is not sent again
+        publish(round_id, ids[-1], 2)
+        assert row_ids(next(stream)) == [ids[-1] + 1]
+    finally:
+        stream.close()
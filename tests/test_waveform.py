@@ -0,0 +1,82 @@
+import numpy as np
+
+import analytics
+
+
+def samples(rows):
+    return np.array(rows, dtype="<i2").reshape(-1, 4)
+
+
+def test_minmax_downsample_full_buckets():
+    data = samples([(1, 0, 0, 0), (5, -3, 0, 0), (2, 0, 9, 0), (-4, 0, 0, 7)])
+    mins, maxs = analytics.minmax_downsample(data, 2)
+    assert mins.tolist() == [[1, -3, 0, 0], [-4, 0, 0, 0]]
+    assert maxs.tolist() == [[5, 0, 0, 0], [2, 0, 9, 7]]
+
+
+def test_minmax_downsample_keeps_a_partial_tail():
+    data = samples([(1, 0, 0, 0), (2, 0, 0, 0), (3, 0, 0, 0), (8, 0, 0, 0), (-1, 0, 0, 0)])
+    mins, maxs = analytics.minmax_downsample(data, 3)
+    assert mins[:, 0].tolist() == [1, -1]
+    assert maxs[:, 0].tolist() == [3, 8]
+
+
+def test_minmax_downsample_keeps_a_single_sample_spike():
+    data = np.zeros((1000, 4), dtype="<i2")
+    data[637, 2] = 900
+    mins, maxs = analytics.minmax_downsample(data, 100)
+    assert maxs.shape == (10, 4)
+    assert maxs[6, 2] == 900
+    assert maxs[:, 2].sum() == 900
+
+
+def test_minmax_downsample_edge_cases():
+    mins, maxs = analytics.minmax_downsample(np.zeros((0, 4), dtype="<i2"), 10)
+    assert mins.shape == maxs.shape == (0, 4)
+    # A bucket below 1 means no reduction
+    data = samples([(1, 2, 3, 4), (5, 6, 7, 8)])
+    mins, maxs = analytics.minmax_downsample(data, 0)
+    assert mins.tolist() == maxs.tolist() == data.tolist()
+
+
+def test_minmax_downsample_memmap(tmp_path):
+    path = tmp_path / "round.bin"
+    samples([(i, -i, 0, 0) for i in range(10)]).tofile(path)
+    mins, maxs = analytics.minmax_downsample(analytics.load_waveform(str(path), 4), 4)
+    assert maxs[:, 0].tolist() == [3, 7, 9]
+    assert mins[:, 1].tolist() == [-3, -7, -9]
+
+
+def test_peak_detector_reports_the_highest_sample_of_a_hit():
+    detector = analytics.PeakDetector((0, 1, 2, 3), threshold=100)
+    hits = detector.feed(samples([(0, 0, 0, 0), (120, 0, 0, 0), (0, 300, 0, 0), (0, 200, 0, 0), (10, 0, 0, 0)]))
+    assert hits == [(2, (0, 300, 0, 0))]
+
+
+def test_peak_detector_threshold_and_release_hysteresis():
+    detector = analytics.PeakDetector((0, 1, 2, 3), threshold=100)
+    assert detector.feed(samples([(99, 0, 0, 0)])) == []
+    # Still in the hit while the envelope stays at or above half the threshold
+    assert detector.feed(samples([(100, 0, 0, 0), (50, 0, 0, 0), (180, 0, 0, 0)])) == []
+    assert detector.feed(samples([(49, 0, 0, 0)])) == [(3, (180, 0, 0, 0))]
+
+
+def test_peak_detector_carries_a_hit_across_batches():
+    detector = analytics.PeakDetector((0, 1, 2, 3), threshold=100)
+    assert detector.feed(samples([(0, 0, 0, 0), (150, 0, 0, 0)])) == []
+    assert detector.feed(samples([(0, 0, 400, 0), (0, 0, 0, 0), (0, 0, 0, 0)])) == [(2, (0, 0, 400, 0))]
+    assert detector.feed(samples([(0, 0, 0, 200), (0, 0, 0, 0)])) == [(5, (0, 0, 0, 200))]
+    assert detector.position == 7
+
+
+def test_peak_detector_only_reads_mapped_positions():
+    # Position 2 is unmapped, position 3 reads channel index 0
+    detector = analytics.PeakDetector((1, None, 0), threshold=100)
+    assert detector.feed(samples([(0, 0, 500, 0), (0, 0, 0, 0)])) == []
+    assert detector.feed(samples([(300, 0, 0, 0), (0, 0, 0, 0)])) == [(2, (300, 0, 0, 0))]
+
+
+def test_peak_detector_ignores_the_first_position_while_the_reed_is_set():
+    detector = analytics.PeakDetector((0, 1, 2, 3), threshold=100)
+    assert detector.feed(samples([(500, 0, 0, 0), (0, 0, 0, 0)]), reed=1) == []
+    assert detector.feed(samples([(500, 0, 0, 0), (0, 0, 0, 0)]), reed=0) == [(2, (500, 0, 0, 0))]